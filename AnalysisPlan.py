@@ -0,0 +1,37 @@
+"""AnalysisPlan: everything about a reference that the parse functions need but that does not depend on the sample.
+
+A plan holds the category key a file mapped against the reference is counted under, the CDS that decided it, the
+position after which mutations are ignored and the FeatureIndex used to find the feature containing each mutation. The
+parse functions build one plan per reference, categorization and CategoryConfig and keep it on the Reference object,
+so every later file that points at the same reference reuses it.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+class AnalysisPlan(object):
+
+    __slots__ = ('category', 'cds', 'cutoff', 'feature_index')
+
+    """__init__: cds is the categorizing CDS feature (None if there is none); cutoff is None when nothing is cut off."""
+    def __init__(self, category, cds, cutoff, feature_index):
+        self.category = category
+        self.cds = cds
+        self.cutoff = cutoff
+        self.feature_index = feature_index
+        return
+
+    def __repr__(self):
+        return ("AnalysisPlan(" + repr(self.category) + ", " + repr(self.cutoff) + ")")
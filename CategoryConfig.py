@@ -0,0 +1,74 @@
+"""CategoryConfig: the lists of CDS labels that define the sample categories.
+
+A sample is categorized by the first top-strand CDS of its reference whose label is in one of the lists. The default
+lists are the iGEM Spring 2015 fluorescent protein CDSs; other lists can be loaded from a JSON file that maps each
+category to its CDS labels, in order:
+
+    {
+        "CFP": ["BBa_E0020"],
+        "YFP": ["BBa_E0030", "BBa_K592101", "BBa_K864100"],
+        "BFP": ["BBa_K592100"]
+    }
+
+Labels are matched case-insensitively.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+from collections import OrderedDict
+import hashlib
+import json
+
+# iGEM Spring 2015 CDS list
+DEFAULT_CATEGORY_GENES = (
+    ("CFP", ("bba_e0020",)),
+    ("YFP", ("bba_e0030", "bba_k592101", "bba_k864100")),
+    ("BFP", ("bba_k592100",)),
+)
+
+
+class CategoryConfig(object):
+
+    """__init__: groups is a sequence of (category, CDS labels) pairs."""
+    def __init__(self, groups=DEFAULT_CATEGORY_GENES):
+        self.groups = [(category, tuple([label.lower() for label in labels])) for category, labels in groups]
+        # CDS label -> category, and all labels in list order
+        self.gene_map = dict()
+        cds_labels = []
+        for category, labels in self.groups:
+            for label in labels:
+                self.gene_map[label] = category
+                cds_labels.append(label)
+        self.cds_labels = tuple(cds_labels)
+        self.key = hashlib.sha1(json.dumps(self.groups)).hexdigest()
+        return
+
+    def get_categories(self):
+        return [category for category, labels in self.groups]
+
+    def __repr__(self):
+        return "CategoryConfig(" + repr(self.groups) + ")"
+
+
+"""load_category_config(): read a CategoryConfig from a JSON file of category -> list of CDS labels."""
+def load_category_config(path):
+    with open(path, "r") as handle:
+        groups = json.load(handle, object_pairs_hook=OrderedDict)
+    if not isinstance(groups, dict):
+        raise ValueError(path + ": expected an object mapping categories to lists of CDS labels")
+    return CategoryConfig([(str(category), [str(label) for label in labels]) for category, labels in groups.items()])
+
+
+default_category_config = CategoryConfig()
@@ -0,0 +1,247 @@
+"""CohortQuery: fast, memoized questions about the maps of a parsed cohort.
+
+A CohortQuery wraps a cat_map (category -> GenomeDiffSequenceMap). The first question about a category turns its count
+matrix into a CountIndex: a NumPy label x type matrix with its marginal totals and the labels sorted by total, so top-k
+questions are answered by slicing. Questions about the whole cohort (category None) use an index of all categories
+added together. Every answer is kept until one of the maps it depends on changes: each GenomeDiffSequenceMap carries a
+version that every update and merge increments, and the cache compares the maps and their versions before reusing an
+index or an answer. Replacing, adding or removing a category in cat_map is noticed the same way.
+
+Ties in top-k lists go to the label the map saw first.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import numpy as np
+
+GROUPINGS = ("type", "feature_type", "category")
+
+
+class CountIndex(object):
+
+    """__init__: index a labels x types count matrix; label_types maps labels to their feature type."""
+    def __init__(self, labels, types, matrix, label_types):
+        self.labels = labels
+        self.types = types
+        self.matrix = matrix
+        self.label_types = label_types
+        self.label_totals = matrix.sum(axis=1)
+        self.type_totals = matrix.sum(axis=0)
+        self.total = int(self.type_totals.sum())
+        # Stable sort, so ties keep the first-seen order
+        self.order = np.argsort(-self.label_totals, kind='mergesort')
+        self.type_orders = dict()
+        self.label_ids = None
+        return
+
+    def get_label_id(self, label):
+        if self.label_ids is None:
+            self.label_ids = dict([(known, label_id) for label_id, known in enumerate(self.labels)])
+        return self.label_ids.get(label)
+
+    def top(self, k, _type=None):
+        """Return the k labels with the most mutations (of type _type, if given) as (label, count) pairs."""
+        if _type is None:
+            order = self.order
+            totals = self.label_totals
+        else:
+            if _type not in self.types:
+                return []
+            type_id = self.types.index(_type)
+            totals = self.matrix[:, type_id]
+            order = self.type_orders.get(_type)
+            if order is None:
+                order = self.type_orders[_type] = np.argsort(-totals, kind='mergesort')
+        top = []
+        for label_id in order[:k]:
+            count = int(totals[label_id])
+            if not count:
+                break
+            top.append((self.labels[label_id], count))
+        return top
+
+
+"""index_map(): build the CountIndex of one GenomeDiffSequenceMap."""
+def index_map(mutation_map):
+    labels = list(mutation_map.feats)
+    types = list(mutation_map.types)
+    if labels and types:
+        flat = np.frombuffer(mutation_map.counts, dtype=np.dtype(mutation_map.counts.typecode)).astype(np.int64)
+        matrix = flat.reshape(len(labels), mutation_map.type_capacity)[:, :len(types)]
+    else:
+        matrix = np.zeros((len(labels), len(types)), dtype=np.int64)
+    return CountIndex(labels, types, matrix, dict(mutation_map.label_type_map))
+
+
+"""merge_indexes(): add CountIndexes together; labels and types keep the order in which they are first met."""
+def merge_indexes(indexes):
+    label_ids = dict()
+    labels = []
+    type_ids = dict()
+    types = []
+    label_types = dict()
+    placements = []
+    for index in indexes:
+        label_map = []
+        for label in index.labels:
+            if label not in label_ids:
+                label_ids[label] = len(labels)
+                labels.append(label)
+            label_map.append(label_ids[label])
+        type_map = []
+        for _type in index.types:
+            if _type not in type_ids:
+                type_ids[_type] = len(types)
+                types.append(_type)
+            type_map.append(type_ids[_type])
+        for label in index.label_types:
+            label_types.setdefault(label, index.label_types[label])
+        placements.append((np.array(label_map, dtype=np.int64), np.array(type_map, dtype=np.int64)))
+    matrix = np.zeros((len(labels), len(types)), dtype=np.int64)
+    for index, (label_map, type_map) in zip(indexes, placements):
+        if len(label_map) and len(type_map):
+            # Labels and types are unique within an index, so the fancy-indexed += does not drop repeats
+            matrix[np.ix_(label_map, type_map)] += index.matrix
+    return CountIndex(labels, types, matrix, label_types)
+
+
+class CohortQuery(object):
+
+    """__init__: answer questions about cat_map (category -> GenomeDiffSequenceMap); the maps may keep changing."""
+    def __init__(self, cat_map):
+        self.cat_map = cat_map
+        # Category (None for the whole cohort) -> (state, CountIndex)
+        self.indexes = dict()
+        # (question, arguments) -> (state, answer)
+        self.answers = dict()
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def get_state(self, category=None):
+        """Return what the answers about category depend on: the maps themselves and their versions."""
+        if category is None:
+            return tuple([(key, self.cat_map[key], self.cat_map[key].version) for key in sorted(self.cat_map)])
+        mutation_map = self.cat_map[category]
+        return (mutation_map, mutation_map.version)
+
+    def get_index(self, category=None):
+        """Return the up-to-date CountIndex of category, or of the whole cohort when category is None."""
+        state = self.get_state(category)
+        cached = self.indexes.get(category)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+        if category is None:
+            index = merge_indexes([self.get_index(key) for key in sorted(self.cat_map)])
+        else:
+            index = index_map(self.cat_map[category])
+        self.indexes[category] = (state, index)
+        return index
+
+    def memoize(self, key, categories, compute):
+        """Return the cached answer for key unless one of categories changed since; compute it otherwise."""
+        state = tuple([self.get_state(category) for category in categories])
+        cached = self.answers.get(key)
+        if cached is not None and cached[0] == state:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        answer = compute()
+        self.answers[key] = (state, answer)
+        return answer
+
+    def top_labels(self, k=10, category=None, _type=None):
+        """Return the k labels with the most mutations (of type _type, if given) as (label, count) pairs."""
+        return self.memoize(("top_labels", k, category, _type), (category,),
+                            lambda: self.get_index(category).top(k, _type))
+
+    def grouped_counts(self, by="type", category=None):
+        """Return the mutation counts grouped by type, feature_type or (for the whole cohort only) category."""
+        if by not in GROUPINGS:
+            raise ValueError("cannot group by " + repr(by) + "; use one of " + ", ".join(GROUPINGS))
+
+        def compute():
+            if by == "category":
+                if category is not None:
+                    raise ValueError("grouping by category needs the whole cohort (category None)")
+                return dict([(key, self.get_index(key).total) for key in self.cat_map])
+            index = self.get_index(category)
+            if by == "type":
+                return dict([(index.types[type_id], int(index.type_totals[type_id]))
+                             for type_id in xrange(len(index.types)) if index.type_totals[type_id]])
+            counts = dict()
+            for label_id in np.flatnonzero(index.label_totals):
+                feature_type = index.label_types.get(index.labels[label_id])
+                counts[feature_type] = counts.get(feature_type, 0) + int(index.label_totals[label_id])
+            return counts
+        return self.memoize(("grouped_counts", by, category), (category,), compute)
+
+    def type_fractions(self, category=None):
+        """Return the fraction of the mutations of category (or of the whole cohort) that has each type."""
+        def compute():
+            counts = self.grouped_counts("type", category)
+            total = sum(counts.values())
+            return dict([(_type, float(count) / total) for _type, count in counts.items()]) if total else dict()
+        return self.memoize(("type_fractions", category), (category,), compute)
+
+    def type_fractions_by_category(self):
+        """Return type_fractions for every category."""
+        return self.memoize(("type_fractions_by_category",), (None,),
+                            lambda: dict([(key, self.type_fractions(key)) for key in self.cat_map]))
+
+    def label_counts(self, label, category=None):
+        """Return the mutation counts of one label by type (empty if the label has no mutations)."""
+        def compute():
+            index = self.get_index(category)
+            label_id = index.get_label_id(label)
+            if label_id is None:
+                return dict()
+            row = index.matrix[label_id]
+            return dict([(index.types[type_id], int(row[type_id])) for type_id in np.flatnonzero(row)])
+        return self.memoize(("label_counts", label, category), (category,), compute)
+
+    def compare_categories(self, category_a, category_b, k=10):
+        """Compare two categories.
+
+        Returns a dict with "types", type -> (fraction in a, fraction in b, difference), and "labels", the k labels
+        whose share of their category's mutations differs most, as (label, count in a, count in b, difference in
+        share) tuples; differences are a minus b."""
+        def compute():
+            fractions_a = self.type_fractions(category_a)
+            fractions_b = self.type_fractions(category_b)
+            types = dict()
+            for _type in set(fractions_a) | set(fractions_b):
+                fraction_a = fractions_a.get(_type, 0.0)
+                fraction_b = fractions_b.get(_type, 0.0)
+                types[_type] = (fraction_a, fraction_b, fraction_a - fraction_b)
+
+            index_a = self.get_index(category_a)
+            index_b = self.get_index(category_b)
+            both = merge_indexes([index_a, index_b])
+            counts_a = np.zeros(len(both.labels), dtype=np.int64)
+            counts_b = np.zeros(len(both.labels), dtype=np.int64)
+            counts_a[:len(index_a.labels)] = index_a.label_totals
+            # Labels of b are placed where merge_indexes put them
+            for label_id, label in enumerate(index_b.labels):
+                counts_b[both.get_label_id(label)] = index_b.label_totals[label_id]
+            shares = (counts_a / float(max(index_a.total, 1))) - (counts_b / float(max(index_b.total, 1)))
+            order = np.argsort(-np.abs(shares), kind='mergesort')[:k]
+            labels = [(both.labels[label_id], int(counts_a[label_id]), int(counts_b[label_id]),
+                       float(shares[label_id])) for label_id in order if shares[label_id]]
+            return {"types": types, "labels": labels}
+        return self.memoize(("compare_categories", category_a, category_b, k), (category_a, category_b), compute)
+
+    def summary(self):
+        return "Cohort query: " + str(self.hits) + " cached answers, " + str(self.misses) + " computed."
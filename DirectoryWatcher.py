@@ -0,0 +1,186 @@
+"""DirectoryWatcher: report the .gd files that appear, change or disappear under an input tree.
+
+Both watchers have the same interface: poll(timeout) waits up to timeout seconds and returns the set of paths that may
+have been added, changed or removed since the last call, or None when the caller has to compare the whole tree against
+what it knows (the first call, a polling round, or an inotify queue overflow).
+
+InotifyWatcher uses the Linux inotify API through ctypes and reports a file once it is closed after writing or moved
+into the tree, so files are not picked up half-written. New subdirectories are watched as they are created.
+PollingWatcher works everywhere and simply asks for a full comparison every interval seconds. open_watcher picks
+inotify where it is available and falls back to polling otherwise.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import ctypes
+import ctypes.util
+import errno
+from fnmatch import fnmatch
+import os
+import select
+import struct
+import sys
+import time
+from FileDiscovery import DEFAULT_PATTERN, list_entries
+
+# inotify event masks (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+_event = struct.Struct("iIII")
+# Events that arrive within SETTLE_SECONDS of each other are reported together, for at most SETTLE_LIMIT_SECONDS
+SETTLE_SECONDS = 0.2
+SETTLE_LIMIT_SECONDS = 2.0
+
+
+class PollingWatcher(object):
+
+    """__init__: ask for a full comparison of input_dir every interval seconds."""
+    def __init__(self, input_dir, pattern=DEFAULT_PATTERN, interval=5.0):
+        self.input_dir = input_dir
+        self.pattern = pattern
+        self.interval = interval
+        self.next_poll = 0.0
+        self.name = "polling"
+        return
+
+    def poll(self, timeout=None):
+        wait = self.next_poll - time.time()
+        if timeout is not None and wait > timeout:
+            time.sleep(max(timeout, 0))
+            return set()
+        if wait > 0:
+            time.sleep(wait)
+        self.next_poll = time.time() + self.interval
+        return None
+
+    def close(self):
+        return
+
+
+class InotifyWatcher(object):
+
+    """__init__: watch input_dir and all of its subdirectories; raises OSError when inotify is not available."""
+    def __init__(self, input_dir, pattern=DEFAULT_PATTERN):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        self.input_dir = input_dir
+        self.pattern = pattern
+        # Watch descriptor -> directory
+        self.directories = dict()
+        self.rescan = True
+        self.name = "inotify"
+        self.add_tree(input_dir)
+        return
+
+    def add_tree(self, directory):
+        """Watch directory and its subdirectories; return the matching files already in them."""
+        found = set()
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            wd = self.libc.inotify_add_watch(self.fd, current, WATCH_MASK)
+            if wd < 0:
+                # The directory went away again, or the watch limit was reached; a full comparison covers both
+                self.rescan = True
+                continue
+            self.directories[wd] = current
+            try:
+                for name, path, is_file, is_dir in list_entries(current):
+                    if is_dir:
+                        pending.append(path)
+                    elif is_file and (self.pattern is None or fnmatch(name, self.pattern)):
+                        found.add(path)
+            except OSError:
+                self.rescan = True
+        return found
+
+    def read_events(self, paths):
+        """Read the pending events and add the paths they concern to paths."""
+        data = os.read(self.fd, 65536)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _event.unpack_from(data, offset)
+            offset += _event.size
+            name = data[offset:offset + length].rstrip("\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.rescan = True
+                continue
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.directories[wd]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # Files under a vanished directory are found missing by the full comparison
+                self.rescan = True
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    paths.update(self.add_tree(path))
+                elif mask & IN_MOVED_FROM:
+                    self.rescan = True
+            elif self.pattern is None or fnmatch(name, self.pattern):
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                    paths.add(path)
+        return paths
+
+    def poll(self, timeout=None):
+        paths = set()
+        if not self.rescan:
+            readable = select.select([self.fd], [], [], timeout)[0]
+            if readable:
+                self.read_events(paths)
+                # Let a burst of arrivals settle so it is handled as one update
+                deadline = time.time() + SETTLE_LIMIT_SECONDS
+                while time.time() < deadline and select.select([self.fd], [], [], SETTLE_SECONDS)[0]:
+                    self.read_events(paths)
+        if self.rescan:
+            self.rescan = False
+            return None
+        return paths
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        return
+
+
+"""open_watcher(): return an InotifyWatcher for input_dir, or a PollingWatcher if inotify is unavailable or disabled."""
+def open_watcher(input_dir, pattern=DEFAULT_PATTERN, poll_interval=5.0, use_inotify=True):
+    if use_inotify:
+        try:
+            return InotifyWatcher(input_dir, pattern)
+        except (OSError, AttributeError):
+            # AttributeError: the C library has no inotify functions
+            pass
+    return PollingWatcher(input_dir, pattern, poll_interval)
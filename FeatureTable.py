@@ -0,0 +1,275 @@
+"""FeatureTable: a compiled, on-disk copy of the feature table of a GenBank reference.
+
+gd_sequence_mapper never uses the reference sequence; it only needs each feature's type, label, strand and location.
+This module compiles those fields out of a Biopython record into a compact binary file stored next to the .gb file
+(<name>.gbft), and loads them back as lightweight feature objects that behave like SeqFeature for the attributes the
+mapper reads (type, strand, location, qualifiers['label']).
+
+A compiled table records the modification time, size and SHA-1 of the .gb file it came from. It is reused while the
+mtime and size match, or while the content hash still matches after a touch; otherwise the .gb file is parsed again
+and the table rewritten.
+
+File layout (little-endian):
+    header:   magic "GDFT", version (H), gb mtime (d), gb size (Q), gb sha1 (20s),
+              string count (I), feature count (I), span count (I)
+    strings:  length (H) + raw bytes, for every interned type and label
+    features: type string id (I), label string id (i, -1 if none), strand (b), span count (H)
+    spans:    start, end (i) pairs for every location part, in feature order
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import hashlib
+import os
+import struct
+import threading
+
+TABLE_EXTENSION = ".gbft"
+TABLE_MAGIC = "GDFT"
+TABLE_VERSION = 1
+
+_header = struct.Struct("<4sHdQ20sIII")
+_string_length = struct.Struct("<H")
+_feature = struct.Struct("<IibH")
+_span = struct.Struct("<ii")
+
+# Strand values are stored in a signed byte; Biopython uses None for mixed/unknown strands.
+_NO_STRAND = -128
+
+
+class TableFormatError(ValueError):
+    pass
+
+
+class TableLocation(object):
+
+    __slots__ = ('start', 'end', 'strand', 'parts')
+
+    """__init__: build a location from (start, end) spans; several spans make a compound (join) location."""
+    def __init__(self, spans, strand=None):
+        self.strand = strand
+        self.start = min([span[0] for span in spans])
+        self.end = max([span[1] for span in spans])
+        if len(spans) == 1:
+            self.parts = [self]
+        else:
+            self.parts = [TableLocation([span], strand) for span in spans]
+        return
+
+    def __contains__(self, position):
+        for part in self.parts:
+            if part.start <= position < part.end:
+                return True
+        return False
+
+    def spans(self):
+        return [(part.start, part.end) for part in self.parts]
+
+    def __repr__(self):
+        return "TableLocation(" + repr(self.spans()) + ", strand=" + repr(self.strand) + ")"
+
+
+class TableFeature(object):
+
+    __slots__ = ('type', 'strand', 'location', 'qualifiers')
+
+    """__init__: a feature carrying only the fields gd_sequence_mapper reads."""
+    def __init__(self, _type, label, strand, location):
+        self.type = _type
+        self.strand = strand
+        self.location = location
+        self.qualifiers = dict()
+        if label is not None:
+            self.qualifiers['label'] = [label]
+        return
+
+    def __repr__(self):
+        return "TableFeature(" + repr(self.type) + ", " + repr(self.qualifiers.get('label')) + ", " + \
+               repr(self.location) + ")"
+
+
+"""compile_features(): convert the features of a Biopython SeqRecord into TableFeature objects."""
+def compile_features(record):
+    features = []
+    for feat in record.features:
+        label = None
+        if 'label' in feat.qualifiers:
+            label = feat.qualifiers['label'][0]
+        spans = [(int(part.start), int(part.end)) for part in feat.location.parts]
+        features.append(TableFeature(feat.type, label, feat.strand, TableLocation(spans, feat.strand)))
+    return features
+
+
+def file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 16), ""):
+            sha.update(chunk)
+    return sha.digest()
+
+
+"""write_table(): write features to path, stamped with the mtime, size and hash of the source .gb file.
+
+The table is written to a temporary file and renamed into place so concurrent readers never see a partial file."""
+def write_table(path, features, mtime, size, digest):
+    strings = []
+    string_ids = dict()
+
+    def intern(value):
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    feature_rows = []
+    spans = []
+    for feat in features:
+        type_id = intern(feat.type)
+        label_id = -1
+        if 'label' in feat.qualifiers:
+            label_id = intern(feat.qualifiers['label'][0])
+        strand = _NO_STRAND if feat.strand is None else feat.strand
+        feat_spans = feat.location.spans()
+        feature_rows.append(_feature.pack(type_id, label_id, strand, len(feat_spans)))
+        for start, end in feat_spans:
+            spans.append(start)
+            spans.append(end)
+
+    chunks = [_header.pack(TABLE_MAGIC, TABLE_VERSION, mtime, size, digest, len(strings), len(feature_rows),
+                           len(spans) // 2)]
+    for value in strings:
+        chunks.append(_string_length.pack(len(value)))
+        chunks.append(value)
+    chunks.extend(feature_rows)
+    chunks.append(struct.pack("<%di" % len(spans), *spans))
+
+    temp_path = path + ".tmp" + str(os.getpid()) + "." + str(threading.current_thread().ident)
+    with open(temp_path, "wb") as handle:
+        handle.write("".join(chunks))
+    os.rename(temp_path, path)
+    return
+
+
+"""read_table_header(): return (mtime, size, digest) from a table file, or None if it is missing or unreadable."""
+def read_table_header(path):
+    try:
+        with open(path, "rb") as handle:
+            raw = handle.read(_header.size)
+    except IOError:
+        return None
+    if len(raw) < _header.size:
+        return None
+    magic, version, mtime, size, digest, n_strings, n_features, n_spans = _header.unpack(raw)
+    if magic != TABLE_MAGIC or version != TABLE_VERSION:
+        return None
+    return mtime, size, digest
+
+
+"""read_table(): load the TableFeature list stored in path.
+
+Raises TableFormatError if the file is truncated, has trailing bytes or refers to strings or spans it does not hold."""
+def read_table(path):
+    with open(path, "rb") as handle:
+        raw = handle.read()
+    try:
+        return _parse_table(raw, path)
+    except (struct.error, IndexError) as error:
+        raise TableFormatError(path + ": corrupt feature table (" + str(error) + ")")
+
+
+def _parse_table(raw, path):
+    magic, version, mtime, size, digest, n_strings, n_features, n_spans = _header.unpack_from(raw, 0)
+    offset = _header.size
+
+    strings = []
+    for i in xrange(n_strings):
+        (length,) = _string_length.unpack_from(raw, offset)
+        offset += _string_length.size
+        strings.append(raw[offset:offset + length])
+        offset += length
+    if offset > len(raw):
+        raise TableFormatError(path + ": truncated feature table")
+
+    rows = []
+    for i in xrange(n_features):
+        rows.append(_feature.unpack_from(raw, offset))
+        offset += _feature.size
+    # Check the body length before unpacking, so a truncated or padded table is not read as a shorter one
+    if offset + n_spans * _span.size != len(raw):
+        raise TableFormatError(path + ": expected " + str(offset + n_spans * _span.size) + " bytes, found " +
+                               str(len(raw)))
+    if sum([row[3] for row in rows]) != n_spans:
+        raise TableFormatError(path + ": span counts do not add up to " + str(n_spans))
+    spans = struct.unpack_from("<%di" % (2 * n_spans), raw, offset)
+
+    features = []
+    span_num = 0
+    for type_id, label_id, strand, feat_span_count in rows:
+        if strand == _NO_STRAND:
+            strand = None
+        if label_id < -1:
+            raise TableFormatError(path + ": string id " + str(label_id) + " out of range")
+        label = strings[label_id] if label_id >= 0 else None
+        feat_spans = [(spans[2 * i], spans[2 * i + 1]) for i in xrange(span_num, span_num + feat_span_count)]
+        span_num += feat_span_count
+        features.append(TableFeature(strings[type_id], label, strand, TableLocation(feat_spans, strand)))
+    return features
+
+
+"""load_features(): return the features of plasmid_dir/name.gb, using the compiled table when it is still valid.
+
+Returns None if the .gb file does not exist. A stale, missing or corrupt table is rebuilt with Biopython, or with
+GenBankScanner when Biopython is not installed; failure to write the table (e.g. a read-only plasmid directory) is
+not an error."""
+def load_features(plasmid_dir, name):
+    gb_path = plasmid_dir + name + ".gb"
+    table_path = plasmid_dir + name + TABLE_EXTENSION
+    try:
+        stat = os.stat(gb_path)
+    except OSError:
+        return None
+
+    header = read_table_header(table_path)
+    if header:
+        mtime, size, digest = header
+        try:
+            if mtime == stat.st_mtime and size == stat.st_size:
+                return read_table(table_path)
+            # Touched but possibly unchanged: trust the table if the content hash still matches.
+            if size == stat.st_size and digest == file_hash(gb_path):
+                features = read_table(table_path)
+                try:
+                    write_table(table_path, features, stat.st_mtime, stat.st_size, digest)
+                except (IOError, OSError):
+                    pass
+                return features
+        except TableFormatError:
+            # Fall through and rebuild the table from the .gb file
+            pass
+
+    try:
+        from Bio import SeqIO
+    except ImportError:
+        SeqIO = None
+    if SeqIO is not None:
+        features = compile_features(SeqIO.read(gb_path, "genbank"))
+    else:
+        import GenBankScanner
+        features = GenBankScanner.scan_features(gb_path)
+    try:
+        write_table(table_path, features, stat.st_mtime, stat.st_size, file_hash(gb_path))
+    except (IOError, OSError):
+        pass
+    return features
@@ -0,0 +1,116 @@
+"""FileDiscovery: lazy, single-pass discovery of the .gd files in an input tree.
+
+iter_gd_files walks the input directory with scandir (os.scandir, or the scandir package on Python 2; os.listdir when
+neither is available) and yields each matching file as soon as its directory entry is read, so processing can start
+while a large directory is still being enumerated. Files are yielded in the same order as a top-down os.walk: the
+files of a directory first, then its subdirectories. As with os.walk, symbolic links to directories are not followed.
+
+report_progress wraps the stream, prints a running count and records the time spent enumerating as the "discover"
+stage of the instrumentation.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+from fnmatch import fnmatch
+import os
+import time
+import zlib
+from Instrumentation import instrumentation
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+DEFAULT_PATTERN = "*.gd"
+PROGRESS_INTERVAL = 1000
+
+
+"""list_entries(): yield (name, path, is_file, is_dir) for the entries of directory; is_dir is False for symlinks."""
+def list_entries(directory):
+    if scandir is not None:
+        for entry in scandir(directory):
+            is_dir = entry.is_dir() and not entry.is_symlink()
+            yield entry.name, entry.path, not is_dir and entry.is_file(), is_dir
+        return
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        is_dir = os.path.isdir(path) and not os.path.islink(path)
+        yield name, path, not is_dir and os.path.isfile(path), is_dir
+
+
+"""iter_gd_files(): yield the paths of the files under input_dir whose names match pattern (None matches every file)."""
+def iter_gd_files(input_dir, pattern=DEFAULT_PATTERN, recursive=True):
+    pending = [input_dir]
+    while pending:
+        directory = pending.pop(0)
+        subdirectories = []
+        for name, path, is_file, is_dir in list_entries(directory):
+            if is_dir:
+                subdirectories.append(path)
+            elif is_file and (pattern is None or fnmatch(name, pattern)):
+                yield path
+        if recursive:
+            # Depth first, like os.walk
+            pending[0:0] = subdirectories
+
+
+"""select_shard(): pass through the paths that belong to shard shard_index (0-based) of shard_count.
+
+Files are assigned by a CRC-32 of their path relative to input_dir, so every machine agrees on the split without
+coordination and regardless of the order in which directories are listed."""
+def select_shard(gd_paths, input_dir, shard_index, shard_count):
+    for gd_path in gd_paths:
+        if get_shard_index(gd_path, input_dir, shard_count) == shard_index:
+            yield gd_path
+
+
+def get_shard_index(gd_path, input_dir, shard_count):
+    return (zlib.crc32(os.path.relpath(gd_path, input_dir)) & 0xffffffff) % shard_count
+
+
+"""in_scope(): return whether iter_gd_files(input_dir, pattern), narrowed to shard (index, count) if set, would yield
+gd_path if the file existed. Used to tell a file that was deleted from one that was simply not scanned."""
+def in_scope(gd_path, input_dir, pattern=DEFAULT_PATTERN, shard=None):
+    if not gd_path.startswith(os.path.join(input_dir, "")):
+        return False
+    if pattern is not None and not fnmatch(os.path.basename(gd_path), pattern):
+        return False
+    return shard is None or get_shard_index(gd_path, input_dir, shard[1]) == shard[0]
+
+
+"""report_progress(): pass gd_paths through, printing a running count every interval files and the total at the end."""
+def report_progress(gd_paths, interval=PROGRESS_INTERVAL):
+    count = 0
+    discover_seconds = 0.0
+    iterator = iter(gd_paths)
+    while True:
+        start = time.time()
+        try:
+            gd_path = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            discover_seconds += time.time() - start
+        count += 1
+        if count % interval == 0:
+            print "Found", count, "files so far..."
+        yield gd_path
+    if instrumentation.enabled:
+        instrumentation.add("discover", discover_seconds)
+    print "Found", count, "files."
@@ -0,0 +1,209 @@
+"""GenBankScanner: a lightweight reader for the FEATURES table of a GenBank file.
+
+SeqIO.read(..., "genbank") builds a complete SeqRecord, including the sequence and every qualifier. gd_sequence_mapper
+only needs each feature's type, strand, location and first /label, so this scanner reads the FEATURES table line by
+line, keeps just those fields and stops at ORIGIN. Features are returned as FeatureTable.TableFeature objects.
+
+Locations follow Biopython's conventions: 0-based half-open spans, strand 1 unless complemented, reversed part order for
+complement(join(...)), and origin-spanning spans on circular records split in two.
+
+Parity with Biopython can be checked on a plasmid directory with:
+    python GenBankScanner.py plasmids/
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+import sys
+from FeatureTable import TableFeature, TableLocation
+
+# Column layout of the FEATURES table
+FEATURE_KEY_INDENT = 5
+FEATURE_QUALIFIER_INDENT = 21
+FEATURE_END_MARKERS = ("ORIGIN", "CONTIG", "//", "BASE COUNT")
+
+
+"""split_top_level(): split a location string on the commas that are not nested inside parentheses."""
+def split_top_level(text):
+    items = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    items.append(text[start:])
+    return items
+
+
+def parse_position(text, is_start):
+    """Return the integer value of a GenBank position, ignoring fuzzy markers (<, >) and (a.b) ranges."""
+    text = text.strip("<>")
+    if text.startswith("(") and text.endswith(")"):
+        left, sep, right = text[1:-1].partition(".")
+        return int(left) if is_start else int(right)
+    return int(text)
+
+
+"""parse_location(): convert a GenBank location string into a list of (start, end, strand) parts.
+
+seq_length and circular are used to split spans that run across the origin of a circular record."""
+def parse_location(text, seq_length=None, circular=False):
+    if text.startswith("complement(") and text.endswith(")"):
+        parts = parse_location(text[len("complement("):-1], seq_length, circular)
+        return [(start, end, -strand) for start, end, strand in reversed(parts)]
+    for operator in ("join(", "order(", "bond("):
+        if text.startswith(operator) and text.endswith(")"):
+            parts = []
+            for item in split_top_level(text[len(operator):-1]):
+                parts.extend(parse_location(item, seq_length, circular))
+            return parts
+    if ":" in text:
+        # Remote reference (ACCESSION:location); keep the location part
+        text = text.split(":", 1)[1]
+    if ".." in text:
+        left, right = text.split("..", 1)
+        start = parse_position(left, True) - 1
+        end = parse_position(right, False)
+        if start >= end and circular and seq_length:
+            return [(start, seq_length, 1), (0, end, 1)]
+        return [(start, end, 1)]
+    if "^" in text:
+        left, right = text.split("^", 1)
+        position = parse_position(left, True)
+        return [(position, position, 1)]
+    position = parse_position(text, True)
+    return [(position - 1, position, 1)]
+
+
+def make_feature(key, location_text, label, seq_length, circular):
+    parts = parse_location(location_text, seq_length, circular)
+    strands = set([part[2] for part in parts])
+    strand = parts[0][2] if len(strands) == 1 else None
+    location = TableLocation([(start, end) for start, end, part_strand in parts], strand)
+    return TableFeature(key, label, strand, location)
+
+
+"""clean_qualifier_value(): undo GenBank quoting the way Biopython does (strip quotes, "" -> ")."""
+def clean_qualifier_value(lines):
+    value = " ".join(lines)
+    if value.startswith('"'):
+        value = value[1:]
+    if value.endswith('"'):
+        value = value[:-1]
+    return value.replace('""', '"')
+
+
+"""scan_features(): return the features of a GenBank file as TableFeature objects, without reading the sequence."""
+def scan_features(path):
+    features = []
+    seq_length = None
+    circular = False
+
+    key = None
+    location_lines = []
+    label_lines = None
+    label = None
+    in_label = False
+    in_location = False
+
+    with open(path, "r") as handle:
+        # Header: only the LOCUS line matters (sequence length and topology)
+        for line in handle:
+            if line.startswith("LOCUS"):
+                fields = line.split()
+                if len(fields) > 2 and fields[2].isdigit():
+                    seq_length = int(fields[2])
+                circular = "circular" in line.lower()
+            elif line.startswith("FEATURES"):
+                break
+
+        for line in handle:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            if not line.startswith(" "):
+                if line.startswith(FEATURE_END_MARKERS):
+                    break
+                continue
+            if line[FEATURE_KEY_INDENT] != " ":
+                # New feature; finish the previous one
+                if key is not None:
+                    features.append(make_feature(key, "".join(location_lines), label, seq_length, circular))
+                key = line[FEATURE_KEY_INDENT:FEATURE_QUALIFIER_INDENT].strip()
+                location_lines = [line[FEATURE_QUALIFIER_INDENT:].strip()]
+                label = None
+                in_label = False
+                in_location = True
+                continue
+
+            content = line[FEATURE_QUALIFIER_INDENT:].strip()
+            if content.startswith("/"):
+                in_location = False
+                in_label = False
+                name, sep, value = content[1:].partition("=")
+                if name == "label" and label is None:
+                    label_lines = [value.lstrip()]
+                    label = clean_qualifier_value(label_lines)
+                    # A quoted value continues until its closing quote
+                    in_label = label_lines[0].startswith('"') and (len(label_lines[0]) == 1 or
+                                                                   not label_lines[0].endswith('"'))
+            elif in_location:
+                location_lines.append(content)
+            elif in_label:
+                label_lines.append(content)
+                label = clean_qualifier_value(label_lines)
+                in_label = not content.endswith('"')
+
+    if key is not None:
+        features.append(make_feature(key, "".join(location_lines), label, seq_length, circular))
+    return features
+
+
+"""check_parity(): compare scan_features with Biopython for every .gb file in plasmid_dir; return the mismatch count."""
+def check_parity(plasmid_dir):
+    from Bio import SeqIO
+    from FeatureTable import compile_features
+
+    mismatches = 0
+    for name in sorted(os.listdir(plasmid_dir)):
+        if not name.endswith(".gb"):
+            continue
+        path = os.path.join(plasmid_dir, name)
+        expected = compile_features(SeqIO.read(path, "genbank"))
+        scanned = scan_features(path)
+        if len(expected) != len(scanned):
+            print name + ": feature count differs (" + str(len(expected)) + " vs " + str(len(scanned)) + ")"
+            mismatches += 1
+            continue
+        for feat_num, (bio_feat, scan_feat) in enumerate(zip(expected, scanned)):
+            bio_fields = (bio_feat.type, bio_feat.qualifiers.get('label'), bio_feat.strand, bio_feat.location.spans())
+            scan_fields = (scan_feat.type, scan_feat.qualifiers.get('label'), scan_feat.strand,
+                           scan_feat.location.spans())
+            if bio_fields != scan_fields:
+                print name + ": feature " + str(feat_num) + " differs:", bio_fields, "vs", scan_fields
+                mismatches += 1
+    return mismatches
+
+
+if __name__ == "__main__":
+    plasmid_dir = sys.argv[1] if len(sys.argv) > 1 else "plasmids/"
+    mismatch_count = check_parity(plasmid_dir)
+    print str(mismatch_count), "mismatches."
+    sys.exit(1 if mismatch_count else 0)
@@ -0,0 +1,231 @@
+"""GenomeDiffReader: a streaming reader for GenomeDiff (.gd) files.
+
+The reader parses the "#=" header lines when it is created and then yields one GenomeDiffRecord per mutation or
+evidence line, so memory use does not depend on the size of the file. Lines are split with str.split and a maximum
+split count: the common fields are parsed and everything after the position is kept as a single unparsed string until
+a caller asks for it.
+
+Every record line starts with the same five fields:
+    type, id, parent ids (comma-separated, "." for none), seq_id, position
+For MC and UN evidence lines the position field is the start of the region.
+
+For very large files MappedGenomeDiffReader scans the file as bytes through mmap. It returns the same records as
+GenomeDiffReader; on its own it is not faster than the line reader, because every line is still copied and split.
+
+Both readers can drop evidence lines (RA, MC, JC, UN) with skip_evidence. They are recognised by their two-letter type
+and skipped before the line is split, which is where the time goes in files that are mostly evidence. This changes the
+counts (the mapper counts evidence lines like mutations), so it is off by default and has to be asked for.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import mmap
+import os
+from cStringIO import StringIO
+
+# Evidence (as opposed to mutation) record types
+EVIDENCE_TYPES = ("RA", "MC", "JC", "UN")
+
+
+class GenomeDiffRecord(object):
+
+    __slots__ = ('type', 'id', 'parent_ids', 'seq_id', 'position', 'rest')
+
+    """__init__: a single mutation or evidence line. rest holds the unsplit fields after the position."""
+    def __init__(self, _type, _id, parent_ids, seq_id, position, rest):
+        self.type = _type
+        self.id = _id
+        self.parent_ids = parent_ids
+        self.seq_id = seq_id
+        self.position = position
+        self.rest = rest
+        return
+
+    def get_parent_ids(self):
+        if self.parent_ids == ".":
+            return []
+        return self.parent_ids.split(",")
+
+    def get_extra_fields(self):
+        """Return the fields after the position: positional values as a list and key=value pairs as a dict."""
+        values = []
+        attributes = dict()
+        if not self.rest:
+            return values, attributes
+        for field in self.rest.split("\t"):
+            key, sep, value = field.partition("=")
+            if sep:
+                attributes[key] = value
+            else:
+                values.append(field)
+        return values, attributes
+
+    def __repr__(self):
+        return ("GenomeDiffRecord(" + repr(self.type) + ", " + repr(self.id) + ", " + repr(self.seq_id) + ", " +
+                repr(self.position) + ")")
+
+
+"""parse_record(): build a GenomeDiffRecord from one tab-separated line (without comment or header handling)."""
+def parse_record(line):
+    fields = line.rstrip("\r\n").split("\t", 5)
+    rest = fields[5] if len(fields) > 5 else ""
+    return GenomeDiffRecord(fields[0], fields[1], fields[2], fields[3], int(fields[4]), rest)
+
+
+class GenomeDiffReader(object):
+
+    """__init__: read the header of an open .gd file handle; records are read lazily by iterating the reader.
+
+    name defaults to the handle's file name; pass it explicitly for in-memory handles. With skip_evidence set, evidence
+    lines are dropped."""
+    def __init__(self, handle, name=None, skip_evidence=False):
+        self.handle = handle
+        self.name = name or getattr(handle, "name", "<genomediff>")
+        self.skip_evidence = skip_evidence
+        self.version = None
+        self.header = dict()
+        self._pending = None
+
+        for line in handle:
+            if line.startswith("#="):
+                key, sep, value = line[2:].rstrip("\r\n").partition("\t")
+                if key == "GENOME_DIFF":
+                    self.version = value
+                self.header.setdefault(key, []).append(value)
+                continue
+            if line.startswith("#") or not line.strip():
+                continue
+            # Evidence types are the only two-letter types
+            if skip_evidence and line[2:3] == "\t":
+                continue
+            self._pending = parse_record(line)
+            break
+        return
+
+    def peek(self):
+        """Return the next record without consuming it, or None if there are no records."""
+        return self._pending
+
+    def __iter__(self):
+        if self._pending is None:
+            return
+        record = self._pending
+        self._pending = None
+        yield record
+        skip_evidence = self.skip_evidence
+        for line in self.handle:
+            if line.startswith("#") or not line.strip():
+                continue
+            if skip_evidence and line[2:3] == "\t":
+                continue
+            yield parse_record(line)
+
+    def __repr__(self):
+        return "GenomeDiffReader(" + repr(self.name) + ")"
+
+    def close(self):
+        self.handle.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class MappedGenomeDiffReader(object):
+
+    """__init__: memory-map the .gd file at path and read its header; records are scanned lazily.
+
+    Same interface as GenomeDiffReader, but lines are read as bytes straight from the mapping (mmap.readline finds the
+    line boundaries without going through a file buffer). Lines are split once with a maximum split count, like
+    parse_record(). skip_evidence drops evidence lines as in GenomeDiffReader."""
+    def __init__(self, path, skip_evidence=False):
+        self.name = path
+        self.skip_evidence = skip_evidence
+        self.version = None
+        self.header = dict()
+        self._pending = None
+
+        with open(path, "rb") as handle:
+            # Empty files cannot be mapped
+            if os.fstat(handle.fileno()).st_size:
+                self.data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = StringIO("")
+        self._records = self._scan()
+        self._pending = next(self._records, None)
+        return
+
+    def _scan(self):
+        readline = self.data.readline
+        skip_evidence = self.skip_evidence
+        while True:
+            line = readline()
+            if not line:
+                return
+            if line[0] == "#":
+                if line[1:2] == "=":
+                    key, sep, value = line[2:].rstrip("\r\n").partition("\t")
+                    if key == "GENOME_DIFF":
+                        self.version = value
+                    self.header.setdefault(key, []).append(value)
+                continue
+            # Evidence types are the only two-letter types
+            if skip_evidence and line[2:3] == "\t":
+                continue
+            if not line.strip():
+                continue
+            fields = line.split("\t", 5)
+            rest = fields[5].rstrip("\r\n") if len(fields) > 5 else ""
+            yield GenomeDiffRecord(fields[0], fields[1], fields[2], fields[3], int(fields[4]), rest)
+
+    def peek(self):
+        """Return the next record without consuming it, or None if there are no records."""
+        return self._pending
+
+    def __iter__(self):
+        if self._pending is None:
+            return
+        record = self._pending
+        self._pending = None
+        yield record
+        for record in self._records:
+            yield record
+
+    def close(self):
+        self.data.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def __repr__(self):
+        return "MappedGenomeDiffReader(" + repr(self.name) + ")"
+
+
+"""open_genomediff(): open the .gd file at path with the line reader, or with the mmap scanner if mapped is set.
+
+With skip_evidence set, the reader drops evidence lines."""
+def open_genomediff(path, mapped=False, skip_evidence=False):
+    if mapped:
+        return MappedGenomeDiffReader(path, skip_evidence)
+    return GenomeDiffReader(open(path, "r"), skip_evidence=skip_evidence)
@@ -27,18 +27,34 @@ This file is part of gdparse.
     You should have received a copy of the GNU General Public License
     along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
 
-import sys
-class GenomeDiffSequenceMap:
+from array import array
 
 
+class GenomeDiffSequenceMap(object):
 
-    """__init__: instantiate all instance attributes"""
+    # Initial number of mutation type columns per feature row; doubled when more types are seen.
+    TYPE_CAPACITY = 16
+    # Incremented on every change to the counts, so derived results (see CohortQuery) know when to recompute. A class
+    # default keeps maps pickled before the attribute existed usable.
+    version = 0
+    # Cached derived maps, {name: (version, map)}; created when first used
+    _views = None
+
+    """__init__: instantiate all instance attributes
+
+    Mutation types and feature labels are interned to integer ids, and all counts live in one flat type x feature matrix
+    (one row of type_capacity columns per feature). type_map, feat_map, type_feat_map and feat_type_map are derived from
+    the matrix when they are read and cached until the counts change."""
     def __init__(self):
-        # Define mappings.
-        self.type_map = dict()
-        self.feat_map = dict()
-        self.type_feat_map = dict()
-        self.feat_type_map = dict()
+        # Interned keys
+        self.types = []
+        self.type_ids = dict()
+        self.feats = []
+        self.feat_ids = dict()
+
+        # Count matrix: counts[feat_id * type_capacity + type_id]
+        self.type_capacity = self.TYPE_CAPACITY
+        self.counts = array('l')
         self.label_type_map = dict()
 
         # Initialize all counts to 0.
@@ -48,21 +64,163 @@ class GenomeDiffSequenceMap:
     def get_count(self):
         return self.total_count
 
+    def get_type_id(self, _type):
+        if _type in self.type_ids:
+            return self.type_ids[_type]
+        type_id = len(self.types)
+        if type_id == self.type_capacity:
+            self.resize_types(2 * self.type_capacity)
+        self.type_ids[_type] = type_id
+        self.types.append(_type)
+        return type_id
+
+    def get_feat_id(self, feat):
+        if feat in self.feat_ids:
+            return self.feat_ids[feat]
+        feat_id = len(self.feats)
+        self.feat_ids[feat] = feat_id
+        self.feats.append(feat)
+        self.counts.extend(array('l', [0]) * self.type_capacity)
+        return feat_id
+
+    def resize_types(self, type_capacity):
+        """Re-lay the matrix out with type_capacity columns per feature row."""
+        counts = array('l', [0]) * (len(self.feats) * type_capacity)
+        old_capacity = self.type_capacity
+        for feat_id in xrange(len(self.feats)):
+            counts[feat_id * type_capacity:feat_id * type_capacity + old_capacity] = \
+                self.counts[feat_id * old_capacity:(feat_id + 1) * old_capacity]
+        self.counts = counts
+        self.type_capacity = type_capacity
+        return
+
+    def add_count(self, _type, feat, count=1):
+        type_id = self.get_type_id(_type)
+        feat_id = self.get_feat_id(feat)
+        self.counts[feat_id * self.type_capacity + type_id] += count
+        self.version += 1
+        return
+
+    def add_mutation(self, _type, feat, feat_type):
+        """Record one mutation of type _type in the feature labelled feat (annotated with type feat_type)."""
+        self.add_count(_type, feat)
+        self.update_label_type_map(feat, feat_type)
+        self.update_count()
+        return
+
+    def add_mutations(self, _type, feat, feat_type, count):
+        """Record count mutations of type _type in the feature labelled feat at once."""
+        self.add_count(_type, feat, count)
+        self.update_label_type_map(feat, feat_type)
+        self.total_count += count
+        return
+
+    def iter_counts(self):
+        """Yield (type, feat, count) for every non-zero cell of the matrix."""
+        counts = self.counts
+        type_capacity = self.type_capacity
+        n_types = len(self.types)
+        for feat_id, feat in enumerate(self.feats):
+            row = feat_id * type_capacity
+            for type_id in xrange(n_types):
+                count = counts[row + type_id]
+                if count:
+                    yield self.types[type_id], feat, count
+
+    def view(self, name, build):
+        """Return the derived map called name, rebuilding it with build() only when the counts have changed."""
+        views = self._views
+        if views is None:
+            views = self._views = dict()
+        cached = views.get(name)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        result = build()
+        views[name] = (self.version, result)
+        return result
+
+    def build_type_map(self):
+        type_map = dict()
+        for _type, feat, count in self.iter_counts():
+            type_map[_type] = type_map.get(_type, 0) + count
+        return type_map
+
+    def build_feat_map(self):
+        feat_map = dict()
+        for _type, feat, count in self.iter_counts():
+            feat_map[feat] = feat_map.get(feat, 0) + count
+        return feat_map
+
+    def build_type_feat_map(self):
+        type_feat_map = dict()
+        for _type, feat, count in self.iter_counts():
+            type_feat_map.setdefault(_type, dict())[feat] = count
+        return type_feat_map
+
+    def build_feat_type_map(self):
+        feat_type_map = dict()
+        for _type, feat, count in self.iter_counts():
+            feat_type_map.setdefault(feat, dict())[_type] = count
+        return feat_type_map
+
+    # The derived maps are cached until the next change to the counts and shared between callers: treat them as
+    # read-only and record mutations with add_mutation/add_mutations (or the update_* methods below).
+
+    @property
+    def type_map(self):
+        return self.view("type_map", self.build_type_map)
+
+    @property
+    def feat_map(self):
+        return self.view("feat_map", self.build_feat_map)
+
+    @property
+    def type_feat_map(self):
+        return self.view("type_feat_map", self.build_type_feat_map)
+
+    @property
+    def feat_type_map(self):
+        return self.view("feat_type_map", self.build_feat_type_map)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_views", None)
+        return state
+
+    def merge(self, other):
+        """Add the counts of another map into this one and return this map.
+
+        Labels already present in label_type_map keep their type, so merging partial maps in file order gives the same
+        result as parsing the files serially into one map."""
+        for _type, feat, count in other.iter_counts():
+            self.add_count(_type, feat, count)
+        for label in other.label_type_map:
+            self.update_label_type_map(label, other.label_type_map[label])
+        self.total_count += other.total_count
+        return self
+
+    def __add__(self, other):
+        result = GenomeDiffSequenceMap()
+        result.merge(self)
+        result.merge(other)
+        return result
+
     def output_type_csv(self):
 
         mob_count = 0
         del_count = 0
         ins_count = 0
         snp_count = 0
-        for _type in self.type_map:
+        type_map = self.type_map
+        for _type in type_map:
             if _type == 'MOB':
-                mob_count += self.type_map[_type]
+                mob_count += type_map[_type]
             if _type == 'INS':
-                ins_count += self.type_map[_type]
+                ins_count += type_map[_type]
             if _type == 'DEL':
-                del_count += self.type_map[_type]
+                del_count += type_map[_type]
             if _type == 'SNP':
-                snp_count += self.type_map[_type]
+                snp_count += type_map[_type]
         total_count = self.total_count
 
         return [mob_count, ins_count, del_count, snp_count]
@@ -70,20 +228,22 @@ class GenomeDiffSequenceMap:
     def output_label_csv(self):
         
         output_dict = dict()
-        for label in self.feat_type_map:
+        type_map = self.type_map
+        feat_type_map = self.feat_type_map
+        for label in feat_type_map:
             mob_count = 0
             del_count = 0
             ins_count = 0
             snp_count = 0
-            for _type in self.feat_type_map[label]:
+            for _type in feat_type_map[label]:
                 if _type == 'MOB':
-                    mob_count += self.type_map[_type]
+                    mob_count += type_map[_type]
                 if _type == 'INS':
-                    ins_count += self.type_map[_type]
+                    ins_count += type_map[_type]
                 if _type == 'DEL':
-                    del_count += self.type_map[_type]
+                    del_count += type_map[_type]
                 if _type == 'SNP':
-                    snp_count += self.type_map[_type]
+                    snp_count += type_map[_type]
             output_dict[label] = [mob_count, ins_count, del_count, snp_count]
         total_count = self.total_count
 
@@ -92,50 +252,33 @@ class GenomeDiffSequenceMap:
     
     def update_count(self):
         self.total_count += 1
+        self.version += 1
         return
 
+    # Deprecated: the update_* methods of the original dict-based class, kept for existing callers. The four maps they
+    # updated separately are now views of one matrix, so update_type_feat_map alone records the mutation in its cell
+    # and the other three do nothing: call all four (with update_count and update_label_type_map) for each mutation, as
+    # the original mapper did, or better, call add_mutation once.
+
     def update_type_map(self, _type):
-        if _type in self.type_map.keys():
-            self.type_map[_type] += 1
-        else:
-            self.type_map.update({_type:1})
+        """Deprecated; the count is recorded by update_type_feat_map."""
         return
 
     def update_feature_map(self, feat):
-        if feat in self.feat_map.keys():
-            self.feat_map[feat] += 1
-        else:
-            self.feat_map.update({feat:1})
+        """Deprecated; the count is recorded by update_type_feat_map."""
         return
 
-    def update_label_type_map(self, label, _type):
-        if label in self.label_type_map.keys():
-            return
-        else:
-            self.label_type_map.update({label:_type})
     def update_type_feat_map(self, _type, feat):
-        if _type in self.type_feat_map.keys():
-            if feat in self.type_feat_map[_type]:
-                # Both keys exist in respective dictionaries
-                self.type_feat_map[_type][feat] += 1
-            else:
-                # Need to add key 'feat' to type_feat_map[type] dict
-                self.type_feat_map[_type].update({feat:1})
-        # Must create type dictionary
-        else:
-            self.type_feat_map.update({_type:dict()})
-            self.type_feat_map[_type].update({feat:1})
+        """Deprecated; count one mutation of type _type in feat, without touching total_count (see update_count)."""
+        self.add_count(_type, feat)
         return
 
     def update_feat_type_map(self, feat, _type):
-        if feat in self.feat_type_map.keys():
-            if _type in self.feat_type_map[feat].keys():
-                # Both keys exist
-                self.feat_type_map[feat][_type] += 1
-            else:
-                self.feat_type_map[feat].update({_type:1})
-        # Create dictionaries
-        else:
-            self.feat_type_map.update({feat:dict()})
-            self.feat_type_map[feat].update({_type:1})
+        """Deprecated; the count is recorded by update_type_feat_map."""
         return
+
+    def update_label_type_map(self, label, _type):
+        if label in self.label_type_map:
+            return
+        else:
+            self.label_type_map.update({label:_type})
@@ -0,0 +1,198 @@
+"""Instrumentation: optional per-stage timing and counters for the gd_sequence_mapper parse pipeline.
+
+The module-level `instrumentation` object is disabled by default. While it is disabled the pipeline only pays for a
+flag check per file and per mutation. Once enabled it records wall time and call counts for each stage ("discover",
+"reference_load", "analysis_plan" (categorizing a reference, once per reference), "parse_file_data" and, inside it,
+"feature_lookup" and "map_update"), plus the number of mutations counted and skipped by the cutoff for each file. It
+can print a summary table, write a JSON report and optionally run the whole pipeline under cProfile. Stages may be
+recorded from several threads (the prefetch readers load references concurrently), so updates take a lock.
+
+    from Instrumentation import instrumentation
+    instrumentation.enable(profile=True)
+    parse_files_cds(...)
+    instrumentation.disable()
+    print instrumentation.summary_table()
+    instrumentation.write_json("timings.json")
+
+The command-line tools (gd_sequence_mapper, gd_batch, gd_shard map and gd_watch) take --instrument FILE and --profile
+FILE through add_arguments(); finish_from_arguments() prints the table and writes the files when the run is over.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import json
+import threading
+import time
+
+
+class _NullStage(object):
+
+    """Context manager used while instrumentation is disabled; does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Stage(object):
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+        return
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.owner.add(self.name, time.time() - self.start)
+        return False
+
+
+_null_stage = _NullStage()
+
+
+class Instrumentation(object):
+
+    """__init__: create a disabled, empty instrumentation object."""
+    def __init__(self):
+        self.enabled = False
+        self.profiler = None
+        self.lock = threading.Lock()
+        self.reset()
+        return
+
+    def reset(self):
+        self.stage_seconds = dict()
+        self.stage_calls = dict()
+        # (gd file, mutations counted, mutations skipped by the cutoff)
+        self.files = []
+        return
+
+    def enable(self, profile=False):
+        self.enabled = True
+        self.profiler = None
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return
+
+    def disable(self):
+        self.enabled = False
+        if self.profiler is not None:
+            self.profiler.disable()
+        return
+
+    def stage(self, name):
+        """Return a context manager that times one call of stage name (a no-op while disabled)."""
+        if not self.enabled:
+            return _null_stage
+        return _Stage(self, name)
+
+    def add(self, name, seconds, calls=1):
+        with self.lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + calls
+        return
+
+    def record_file(self, gd_file, mutation_count, skipped_count):
+        with self.lock:
+            self.files.append((gd_file, mutation_count, skipped_count))
+        return
+
+    def merge(self, report):
+        """Add a report() produced elsewhere (e.g. by a pool worker) into this object."""
+        for name in report["stages"]:
+            self.add(name, report["stages"][name]["seconds"], report["stages"][name]["calls"])
+        for entry in report["files"]:
+            self.record_file(entry["file"], entry["mutations"], entry["skipped"])
+        return
+
+    def report(self):
+        stages = dict()
+        for name in self.stage_seconds:
+            stages[name] = {"seconds": self.stage_seconds[name], "calls": self.stage_calls[name]}
+        files = [{"file": gd_file, "mutations": mutation_count, "skipped": skipped_count}
+                 for gd_file, mutation_count, skipped_count in self.files]
+        return {
+            "stages": stages,
+            "files": files,
+            "mutations": sum([entry[1] for entry in self.files]),
+            "skipped": sum([entry[2] for entry in self.files]),
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as handle:
+            json.dump(self.report(), handle, indent=2, sort_keys=True)
+        return
+
+    def write_profile(self, path):
+        """Write the cProfile statistics (pstats format) collected since enable(profile=True)."""
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+        return
+
+    def summary_table(self):
+        lines = ["%-24s %10s %12s %14s" % ("stage", "calls", "seconds", "usec/call")]
+        for name in sorted(self.stage_seconds, key=lambda stage: -self.stage_seconds[stage]):
+            seconds = self.stage_seconds[name]
+            calls = self.stage_calls[name]
+            lines.append("%-24s %10d %12.4f %14.2f" % (name, calls, seconds, 1e6 * seconds / calls if calls else 0))
+        mutation_count = sum([entry[1] for entry in self.files])
+        skipped_count = sum([entry[2] for entry in self.files])
+        lines.append(str(len(self.files)) + " files, " + str(mutation_count) + " mutations counted, " +
+                     str(skipped_count) + " skipped by the cutoff.")
+        if self.profiler is not None:
+            import pstats
+            import StringIO
+            stream = StringIO.StringIO()
+            pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(20)
+            lines.append(stream.getvalue())
+        return "\n".join(lines)
+
+
+instrumentation = Instrumentation()
+
+
+"""add_arguments(): add the --instrument and --profile options to an argparse parser."""
+def add_arguments(parser):
+    parser.add_argument("--instrument", default=None, metavar="FILE",
+                        help="time the pipeline stages, print a summary and write the JSON report to FILE")
+    parser.add_argument("--profile", default=None, metavar="FILE",
+                        help="also run under cProfile and write the statistics (pstats format) to FILE")
+    return parser
+
+
+"""enable_from_arguments(): enable instrumentation if the parsed arguments ask for it."""
+def enable_from_arguments(args):
+    if args.instrument or args.profile:
+        instrumentation.enable(profile=bool(args.profile))
+    return instrumentation.enabled
+
+
+"""finish_from_arguments(): stop instrumenting, print the summary table and write the requested files."""
+def finish_from_arguments(args):
+    if not instrumentation.enabled:
+        return
+    instrumentation.disable()
+    print instrumentation.summary_table()
+    if args.instrument:
+        instrumentation.write_json(args.instrument)
+    if args.profile:
+        instrumentation.write_profile(args.profile)
+    return
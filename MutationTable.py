@@ -0,0 +1,77 @@
+"""MutationTable: a streaming, one-row-per-mutation table written while the count maps are filled in.
+
+GenomeDiffSequenceMap only keeps counts. When parse_file_data is given a MutationTableWriter it also writes each counted
+mutation as a row of
+    sample, reference, type, position, feature_label, feature_type, category
+where sample is the path of the .gd file. Rows are buffered and written in chunks of chunk_rows, so memory use does not
+grow with the size of the cohort. The output is tab-separated unless the path ends in .csv (optionally followed by
+.gz, which compresses the output).
+
+The table is written by gd_batch (the rows field of a cohort) and gd_shard map --rows. The interactive main() in
+gd_sequence_mapper does not offer it: it only writes the CSV reports, and cohorts that need rows are run through
+gd_batch. Rows are only available where the mutations are counted in this process, so not with workers above 1 or an
+incremental (manifest_path) run, and not in the single pass of categorization all.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import csv
+import gzip
+
+MUTATION_COLUMNS = ("sample", "reference", "type", "position", "feature_label", "feature_type", "category")
+DEFAULT_CHUNK_ROWS = 10000
+
+
+class MutationTableWriter(object):
+
+    """__init__: open path for writing and write the header row."""
+    def __init__(self, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        base = path[:-3] if path.endswith(".gz") else path
+        delimiter = "," if base.endswith(".csv") else "\t"
+        self.handle = gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")
+        self.writer = csv.writer(self.handle, delimiter=delimiter, lineterminator="\n")
+        self.writer.writerow(MUTATION_COLUMNS)
+        self.rows = []
+        self.row_count = 0
+        return
+
+    def write(self, sample, reference, _type, position, feature_label, feature_type, category):
+        self.rows.append((sample, reference, _type, position, feature_label, feature_type, category))
+        if len(self.rows) >= self.chunk_rows:
+            self.flush()
+        return
+
+    def flush(self):
+        self.writer.writerows(self.rows)
+        self.row_count += len(self.rows)
+        self.rows = []
+        return
+
+    def close(self):
+        self.flush()
+        self.handle.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def __repr__(self):
+        return "MutationTableWriter(" + repr(self.path) + ")"
@@ -0,0 +1,161 @@
+"""PartialMap: an on-disk format for the partial GenomeDiffSequenceMaps of one shard of a cohort.
+
+A large cohort can be split across machines: each machine parses a shard of the input files (gd_shard.py map) and
+writes its cat_map, one GenomeDiffSequenceMap per category, to a partial file. The partial files are then merged
+(gd_shard.py reduce) into the same counts a single run over the whole cohort would have produced. The reader yields one
+map at a time, so merging never holds more than one partial map in memory besides the result.
+
+File layout (little-endian):
+    header:   magic "GDPM", version (H), categorization number (h), map count (I)
+    strings:  string count (I), then length (I) + raw bytes for every category, type, label and feature type
+    maps:     for each map: category string id (I), total count (q), type count (I), feature count (I),
+              label_type_map size (I), non-zero cell count (I), then
+              type string ids (I), feature string ids (I), (label, feature type) string id pairs (I),
+              (feature index, type index) pairs (I) and the cell counts (q)
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+import struct
+import threading
+from GenomeDiffSequenceMap import GenomeDiffSequenceMap
+
+PARTIAL_EXTENSION = ".gdpm"
+PARTIAL_MAGIC = "GDPM"
+PARTIAL_VERSION = 1
+
+_header = struct.Struct("<4sHhI")
+_count = struct.Struct("<I")
+_map_header = struct.Struct("<IqIIII")
+
+
+class PartialFormatError(ValueError):
+    pass
+
+
+"""write_partial(): write cat_map (category -> GenomeDiffSequenceMap) to path, replacing any existing file atomically.
+
+categorization_number is stored so that reduce can check that partials belong together."""
+def write_partial(path, cat_map, categorization_number):
+    strings = []
+    string_ids = dict()
+
+    def intern(value):
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    map_chunks = []
+    for category in sorted(cat_map):
+        mutation_map = cat_map[category]
+        type_ids = [intern(_type) for _type in mutation_map.types]
+        feat_ids = [intern(feat) for feat in mutation_map.feats]
+        labels = []
+        for label in mutation_map.label_type_map:
+            labels.append(intern(label))
+            labels.append(intern(mutation_map.label_type_map[label]))
+        cells = []
+        cell_counts = []
+        type_capacity = mutation_map.type_capacity
+        for feat_num in xrange(len(mutation_map.feats)):
+            for type_num in xrange(len(mutation_map.types)):
+                count = mutation_map.counts[feat_num * type_capacity + type_num]
+                if count:
+                    cells.append(feat_num)
+                    cells.append(type_num)
+                    cell_counts.append(count)
+        map_chunks.append(_map_header.pack(intern(category), mutation_map.total_count, len(type_ids), len(feat_ids),
+                                           len(labels) // 2, len(cell_counts)))
+        map_chunks.append(struct.pack("<%dI" % len(type_ids), *type_ids))
+        map_chunks.append(struct.pack("<%dI" % len(feat_ids), *feat_ids))
+        map_chunks.append(struct.pack("<%dI" % len(labels), *labels))
+        map_chunks.append(struct.pack("<%dI" % len(cells), *cells))
+        map_chunks.append(struct.pack("<%dq" % len(cell_counts), *cell_counts))
+
+    chunks = [_header.pack(PARTIAL_MAGIC, PARTIAL_VERSION, categorization_number, len(cat_map)),
+              _count.pack(len(strings))]
+    for value in strings:
+        chunks.append(_count.pack(len(value)))
+        chunks.append(value)
+    chunks.extend(map_chunks)
+
+    temp_path = path + ".tmp" + str(os.getpid()) + "." + str(threading.current_thread().ident)
+    with open(temp_path, "wb") as handle:
+        handle.write("".join(chunks))
+    os.rename(temp_path, path)
+    return
+
+
+def _read(handle, size):
+    raw = handle.read(size)
+    if len(raw) != size:
+        raise PartialFormatError(getattr(handle, "name", "partial") + ": truncated partial file")
+    return raw
+
+
+def _read_array(handle, code, length):
+    if not length:
+        return ()
+    return struct.unpack("<%d%s" % (length, code), _read(handle, length * struct.calcsize("<" + code)))
+
+
+"""read_partial_header(): return (categorization number, map count) of the partial file open in handle."""
+def read_partial_header(handle):
+    magic, version, categorization_number, map_count = _header.unpack(_read(handle, _header.size))
+    if magic != PARTIAL_MAGIC:
+        raise PartialFormatError(getattr(handle, "name", "partial") + ": not a partial map file")
+    if version != PARTIAL_VERSION:
+        raise PartialFormatError(getattr(handle, "name", "partial") + ": unsupported partial map version " +
+                                 str(version))
+    return categorization_number, map_count
+
+
+"""iter_partial(): yield (category, GenomeDiffSequenceMap) for each map in the partial file at path, one at a time.
+
+The header is checked first; use read_partial_header on an open handle to look at it without reading the maps."""
+def iter_partial(path):
+    with open(path, "rb") as handle:
+        categorization_number, map_count = read_partial_header(handle)
+        (string_count,) = _count.unpack(_read(handle, _count.size))
+        strings = []
+        for i in xrange(string_count):
+            (length,) = _count.unpack(_read(handle, _count.size))
+            strings.append(_read(handle, length))
+
+        for map_num in xrange(map_count):
+            category_id, total_count, type_count, feat_count, label_count, cell_count = \
+                _map_header.unpack(_read(handle, _map_header.size))
+            types = [strings[string_id] for string_id in _read_array(handle, "I", type_count)]
+            feats = [strings[string_id] for string_id in _read_array(handle, "I", feat_count)]
+            labels = _read_array(handle, "I", 2 * label_count)
+            cells = _read_array(handle, "I", 2 * cell_count)
+            cell_counts = _read_array(handle, "q", cell_count)
+
+            mutation_map = GenomeDiffSequenceMap()
+            # Intern in the stored order so the rebuilt map iterates like the original
+            for _type in types:
+                mutation_map.get_type_id(_type)
+            for feat in feats:
+                mutation_map.get_feat_id(feat)
+            for cell_num in xrange(cell_count):
+                feat_num = cells[2 * cell_num]
+                type_num = cells[2 * cell_num + 1]
+                mutation_map.counts[feat_num * mutation_map.type_capacity + type_num] = cell_counts[cell_num]
+            for label_num in xrange(label_count):
+                mutation_map.label_type_map[strings[labels[2 * label_num]]] = strings[labels[2 * label_num + 1]]
+            mutation_map.total_count = total_count
+            yield strings[category_id], mutation_map
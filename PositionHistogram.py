@@ -0,0 +1,200 @@
+"""PositionHistogram: where along each reference the counted mutations fall.
+
+GenomeDiffSequenceMap counts mutations by type and feature only. A PositionHistogram keeps, for every reference, a
+NumPy array of mutation counts per bin of bin_width bases, filled one file at a time with bincount, and the number of
+mutations inside each of the reference's features. Histograms with the same bin width can be merged, so partial
+histograms from worker processes add up to the histogram of a serial run.
+
+The array of a reference is sized from the end of its last feature and doubled when a mutation falls beyond it.
+Positions are compared with the feature locations as gd_sequence_mapper does, so a mutation at position p is in a
+feature part [start, end) when start <= p < end.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import csv
+import numpy as np
+
+DEFAULT_BIN_WIDTH = 100
+
+
+class FeatureSpans(object):
+
+    """__init__: flatten the location parts of features into arrays for counting mutations per feature."""
+    def __init__(self, features):
+        starts = []
+        ends = []
+        owners = []
+        self.labels = []
+        self.types = []
+        for feat_num, feat in enumerate(features):
+            for part in feat.location.parts:
+                starts.append(int(part.start))
+                ends.append(int(part.end))
+                owners.append(feat_num)
+            self.labels.append(feat.qualifiers['label'][0])
+            self.types.append(feat.type)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.array(ends, dtype=np.int64)
+        self.owners = np.array(owners, dtype=np.int64)
+        # Length of each feature: the sum of its parts
+        self.lengths = np.bincount(self.owners, weights=np.maximum(self.ends - self.starts, 0),
+                                   minlength=len(self.labels)).astype(np.int64)
+        return
+
+    def __len__(self):
+        return len(self.labels)
+
+    def count(self, sorted_positions):
+        """Return the number of sorted_positions inside each feature, as an array in feature order."""
+        inside = (np.searchsorted(sorted_positions, self.ends, side='left') -
+                  np.searchsorted(sorted_positions, self.starts, side='left'))
+        return np.bincount(self.owners, weights=np.maximum(inside, 0), minlength=len(self)).astype(np.int64)
+
+
+class PositionHistogram(object):
+
+    """__init__: create an empty histogram with bins of bin_width bases."""
+    def __init__(self, bin_width=DEFAULT_BIN_WIDTH):
+        if bin_width < 1:
+            raise ValueError("bin_width must be at least 1")
+        self.bin_width = bin_width
+        # Reference name -> count per bin
+        self.bins = dict()
+        # Reference name -> FeatureSpans, and the count of mutations inside each of those features
+        self.spans = dict()
+        self.feature_counts = dict()
+        self.total_count = 0
+        return
+
+    def get_count(self):
+        return self.total_count
+
+    def get_bins(self, reference, length):
+        """Return the bin array of reference, grown to hold at least length bins."""
+        bins = self.bins.get(reference)
+        if bins is None:
+            bins = self.bins[reference] = np.zeros(max(length, 1), dtype=np.int64)
+        elif len(bins) < length:
+            grown = np.zeros(max(length, 2 * len(bins)), dtype=np.int64)
+            grown[:len(bins)] = bins
+            bins = self.bins[reference] = grown
+        return bins
+
+    def add(self, reference, positions, feature_index=None):
+        """Count the mutation positions (any sequence of integers) of one file mapped against reference.
+
+        feature_index (a FeatureIndex) supplies the reference's features the first time the reference is seen."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return self
+        if reference not in self.spans and feature_index is not None:
+            self.spans[reference] = FeatureSpans(feature_index.features)
+            self.feature_counts[reference] = np.zeros(len(self.spans[reference]), dtype=np.int64)
+        bin_nums = np.maximum(positions, 0) // self.bin_width
+        length = int(bin_nums.max()) + 1
+        spans = self.spans.get(reference)
+        if spans is not None and len(spans.ends):
+            length = max(length, (int(spans.ends.max()) + self.bin_width - 1) // self.bin_width)
+        bins = self.get_bins(reference, length)
+        counts = np.bincount(bin_nums)
+        bins[:len(counts)] += counts
+        if spans is not None:
+            self.feature_counts[reference] += spans.count(np.sort(positions))
+        self.total_count += len(positions)
+        return self
+
+    def merge(self, other):
+        """Add the counts of other, a PositionHistogram with the same bin width, to this histogram."""
+        if other.bin_width != self.bin_width:
+            raise ValueError("cannot merge histograms with bin widths " + str(self.bin_width) + " and " +
+                             str(other.bin_width))
+        for reference in other.bins:
+            other_bins = other.bins[reference]
+            bins = self.get_bins(reference, len(other_bins))
+            bins[:len(other_bins)] += other_bins
+        for reference in other.spans:
+            if reference in self.spans:
+                if len(self.spans[reference]) != len(other.spans[reference]):
+                    raise ValueError("reference " + reference + " has different features in the merged histograms")
+                self.feature_counts[reference] += other.feature_counts[reference]
+            else:
+                self.spans[reference] = other.spans[reference]
+                self.feature_counts[reference] = other.feature_counts[reference].copy()
+        self.total_count += other.total_count
+        return self
+
+    def get_hotspots(self, k=10, window_bins=1):
+        """Return the k windows of window_bins bins with the most mutations, as (reference, start, end, count) tuples.
+
+        Windows of one reference do not overlap: after the busiest window is taken, windows overlapping it are passed
+        over. start is inclusive and end exclusive; ties go to the reference name and window that sort first. A window
+        longer than a reference covers the whole reference."""
+        if window_bins < 1:
+            raise ValueError("window_bins must be at least 1")
+        candidates = []
+        for reference in sorted(self.bins):
+            bins = self.bins[reference]
+            cumulative = np.concatenate(([0], np.cumsum(bins)))
+            width = min(window_bins, len(bins))
+            sums = cumulative[width:] - cumulative[:-width]
+            # Only the k busiest windows of each reference can make the overall top k
+            order = np.argsort(-sums, kind='mergesort')
+            taken = []
+            for window_num in order:
+                window_num = int(window_num)
+                if len(taken) == k or sums[window_num] == 0:
+                    break
+                if any(abs(window_num - other) < width for other in taken):
+                    continue
+                taken.append(window_num)
+                candidates.append((-int(sums[window_num]), reference, window_num * self.bin_width,
+                                   (window_num + width) * self.bin_width))
+        candidates.sort()
+        return [(reference, start, end, -negative_count) for negative_count, reference, start, end in candidates[:k]]
+
+    def get_density(self):
+        """Return (reference, label, type, length, count, density) for every feature, density being mutations per base.
+
+        Features of length 0 have density 0."""
+        rows = []
+        for reference in sorted(self.spans):
+            spans = self.spans[reference]
+            counts = self.feature_counts[reference]
+            densities = counts / np.maximum(spans.lengths, 1).astype(np.float64)
+            for feat_num in xrange(len(spans)):
+                rows.append((reference, spans.labels[feat_num], spans.types[feat_num], int(spans.lengths[feat_num]),
+                             int(counts[feat_num]), float(densities[feat_num])))
+        return rows
+
+    def write_hotspots_csv(self, path, k=10, window_bins=1):
+        # The hotspots are found first, so bad arguments do not leave an empty file behind
+        hotspots = self.get_hotspots(k, window_bins)
+        with open(path, "wb") as handle:
+            writer = csv.writer(handle, lineterminator="\n")
+            writer.writerow(("reference", "start", "end", "count"))
+            writer.writerows(hotspots)
+        return
+
+    def write_density_csv(self, path):
+        with open(path, "wb") as handle:
+            writer = csv.writer(handle, lineterminator="\n")
+            writer.writerow(("reference", "feature_label", "feature_type", "length", "count", "density"))
+            writer.writerows(self.get_density())
+        return
+
+    def __repr__(self):
+        return ("PositionHistogram(" + str(self.bin_width) + ": " + str(len(self.bins)) + " references, " +
+                str(self.total_count) + " mutations)")
@@ -0,0 +1,128 @@
+"""ReferenceCache: a bounded LRU cache of parsed GenBank reference sequences.
+
+Many GenomeDiff files in a cohort map to the same handful of plasmids. The cache parses and strand-filters each
+reference once per run and hands the same Reference object to every later file that uses it. By default references are
+loaded from the compiled feature tables in FeatureTable, so Biopython is only used when a table has to be (re)built.
+REFERENCE_LOADERS also offers plain Biopython parsing ("genbank") and the FEATURES-only GenBankScanner ("scan").
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+from collections import OrderedDict
+import threading
+from FeatureIndex import FeatureIndex
+import FeatureTable
+import GenBankScanner
+from Instrumentation import instrumentation
+
+
+class Reference(object):
+
+    """__init__: keep the reference features together with everything derived from them.
+
+    record is the Biopython SeqRecord when the reference was parsed with SeqIO, and None when it came from a compiled
+    feature table."""
+    def __init__(self, name, features, record=None):
+        self.name = name
+        self.record = record
+        # Filter by strand (no duplicate features)
+        self.top_strand_features = filter(lambda item: item.strand == 1, features)
+        self.feature_index = FeatureIndex(self.top_strand_features)
+        # AnalysisPlans built for this reference, keyed by categorization number and CategoryConfig
+        self.plans = dict()
+        return
+
+
+"""load_genbank_reference(): parse plasmid_dir/name.gb into a Reference, or return None if the file is missing."""
+def load_genbank_reference(plasmid_dir, name):
+    from Bio import SeqIO
+    try:
+        record = SeqIO.read(plasmid_dir + name + ".gb", "genbank")
+    except IOError:
+        return None
+    return Reference(name, record.features, record)
+
+
+"""load_compiled_reference(): load plasmid_dir/name.gb through its compiled feature table, or return None if missing."""
+def load_compiled_reference(plasmid_dir, name):
+    features = FeatureTable.load_features(plasmid_dir, name)
+    if features is None:
+        return None
+    return Reference(name, features)
+
+
+"""load_scanned_reference(): read plasmid_dir/name.gb with GenBankScanner, or return None if the file is missing."""
+def load_scanned_reference(plasmid_dir, name):
+    try:
+        features = GenBankScanner.scan_features(plasmid_dir + name + ".gb")
+    except IOError:
+        return None
+    return Reference(name, features)
+
+
+# Reference sources selectable by name in the parse functions
+REFERENCE_LOADERS = {
+    "compiled": load_compiled_reference,
+    "genbank": load_genbank_reference,
+    "scan": load_scanned_reference,
+}
+
+
+class ReferenceCache(object):
+
+    DEFAULT_MAX_SIZE = 64
+
+    """__init__: create an empty cache for the references in plasmid_dir."""
+    def __init__(self, plasmid_dir, max_size=DEFAULT_MAX_SIZE, loader=load_compiled_reference):
+        self.plasmid_dir = plasmid_dir
+        self.max_size = max_size
+        self.loader = loader
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        return
+
+    def get(self, name):
+        """Return the Reference for name, loading it on a miss. Missing references are cached as None.
+
+        Safe to call from several threads; a reference requested by two threads at once may be loaded twice."""
+        with self.lock:
+            if name in self.entries:
+                self.hits += 1
+                reference = self.entries.pop(name)
+                self.entries[name] = reference # move to most recently used
+                return reference
+            self.misses += 1
+        with instrumentation.stage("reference_load"):
+            reference = self.loader(self.plasmid_dir, name)
+        with self.lock:
+            self.entries[name] = reference
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return reference
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        return
+
+    def summary(self):
+        return ("Reference cache: " + str(self.hits) + " hits, " + str(self.misses) + " misses, " +
+                str(self.evictions) + " evictions.")
@@ -0,0 +1,170 @@
+"""ReportWriter: write the reports of a cat_map in one pass over its count matrices.
+
+write_reports produces any of
+    <prefix>output.csv      one row of MOB/INS/DEL/SNP counts per category and a TOTALS row (output_muttype_csv)
+    <prefix>output<N>.csv   one file per category, N counting from 1 in cat_map order, with a row of MOB/INS/DEL/SNP
+                            counts per feature label (output_label_csv)
+    <prefix>output.npz      the whole cat_map as columnar NumPy arrays (see below)
+reading every non-zero cell of every GenomeDiffSequenceMap once. Each file is written in full to a temporary file next
+to it and renamed over the old one, so a report is never appended to or left half-written. Label rows follow the
+order in which the map first saw each label.
+
+The .npz file holds interned string tables and one entry per non-zero (category, label, type) cell:
+    categories, labels, types, feature_types   string tables (fixed-width byte strings)
+    cell_category, cell_label, cell_type       indexes into the tables (int32)
+    cell_count                                 the cell's mutation count (int64)
+    category_total                             total mutations per category (int64)
+    label_feature_type                         index into feature_types of each label's feature type (int32, -1 if
+                                               the label has none)
+It can be loaded with numpy.load without pickle support and turned into a dense matrix with, for example,
+numpy.add.at(matrix, (cell_label, cell_type), cell_count).
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import csv
+import os
+import threading
+
+# Mutation types with a column in the CSV reports, in column order
+REPORT_TYPES = ("MOB", "INS", "DEL", "SNP")
+REPORT_HEADER = ("", "MOB", "INS", "DEL", "SNP", "TOTAL")
+# Write buffer of the report files
+BUFFER_SIZE = 1 << 20
+
+
+class AtomicFile(object):
+
+    """__init__: open a temporary file next to path; it replaces path on a clean exit and is removed otherwise."""
+    def __init__(self, path, mode="wb"):
+        self.path = path
+        self.temp_path = path + ".tmp" + str(os.getpid()) + "." + str(threading.current_thread().ident)
+        self.handle = open(self.temp_path, mode, BUFFER_SIZE)
+        return
+
+    def __enter__(self):
+        return self.handle
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.handle.close()
+        if exc_type is None:
+            os.rename(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+        return False
+
+
+"""write_reports(): write the requested reports of cat_map (category -> GenomeDiffSequenceMap) under prefix.
+
+Returns the paths written."""
+def write_reports(cat_map, prefix="", muttype=True, label=True, npz=False):
+    categories = cat_map.keys()
+    type_totals = []
+    label_rows = []
+    if npz:
+        strings = {"labels": ([], dict()), "types": ([], dict()), "feature_types": ([], dict())}
+
+        def intern(table, value):
+            values, ids = strings[table]
+            if value not in ids:
+                ids[value] = len(values)
+                values.append(value)
+            return ids[value]
+
+        cell_category = []
+        cell_label = []
+        cell_type = []
+        cell_count = []
+
+    # The single pass: every non-zero cell of every map
+    for category_num, category in enumerate(categories):
+        mutation_map = cat_map[category]
+        type_columns = [REPORT_TYPES.index(_type) if _type in REPORT_TYPES else -1 for _type in mutation_map.types]
+        if npz:
+            type_ids = [intern("types", _type) for _type in mutation_map.types]
+        totals = [0] * len(REPORT_TYPES)
+        rows = []
+        counts = mutation_map.counts
+        type_capacity = mutation_map.type_capacity
+        n_types = len(mutation_map.types)
+        for feat_id, feat in enumerate(mutation_map.feats):
+            row = [0] * len(REPORT_TYPES)
+            seen = False
+            offset = feat_id * type_capacity
+            for type_id in xrange(n_types):
+                count = counts[offset + type_id]
+                if not count:
+                    continue
+                seen = True
+                column = type_columns[type_id]
+                if column >= 0:
+                    row[column] = count
+                    totals[column] += count
+                if npz:
+                    cell_category.append(category_num)
+                    cell_label.append(intern("labels", feat))
+                    cell_type.append(type_ids[type_id])
+                    cell_count.append(count)
+            if seen:
+                rows.append([feat] + row)
+        type_totals.append(totals)
+        label_rows.append(rows)
+
+    written = []
+    if muttype:
+        path = prefix + "output.csv"
+        with AtomicFile(path) as handle:
+            writer = csv.writer(handle, lineterminator="\n")
+            writer.writerow(REPORT_HEADER)
+            for category, totals in zip(categories, type_totals):
+                writer.writerow([category] + totals + [sum(totals)])
+            column_totals = [sum(column) for column in zip(*type_totals)] if type_totals else [0] * len(REPORT_TYPES)
+            writer.writerow(["TOTALS"] + column_totals + [sum(column_totals)])
+        written.append(path)
+    if label:
+        for category_num in xrange(len(categories)):
+            path = prefix + "output" + str(category_num + 1) + ".csv"
+            with AtomicFile(path) as handle:
+                writer = csv.writer(handle, lineterminator="\n")
+                writer.writerow(REPORT_HEADER)
+                writer.writerows(label_rows[category_num])
+            written.append(path)
+    if npz:
+        import numpy as np
+        labels = strings["labels"][0]
+        label_feature_type = []
+        for feat in labels:
+            feature_type = None
+            for category in categories:
+                feature_type = cat_map[category].label_type_map.get(feat)
+                if feature_type is not None:
+                    break
+            label_feature_type.append(intern("feature_types", feature_type) if feature_type is not None else -1)
+        path = prefix + "output.npz"
+        with AtomicFile(path) as handle:
+            np.savez_compressed(handle,
+                                categories=np.array([str(category) for category in categories], dtype=np.string_),
+                                labels=np.array(labels, dtype=np.string_),
+                                types=np.array(strings["types"][0], dtype=np.string_),
+                                feature_types=np.array(strings["feature_types"][0], dtype=np.string_),
+                                cell_category=np.array(cell_category, dtype=np.int32),
+                                cell_label=np.array(cell_label, dtype=np.int32),
+                                cell_type=np.array(cell_type, dtype=np.int32),
+                                cell_count=np.array(cell_count, dtype=np.int64),
+                                category_total=np.array([cat_map[category].get_count() for category in categories],
+                                                        dtype=np.int64),
+                                label_feature_type=np.array(label_feature_type, dtype=np.int32))
+        written.append(path)
+    return written
@@ -0,0 +1,112 @@
+"""ResultManifest: a SQLite store of per-file GenomeDiffSequenceMap contributions for incremental re-runs.
+
+Each row records what one .gd file contributed to a run with a given categorization number: the partial maps it
+produced (one per category it touched) together with everything the result depends on, i.e. the file's size, mtime and
+content hash and the name and content hash of the reference it was mapped against. reference_hash also carries the
+run options the counts depend on (the CDS lists and whether evidence lines are counted), so a partial is only reused by
+a run with the same options. A later run can merge the stored partials for unchanged files and only parse the files
+that are new or changed.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import cPickle
+import sqlite3
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT NOT NULL,
+    categorization INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    content_hash TEXT NOT NULL,
+    reference TEXT,
+    reference_hash TEXT NOT NULL,
+    partial BLOB NOT NULL,
+    PRIMARY KEY (path, categorization)
+)
+"""
+
+
+class ManifestEntry(object):
+
+    __slots__ = ('size', 'mtime', 'content_hash', 'reference', 'reference_hash', 'partial')
+
+    def __init__(self, size, mtime, content_hash, reference, reference_hash, partial):
+        self.size = size
+        self.mtime = mtime
+        self.content_hash = content_hash
+        self.reference = reference
+        self.reference_hash = reference_hash
+        self.partial = partial
+        return
+
+    def get_partial_map(self):
+        """Return the stored contribution as a dict of category -> GenomeDiffSequenceMap."""
+        return cPickle.loads(str(self.partial))
+
+
+class ResultManifest(object):
+
+    """__init__: open (or create) the manifest database at path."""
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(MANIFEST_SCHEMA)
+        return
+
+    def lookup(self, gd_path, categorization_number):
+        row = self.connection.execute(
+            "SELECT size, mtime, content_hash, reference, reference_hash, partial FROM files "
+            "WHERE path = ? AND categorization = ?", (gd_path, categorization_number)).fetchone()
+        if row is None:
+            return None
+        return ManifestEntry(*row)
+
+    def store(self, gd_path, categorization_number, size, mtime, content_hash, reference, reference_hash, partial_map):
+        partial = sqlite3.Binary(cPickle.dumps(partial_map, cPickle.HIGHEST_PROTOCOL))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files (path, categorization, size, mtime, content_hash, reference, reference_hash, "
+            "partial) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (gd_path, categorization_number, size, mtime, content_hash, reference, reference_hash, partial))
+        return
+
+    def touch(self, gd_path, categorization_number, mtime):
+        """Record a new mtime for a file whose content hash did not change."""
+        self.connection.execute("UPDATE files SET mtime = ? WHERE path = ? AND categorization = ?",
+                                (mtime, gd_path, categorization_number))
+        return
+
+    def prune(self, categorization_number, keep_paths, scope=None):
+        """Delete the rows of files that no longer exist in the input.
+
+        scope, if given, is a function of a stored path that returns whether the run scanned it; rows outside the
+        scope (another input directory, pattern or shard sharing this manifest) are kept."""
+        keep_paths = set(keep_paths)
+        stale = [path for (path,) in self.connection.execute(
+            "SELECT path FROM files WHERE categorization = ?", (categorization_number,))
+            if path not in keep_paths and (scope is None or scope(path))]
+        self.connection.executemany("DELETE FROM files WHERE path = ? AND categorization = ?",
+                                    [(path, categorization_number) for path in stale])
+        return len(stale)
+
+    def commit(self):
+        self.connection.commit()
+        return
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+        return
@@ -0,0 +1,272 @@
+"""gd_batch: a non-interactive runner for many cohorts at once.
+
+main() in gd_sequence_mapper asks for the categorization and the plasmid, input and output directories. This script
+reads the same choices for any number of cohorts from a manifest and runs them back to back (or --jobs at a time) in
+one process. References are loaded through one ReferenceCache per plasmid directory and reference source, so cohorts
+that share plasmids parse them once per batch.
+
+Usage:
+    python gd_batch.py MANIFEST [--jobs N] [--reference-source compiled|genbank|scan] [--cache-size N]
+                                [--summary FILE] [--instrument FILE] [--profile FILE]
+
+The manifest is JSON (a list of cohorts, or an object with a "cohorts" list), YAML (.yaml/.yml, needs PyYAML) or TSV
+(one cohort per line under a header row). Each cohort has:
+    name            label used in the summary (default: the input directory)
+    input_dir       directory of .gd files
+    plasmid_dir     directory of .gb references
+    output_dir      directory the CSV reports are written to (created if missing)
+    categorization  1 or cds_type, 2 or cds, 3 or label, or all (the three in one pass)
+and optionally workers, vectorized, mapped, skip_evidence (do not count evidence lines; off by default because it
+changes the counts), reference_source, category_config (a CategoryConfig JSON file), manifest_path (a ResultManifest
+for incremental runs) and npz (also write the counts as output.npz, see ReportWriter).
+Relative paths are resolved against the manifest's directory.
+A cohort with bin_width set also keeps a PositionHistogram with bins of that many bases and writes hotspots.csv (the
+busiest windows) and density.csv (mutations per base of each feature).
+A cohort with rows set also writes every counted mutation to that file, one row each (see MutationTable); rows cannot be
+combined with workers above 1 or manifest_path, which never see the individual mutations in this process.
+The single pass of categorization all is serial and counts record by record, so such a cohort cannot set workers above
+1, vectorized, manifest_path, bin_width or rows; the manifest is rejected rather than the options being ignored.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import argparse
+import csv
+import json
+import os
+import Queue
+import sys
+import threading
+import time
+import traceback
+
+import gd_sequence_mapper
+from CategoryConfig import load_category_config
+import Instrumentation
+from MutationTable import MutationTableWriter
+from ReferenceCache import ReferenceCache, REFERENCE_LOADERS
+from ReportWriter import write_reports
+
+# Categorization names accepted in a manifest; 0 runs all three in one pass
+CATEGORIZATIONS = {"1": 1, "cds_type": 1, "2": 2, "cds": 2, "3": 3, "label": 3, "all": 0}
+PATH_FIELDS = ("input_dir", "plasmid_dir", "output_dir", "category_config", "manifest_path", "rows")
+BOOLEAN_FIELDS = ("vectorized", "mapped", "skip_evidence", "npz")
+# Options parse_files_all does not support (besides workers above 1)
+ALL_UNSUPPORTED_FIELDS = ("vectorized", "manifest_path", "bin_width", "rows")
+
+
+"""read_manifest(): return the cohort entries (dicts) of a JSON, YAML or TSV manifest."""
+def read_manifest(path):
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "r") as handle:
+        if extension == ".json":
+            entries = json.load(handle)
+        elif extension in (".yaml", ".yml"):
+            import yaml
+            entries = yaml.safe_load(handle)
+        else:
+            entries = list(csv.DictReader(handle, delimiter="\t"))
+    if isinstance(entries, dict):
+        entries = entries.get("cohorts", [])
+    return entries
+
+
+def parse_boolean(value):
+    if isinstance(value, basestring):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+"""parse_cohort(): validate one manifest entry and fill in defaults; paths are made relative to base_dir."""
+def parse_cohort(entry, base_dir, reference_source):
+    cohort = dict()
+    for field in ("input_dir", "plasmid_dir", "output_dir", "categorization"):
+        if entry.get(field) in (None, ""):
+            raise ValueError("cohort " + repr(entry.get("name")) + " is missing " + field)
+    categorization = str(entry["categorization"]).strip().lower()
+    if categorization not in CATEGORIZATIONS:
+        raise ValueError("cohort " + repr(entry.get("name")) + ": unknown categorization " + repr(categorization))
+    cohort["categorization"] = CATEGORIZATIONS[categorization]
+    for field in PATH_FIELDS:
+        value = entry.get(field)
+        cohort[field] = os.path.join(base_dir, os.path.expanduser(str(value))) if value else None
+    # The parse functions join directories and file names with +
+    for field in ("input_dir", "plasmid_dir", "output_dir"):
+        cohort[field] = os.path.join(cohort[field], "")
+    for field in BOOLEAN_FIELDS:
+        cohort[field] = parse_boolean(entry.get(field) or False)
+    cohort["workers"] = int(entry.get("workers") or 1)
+    cohort["bin_width"] = int(entry["bin_width"]) if entry.get("bin_width") else None
+    if not cohort["categorization"]:
+        unsupported = [field for field in ALL_UNSUPPORTED_FIELDS if cohort[field]]
+        if cohort["workers"] > 1:
+            unsupported.insert(0, "workers")
+        if unsupported:
+            raise ValueError("cohort " + repr(entry.get("name")) + ": " + ", ".join(unsupported) +
+                             " cannot be used with categorization all")
+    if cohort["rows"] and (cohort["workers"] > 1 or cohort["manifest_path"]):
+        raise ValueError("cohort " + repr(entry.get("name")) + ": rows cannot be used with workers above 1 or " +
+                         "manifest_path")
+    cohort["reference_source"] = entry.get("reference_source") or reference_source
+    if cohort["reference_source"] not in REFERENCE_LOADERS:
+        raise ValueError("cohort " + repr(entry.get("name")) + ": unknown reference source " +
+                         repr(cohort["reference_source"]))
+    cohort["name"] = str(entry.get("name") or cohort["input_dir"])
+    return cohort
+
+
+class BatchRunner(object):
+
+    """__init__: run cohorts with reference caches of max_size references shared across the batch."""
+    def __init__(self, cache_size=ReferenceCache.DEFAULT_MAX_SIZE):
+        self.cache_size = cache_size
+        self.reference_caches = dict()
+        self.lock = threading.Lock()
+        return
+
+    def get_reference_cache(self, plasmid_dir, reference_source):
+        """Return the ReferenceCache for plasmid_dir and reference_source, creating it on first use."""
+        key = (os.path.realpath(plasmid_dir), reference_source)
+        with self.lock:
+            reference_cache = self.reference_caches.get(key)
+            if reference_cache is None:
+                reference_cache = self.reference_caches[key] = ReferenceCache(
+                    plasmid_dir, self.cache_size, REFERENCE_LOADERS[reference_source])
+        return reference_cache
+
+    def run_cohort(self, cohort):
+        """Parse one cohort and write its CSV reports into its output directory."""
+        reference_cache = self.get_reference_cache(cohort["plasmid_dir"], cohort["reference_source"])
+        category_config = load_category_config(cohort["category_config"]) if cohort["category_config"] else None
+        output_dir = cohort["output_dir"]
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        categorization_number = cohort["categorization"]
+        if categorization_number == 0:
+            cat_maps = dict()
+            for number, prefix in gd_sequence_mapper.ALL_CATEGORIZATION_PREFIXES:
+                cat_maps[number] = gd_sequence_mapper.new_category_map(number, category_config)
+            gd_sequence_mapper.parse_files_all(cat_maps, cohort["input_dir"], output_dir, cohort["plasmid_dir"],
+                                               reference_cache, cohort["reference_source"], cohort["mapped"],
+                                               category_config, skip_evidence=cohort["skip_evidence"])
+            for number, prefix in gd_sequence_mapper.ALL_CATEGORIZATION_PREFIXES:
+                write_reports(cat_maps[number], output_dir + prefix, npz=cohort["npz"])
+            return
+
+        cat_map = gd_sequence_mapper.new_category_map(categorization_number, category_config)
+        histogram = None
+        if cohort["bin_width"]:
+            from PositionHistogram import PositionHistogram
+            histogram = PositionHistogram(cohort["bin_width"])
+        row_sink = MutationTableWriter(cohort["rows"]) if cohort["rows"] else None
+        options = dict(reference_cache=reference_cache, workers=cohort["workers"], vectorized=cohort["vectorized"],
+                       reference_source=cohort["reference_source"], manifest_path=cohort["manifest_path"],
+                       mapped=cohort["mapped"], skip_evidence=cohort["skip_evidence"], histogram=histogram,
+                       row_sink=row_sink)
+        try:
+            if categorization_number < 3:
+                gd_sequence_mapper.parse_files_cds(cat_map, categorization_number, cohort["input_dir"], output_dir,
+                                                   cohort["plasmid_dir"], category_config=category_config, **options)
+            else:
+                gd_sequence_mapper.parse_file_labels(cat_map, cohort["input_dir"], output_dir, cohort["plasmid_dir"],
+                                                     **options)
+        finally:
+            if row_sink is not None:
+                row_sink.close()
+        write_reports(cat_map, output_dir, npz=cohort["npz"])
+        if histogram is not None:
+            histogram.write_hotspots_csv(output_dir + "hotspots.csv")
+            histogram.write_density_csv(output_dir + "density.csv")
+        return
+
+    def run(self, cohorts, jobs=1):
+        """Run cohorts, jobs at a time, and return one result dict (name, status, seconds, error) per cohort."""
+        results = [None] * len(cohorts)
+        pending = Queue.Queue()
+        for cohort_num in xrange(len(cohorts)):
+            pending.put(cohort_num)
+
+        def work():
+            while True:
+                try:
+                    cohort_num = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                cohort = cohorts[cohort_num]
+                start = time.time()
+                result = {"name": cohort["name"], "status": "ok", "error": None}
+                try:
+                    self.run_cohort(cohort)
+                except Exception:
+                    # One failed cohort does not stop the batch
+                    result["status"] = "failed"
+                    result["error"] = traceback.format_exc()
+                result["seconds"] = time.time() - start
+                results[cohort_num] = result
+
+        if jobs <= 1:
+            work()
+        else:
+            threads = [threading.Thread(target=work) for i in range(min(jobs, len(cohorts)))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results
+
+    def summary(self):
+        return dict([(plasmid_dir + " (" + source + ")", self.reference_caches[(plasmid_dir, source)].summary())
+                     for plasmid_dir, source in self.reference_caches])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run gd_sequence_mapper over the cohorts listed in a manifest.")
+    parser.add_argument("manifest", help="JSON, YAML or TSV file listing the cohorts")
+    parser.add_argument("--jobs", type=int, default=1, help="number of cohorts to run at the same time")
+    parser.add_argument("--reference-source", default="compiled", choices=sorted(REFERENCE_LOADERS),
+                        help="how references are loaded unless a cohort says otherwise")
+    parser.add_argument("--cache-size", type=int, default=ReferenceCache.DEFAULT_MAX_SIZE,
+                        help="references kept per plasmid directory")
+    parser.add_argument("--summary", default=None, help="write the per-cohort results as JSON to this file")
+    Instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+    cohorts = [parse_cohort(entry, base_dir, args.reference_source) for entry in read_manifest(args.manifest)]
+    runner = BatchRunner(args.cache_size)
+    # With --jobs above 1 the stage timings of concurrent cohorts add up, and cProfile only sees the main thread
+    Instrumentation.enable_from_arguments(args)
+    try:
+        results = runner.run(cohorts, args.jobs)
+    finally:
+        Instrumentation.finish_from_arguments(args)
+
+    failed = [result for result in results if result["status"] != "ok"]
+    for result in results:
+        print "%-40s %-8s %10.2f s" % (result["name"], result["status"], result["seconds"])
+        if result["error"]:
+            print result["error"]
+    for name, cache_summary in sorted(runner.summary().items()):
+        print name + ": " + cache_summary
+    print len(results) - len(failed), "of", len(results), "cohorts finished."
+    if args.summary:
+        with open(args.summary, "w") as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""gd_benchmark: a reproducible throughput benchmark for gd_sequence_mapper.
+
+The benchmark generates a synthetic cohort (GenBank plasmids with the BBa_* CDS labels get_category expects, and
+GenomeDiff files with a configurable number of mutations and MOB/INS/DEL/SNP mix) from a fixed seed, then times the
+individual pipeline stages and the full parse_files_cds/parse_file_labels runs. Results are written as JSON so runs can
+be compared across commits. Each stage also records the resident set size before and after it, so memory regressions
+can be pinned to a stage rather than read off the peak of the whole process.
+
+Startup is measured in fresh interpreters: the time to import gd_sequence_mapper and the time from interpreter start to
+the first parsed file, with the slowest first-time imports (cumulative, like python -X importtime) and the heavy modules
+that were loaded on the way.
+
+Usage:
+    python gd_benchmark.py [--files N] [--mutations N] [--references N] [--features N] [--mix MOB=1,INS=1,DEL=1,SNP=1]
+                           [--seed N] [--repeat N] [--workers N] [--work-dir DIR] [--output FILE]
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import gd_sequence_mapper
+from GenomeDiffSequenceMap import GenomeDiffSequenceMap
+from GenomeDiffReader import GenomeDiffReader, MappedGenomeDiffReader
+from ReferenceCache import REFERENCE_LOADERS
+
+# The CDS labels recognised by get_category
+CDS_LABELS = ("BBa_E0020", "BBa_E0030", "BBa_K592101", "BBa_K864100", "BBa_K592100")
+FEATURE_TYPES = ("misc_feature", "promoter", "RBS", "terminator", "rep_origin")
+DEFAULT_MIX = "MOB=1,INS=1,DEL=1,SNP=1"
+# Modules a short run should not need to import
+HEAVY_MODULES = ("Bio", "numpy", "multiprocessing", "sqlite3")
+
+"""Child process of measure_startup(): times the import of gd_sequence_mapper and the parse of one file.
+
+Arguments: repository directory, plasmid directory, .gd file, reference source. Prints a JSON report, including the
+peak resident set size of the child: the memory cost of starting up and parsing one file."""
+STARTUP_SCRIPT = r"""
+import time
+start = time.time()
+import __builtin__, json, os, sys
+module_seconds = dict()
+builtin_import = __builtin__.__import__
+
+def timed_import(name, *args, **kwargs):
+    new = name not in sys.modules
+    begin = time.time()
+    try:
+        return builtin_import(name, *args, **kwargs)
+    finally:
+        if new and name in sys.modules:
+            module_seconds[name] = module_seconds.get(name, 0.0) + time.time() - begin
+
+repo_dir, plasmid_dir, gd_path, reference_source = sys.argv[1:5]
+sys.path.insert(0, repo_dir)
+__builtin__.__import__ = timed_import
+import gd_sequence_mapper
+imported = time.time()
+from ReferenceCache import ReferenceCache, REFERENCE_LOADERS
+stdout = sys.stdout
+sys.stdout = open(os.devnull, "w")
+gd_sequence_mapper.parse_gd_file(gd_path, gd_sequence_mapper.new_category_map(2), 2,
+                                 ReferenceCache(plasmid_dir, loader=REFERENCE_LOADERS[reference_source]))
+first_file = time.time()
+sys.stdout = stdout
+import resource
+peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+print json.dumps({"import_seconds": imported - start, "first_file_seconds": first_file - start,
+                  "peak_rss_kb": peak_rss_kb,
+                  "heavy_modules": [name for name in %r if name in sys.modules],
+                  "slowest_imports": sorted(module_seconds.items(), key=lambda item: -item[1])[:10]})
+""" % (HEAVY_MODULES,)
+
+
+"""parse_mix(): turn "MOB=1,SNP=2" into a list of (type, weight) pairs."""
+def parse_mix(text):
+    mix = []
+    for item in text.split(","):
+        _type, sep, weight = item.partition("=")
+        mix.append((_type.strip(), float(weight) if sep else 1.0))
+    return mix
+
+
+def weighted_choice(rng, mix):
+    total = sum([weight for _type, weight in mix])
+    target = rng.random() * total
+    for _type, weight in mix:
+        target -= weight
+        if target < 0:
+            return _type
+    return mix[-1][0]
+
+
+"""format_location(): GenBank location string for a list of 1-based inclusive (start, end) spans."""
+def format_location(spans, strand):
+    location = ",".join([str(start) + ".." + str(end) for start, end in spans])
+    if len(spans) > 1:
+        location = "join(" + location + ")"
+    if strand == -1:
+        location = "complement(" + location + ")"
+    return location
+
+
+"""write_synthetic_genbank(): write a plasmid of the given length with feature_count random features and one CDS.
+
+The CDS carries cds_label and sits in the middle of the plasmid on the top strand, so get_category and the 300 nt
+cutoff behave as they do on real constructs."""
+def write_synthetic_genbank(path, name, length, feature_count, cds_label, rng):
+    lines = ["LOCUS       " + name.ljust(16) + " " + str(length).rjust(11) + " bp    DNA     circular SYN 01-JAN-2000",
+             "DEFINITION  synthetic plasmid " + name + ".",
+             "ACCESSION   " + name,
+             "VERSION     " + name,
+             "KEYWORDS    .",
+             "SOURCE      .",
+             "  ORGANISM  .",
+             "            .",
+             "FEATURES             Location/Qualifiers"]
+    cds_start = length // 3
+    features = [("CDS", [(cds_start, cds_start + 719)], 1, cds_label)]
+    for feat_num in range(feature_count):
+        start = rng.randint(1, length - 500)
+        end = start + rng.randint(15, 480)
+        spans = [(start, end)]
+        if feat_num % 10 == 9 and end + 40 < length:
+            spans = [(start, start + (end - start) // 2), (end, end + 30)]
+        strand = -1 if rng.random() < 0.3 else 1
+        features.append((FEATURE_TYPES[feat_num % len(FEATURE_TYPES)], spans, strand, name + "_f" + str(feat_num)))
+    rng.shuffle(features)
+    for _type, spans, strand, label in features:
+        lines.append("     " + _type.ljust(16) + format_location(spans, strand))
+        lines.append("                     /label=\"" + label + "\"")
+
+    lines.append("ORIGIN")
+    sequence = "".join([rng.choice("acgt") for i in xrange(length)])
+    for offset in xrange(0, length, 60):
+        chunk = sequence[offset:offset + 60]
+        groups = " ".join([chunk[i:i + 10] for i in xrange(0, len(chunk), 10)])
+        lines.append(str(offset + 1).rjust(9) + " " + groups)
+    lines.append("//")
+    with open(path, "w") as handle:
+        handle.write("\n".join(lines) + "\n")
+    return
+
+
+"""write_synthetic_gd(): write a GenomeDiff file with mutation_count mutations on seq_id drawn from mix."""
+def write_synthetic_gd(path, seq_id, length, mutation_count, mix, rng):
+    lines = ["#=GENOME_DIFF\t1.0"]
+    for mut_id in xrange(1, mutation_count + 1):
+        _type = weighted_choice(rng, mix)
+        position = rng.randint(1, length)
+        if _type == "SNP":
+            extra = rng.choice("ACGT")
+        elif _type == "DEL":
+            extra = str(rng.randint(1, 50))
+        elif _type == "INS":
+            extra = "".join([rng.choice("ACGT") for i in range(rng.randint(1, 6))])
+        elif _type == "MOB":
+            extra = "IS1\t1\t" + str(rng.randint(1, 9))
+        else:
+            extra = ""
+        lines.append(_type + "\t" + str(mut_id) + "\t.\t" + seq_id + "\t" + str(position) + "\t" + extra)
+    with open(path, "w") as handle:
+        handle.write("\n".join(lines) + "\n")
+    return
+
+
+"""generate_cohort(): create plasmids/ and genomediff/ under root and return their paths (with trailing slashes)."""
+def generate_cohort(root, file_count, mutations_per_file, reference_count, features_per_reference, mix, seed,
+                    length=6000):
+    rng = random.Random(seed)
+    plasmid_dir = os.path.join(root, "plasmids") + os.sep
+    input_dir = os.path.join(root, "genomediff") + os.sep
+    os.makedirs(plasmid_dir)
+    os.makedirs(input_dir)
+    names = []
+    for ref_num in range(reference_count):
+        name = "psyn" + str(ref_num)
+        write_synthetic_genbank(plasmid_dir + name + ".gb", name, length, features_per_reference,
+                                CDS_LABELS[ref_num % len(CDS_LABELS)], rng)
+        names.append(name)
+    for file_num in range(file_count):
+        name = names[file_num % len(names)]
+        write_synthetic_gd(input_dir + "sample" + str(file_num).zfill(6) + ".gd", name, length, mutations_per_file,
+                           mix, rng)
+    return plasmid_dir, input_dir
+
+
+def new_cds_map():
+    cat_map = dict()
+    for label in CDS_LABELS:
+        cat_map[label.lower()] = GenomeDiffSequenceMap()
+    return cat_map
+
+
+class Quiet(object):
+
+    """Context manager that discards the mapper's progress output while a stage is timed."""
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        return False
+
+
+"""time_stage(): run func repeat times and return the best wall time in seconds, the last result and the memory use.
+
+The memory use is a dict of the resident set size before the first run and after the last one (rss_before_kb,
+rss_after_kb) and the peak resident set size of the process so far (peak_rss_kb). The peak only grows over a
+benchmark, so a stage's own footprint is best read from the other two."""
+def time_stage(func, repeat):
+    best = None
+    result = None
+    rss_before = current_rss_kb()
+    for i in range(repeat):
+        with Quiet():
+            start = time.time()
+            result = func()
+            elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    memory = {"rss_before_kb": rss_before, "rss_after_kb": current_rss_kb(), "peak_rss_kb": peak_rss_kb()}
+    return best, result, memory
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+
+def current_rss_kb():
+    """Return the resident set size of this process in kB, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "r") as handle:
+            resident_pages = int(handle.read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+    return resident_pages * resource.getpagesize() // 1024
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+"""measure_startup(): run STARTUP_SCRIPT repeat times in fresh interpreters and return the best run.
+
+The report holds the in-process import and first-file times, the wall time of the whole process and of an interpreter
+that does nothing, the slowest imports and the heavy modules that were loaded."""
+def measure_startup(plasmid_dir, gd_path, reference_source, repeat):
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        output = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT, repo_dir, plasmid_dir, gd_path,
+                                          reference_source])
+        process_seconds = time.time() - start
+        run = json.loads(output.strip().splitlines()[-1])
+        run["process_seconds"] = process_seconds
+        if best is None or run["first_file_seconds"] < best["first_file_seconds"]:
+            best = run
+    interpreter_seconds = None
+    for i in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", "pass"])
+        elapsed = time.time() - start
+        if interpreter_seconds is None or elapsed < interpreter_seconds:
+            interpreter_seconds = elapsed
+    best["interpreter_seconds"] = interpreter_seconds
+    return best
+
+
+"""run_benchmark(): generate the cohort, time every stage and return the report as a dict."""
+def run_benchmark(args):
+    mix = parse_mix(args.mix)
+    root = args.work_dir or tempfile.mkdtemp(prefix="gdparse_bench_")
+    if args.work_dir and os.path.exists(root):
+        shutil.rmtree(root)
+    try:
+        plasmid_dir, input_dir = generate_cohort(root, args.files, args.mutations, args.references, args.features, mix,
+                                                 args.seed)
+        gd_paths = gd_sequence_mapper.list_gd_files(input_dir)
+        names = sorted([name[:-3] for name in os.listdir(plasmid_dir) if name.endswith(".gb")])
+        mutation_total = args.files * args.mutations
+        stages = dict()
+
+        def record(stage, seconds, memory, files=None, mutations=None):
+            entry = {"seconds": seconds}
+            entry.update(memory)
+            if files:
+                entry["files_per_sec"] = files / seconds if seconds else None
+            if mutations:
+                entry["mutations_per_sec"] = mutations / seconds if seconds else None
+            stages[stage] = entry
+            return
+
+        # Discovery
+        seconds, result, memory = time_stage(lambda: gd_sequence_mapper.list_gd_files(input_dir), args.repeat)
+        record("discover", seconds, memory, files=len(gd_paths))
+
+        # Reference loading, cold, from each source (the first compiled run also writes the tables)
+        for source in ("genbank", "scan", "compiled"):
+            loader = REFERENCE_LOADERS[source]
+            seconds, result, memory = time_stage(lambda: [loader(plasmid_dir, name) for name in names], args.repeat)
+            record("reference_load_" + source, seconds, memory)
+        references = dict([(name, REFERENCE_LOADERS["compiled"](plasmid_dir, name)) for name in names])
+
+        # Startup, with the compiled tables written above
+        startup = dict()
+        for source in ("compiled", "scan"):
+            startup[source] = measure_startup(plasmid_dir, gd_paths[0], source, args.repeat)
+            record("startup_first_file_" + source, startup[source]["first_file_seconds"],
+                   {"peak_rss_kb": startup[source]["peak_rss_kb"]})
+        record("startup_import", startup["compiled"]["import_seconds"], {"peak_rss_kb": None})
+
+        # GenomeDiff reading
+        def read_all():
+            records = []
+            for gd_path in gd_paths:
+                with open(gd_path, "r") as handle:
+                    records.append(list(GenomeDiffReader(handle)))
+            return records
+        seconds, file_records, memory = time_stage(read_all, args.repeat)
+        record("read", seconds, memory, files=len(gd_paths), mutations=mutation_total)
+
+        def read_all_mapped(skip_evidence=False):
+            records = []
+            for gd_path in gd_paths:
+                with MappedGenomeDiffReader(gd_path, skip_evidence) as mapped_records:
+                    records.append(list(mapped_records))
+            return records
+        seconds, result, memory = time_stage(read_all_mapped, args.repeat)
+        record("read_mapped", seconds, memory, files=len(gd_paths), mutations=mutation_total)
+        # Evidence lines are dropped, so the mutation count is that of the records returned
+        seconds, result, memory = time_stage(lambda: read_all_mapped(skip_evidence=True), args.repeat)
+        record("read_mapped_skip_evidence", seconds, memory, files=len(gd_paths),
+               mutations=sum([len(records) for records in result]))
+
+        # Category resolution
+        def categorize():
+            for records in file_records:
+                reference = references[records[0].seq_id.lower()]
+                gd_sequence_mapper.get_category(records, reference.record, reference.top_strand_features, 2)
+        seconds, result, memory = time_stage(categorize, args.repeat)
+        record("get_category", seconds, memory, files=len(gd_paths))
+
+        # Feature lookup
+        def lookup():
+            found = []
+            for records in file_records:
+                feature_index = references[records[0].seq_id.lower()].feature_index
+                for gd_record in records:
+                    found.append(feature_index.find(gd_record.position))
+            return found
+        seconds, found, memory = time_stage(lookup, args.repeat)
+        record("feature_lookup", seconds, memory, mutations=mutation_total)
+
+        # Map updates
+        def count():
+            mutation_map = GenomeDiffSequenceMap()
+            feat_num = 0
+            for records in file_records:
+                for gd_record in records:
+                    feat = found[feat_num]
+                    feat_num += 1
+                    if feat is None:
+                        mutation_map.add_mutation(gd_record.type, "None", "None")
+                    else:
+                        mutation_map.add_mutation(gd_record.type, feat.qualifiers['label'][0], feat.type)
+            return mutation_map
+        seconds, result, memory = time_stage(count, args.repeat)
+        record("map_update", seconds, memory, mutations=mutation_total)
+
+        # Full pipelines
+        pipelines = [
+            ("full_cds", lambda: gd_sequence_mapper.parse_files_cds(new_cds_map(), 2, input_dir, root, plasmid_dir)),
+            ("full_labels", lambda: gd_sequence_mapper.parse_file_labels({'all': GenomeDiffSequenceMap()}, input_dir,
+                                                                         root, plasmid_dir)),
+            ("full_cds_vectorized", lambda: gd_sequence_mapper.parse_files_cds(new_cds_map(), 2, input_dir, root,
+                                                                               plasmid_dir, vectorized=True)),
+            ("full_cds_mapped", lambda: gd_sequence_mapper.parse_files_cds(new_cds_map(), 2, input_dir, root,
+                                                                           plasmid_dir, mapped=True)),
+            ("full_cds_mapped_skip_evidence", lambda: gd_sequence_mapper.parse_files_cds(
+                new_cds_map(), 2, input_dir, root, plasmid_dir, mapped=True, skip_evidence=True)),
+            ("full_all_categorizations", lambda: gd_sequence_mapper.parse_files_all(
+                dict([(number, gd_sequence_mapper.new_category_map(number)) for number in (1, 2, 3)]), input_dir, root,
+                plasmid_dir)),
+        ]
+        if args.workers > 1:
+            pipelines.append(("full_cds_workers_" + str(args.workers),
+                              lambda: gd_sequence_mapper.parse_files_cds(new_cds_map(), 2, input_dir, root,
+                                                                         plasmid_dir, workers=args.workers)))
+        for stage, func in pipelines:
+            seconds, result, memory = time_stage(func, args.repeat)
+            record(stage, seconds, memory, files=len(gd_paths), mutations=mutation_total)
+
+        return {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": {"files": args.files, "mutations_per_file": args.mutations, "references": args.references,
+                           "features_per_reference": args.features, "mix": args.mix, "seed": args.seed,
+                           "repeat": args.repeat, "workers": args.workers},
+            "stages": stages,
+            "startup": startup,
+            "peak_rss_kb": peak_rss_kb(),
+        }
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gd_sequence_mapper on a synthetic cohort.")
+    parser.add_argument("--files", type=int, default=200, help="number of .gd files")
+    parser.add_argument("--mutations", type=int, default=500, help="mutations per .gd file")
+    parser.add_argument("--references", type=int, default=5, help="number of plasmids")
+    parser.add_argument("--features", type=int, default=200, help="features per plasmid (besides the CDS)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="mutation type weights, e.g. MOB=1,INS=1,DEL=1,SNP=2")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the synthetic cohort")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the best time is reported")
+    parser.add_argument("--workers", type=int, default=1, help="also time a process pool run with this many workers")
+    parser.add_argument("--work-dir", default=None, help="generate the cohort here and keep it (default: temp dir)")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(text + "\n")
+    else:
+        print text
+
+
+if __name__ == "__main__":
+    main()
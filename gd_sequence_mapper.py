@@ -19,75 +19,140 @@ This file is part of gdparse.
     You should have received a copy of the GNU General Public License
     along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
 
-from Bio import SeqIO
+# Biopython, NumPy, multiprocessing and ResultManifest (sqlite3) are imported by the functions that use them, so a
+# run that needs none of them starts without paying for their imports.
+from binascii import hexlify
 import os
-import re
-from collections import Counter
+import Queue
+import sys
+import threading
+import time
+from cStringIO import StringIO
 from GenomeDiffSequenceMap import GenomeDiffSequenceMap
+from FeatureIndex import FeatureIndex
+from AnalysisPlan import AnalysisPlan
+from CategoryConfig import default_category_config, load_category_config
+from ReferenceCache import ReferenceCache, REFERENCE_LOADERS
+from GenomeDiffReader import GenomeDiffReader, MappedGenomeDiffReader, open_genomediff
+from FeatureTable import file_hash
+from FileDiscovery import DEFAULT_PATTERN, in_scope, iter_gd_files, select_shard, report_progress
+from Instrumentation import instrumentation
+from ReportWriter import write_reports
+
+# Output file prefix of each categorization when all three are run in one pass
+ALL_CATEGORIZATION_PREFIXES = ((1, "cds_type_"), (2, "cds_"), (3, "label_"))
+
 
 """get_category(): Return a key to use in the mapping structure that exists in the caller.
 
 
 This function takes input in the form of an open file handle (GenomeDiff file), the current template, features, and a
-categorization number which determines the logic for determining the key string to return."""
-def get_category(data, current_record, top_strand_features, categorization_number):
+categorization number which determines the logic for determining the key string to return. The CDS lists come from
+category_config (a CategoryConfig; the iGEM Spring 2015 lists by default)."""
+def get_category(data, current_record, top_strand_features, categorization_number, category_config=None):
 
      # Error strings
     err_no_cds = "Error: no cds found in current template."
 
-    # Enumerated lists
-    cfp_genes = ("bba_e0020",)
-    yfp_genes = ("bba_e0030", "bba_k592101", "bba_k864100")
-    bfp_genes = ("bba_k592100",)
-    cds_tuple = tuple(tuple(cfp_genes) + tuple(yfp_genes) + tuple(bfp_genes))
+    if category_config is None:
+        category_config = default_category_config
 
     identified_category = '' # we will use this as key in map in calling function
     if categorization_number == 1 or categorization_number == 2:
-        # Map genes to category (this can be moved in future versions)
-        gene_map = dict()
-        for item in cfp_genes:
-            gene_map[item.lower()] = "CFP"
-        for item in yfp_genes:
-            gene_map[item.lower()] = "YFP"
-        for item in bfp_genes:
-            gene_map[item.lower()] = "BFP"
-
         # Get type of CDS
-        cds = filter(lambda feat: feat.type == "CDS" and (feat.qualifiers['label'][0]).lower() in cds_tuple, top_strand_features)
+        cds = get_category_cds(top_strand_features, category_config)
         if not cds:
             print err_no_cds
             return 'None'
-        cds = cds[0] # get object from list
         cds_id = cds.qualifiers['label'][0].lower()
         if categorization_number ==1:
-            identified_category = gene_map[cds_id]
+            identified_category = category_config.gene_map[cds_id]
         identified_category = cds_id
 
     return identified_category
-"""parse_file_data(): parses information contained within .gd files.
+"""get_category_cds(): return the first CDS in features whose label is in category_config, or None."""
 
 
-This function encapsulates the map update functionality of the program to simplify the map update process.
-@input: data from a GenomeDiff file
-@output: GenomeDiffSequenceMap object
-"""
+def get_category_cds(features, category_config):
+    for feat in features:
+        if feat.type == "CDS" and (feat.qualifiers['label'][0]).lower() in category_config.gene_map:
+            return feat
+    return None
+"""get_cutoff(): return the position after which mutations are ignored (300 nt before the end of the category CDS)."""
 
 
-def parse_file_data(data, mutation_map, features, category):
-    # Get cutoff
+def get_cutoff(features, category):
     cutoff = None
-    curr_cds = filter(lambda feat: category in (feat.qualifiers['label'][0]).lower(), features)[0]
+    curr_cds = filter(lambda feat: category in (feat.qualifiers['label'][0]).lower(), features)
     if curr_cds:
-        cutoff = int(curr_cds.location.end) - 300
+        cutoff = int(curr_cds[0].location.end) - 300
         print "cutting off at", str(cutoff)
-    for line in data:
+    return cutoff
+"""get_analysis_plan(): return the AnalysisPlan for files mapped against reference, building it on first use.
+
+Plans are kept on the Reference, one per categorization number and CategoryConfig, so get_category and get_cutoff run
+once per reference instead of once per file. Categorization 3 (by label) counts every file into 'all'."""
+
+
+def get_analysis_plan(reference, categorization_number, category_config=None):
+    if category_config is None:
+        category_config = default_category_config
+    key = (categorization_number, category_config.key)
+    plan = reference.plans.get(key)
+    if plan is None:
+        with instrumentation.stage("analysis_plan"):
+            features = reference.top_strand_features
+            if categorization_number < 3:
+                category = get_category(None, reference.record, features, categorization_number, category_config)
+                cds = get_category_cds(features, category_config)
+                cutoff = get_cutoff(features, category)
+            else:
+                category = 'all'
+                cds = None
+                cutoff = get_cutoff(features, 'CDS')
+            plan = reference.plans[key] = AnalysisPlan(category, cds, cutoff, reference.feature_index)
+    return plan
+"""parse_file_data(): parses information contained within .gd files.
+
+
+This function encapsulates the map update functionality of the program to simplify the map update process.
+@input: data: GenomeDiffReader (or any iterable of GenomeDiffRecord) for a GenomeDiff file
+@input: feature_index: FeatureIndex built from features; built here if the caller does not supply one
+@input: plan: AnalysisPlan for the file's reference; when given, its cutoff and feature index are used
+@input: row_sink: optional MutationTableWriter that receives one row per counted mutation
+@input: histogram: optional PositionHistogram that receives the positions of the counted mutations
+@output: GenomeDiffSequenceMap object
+"""
+
 
-        split_line = re.split("\t", line)
+def parse_file_data(data, mutation_map, features, category, feature_index=None, plan=None, row_sink=None,
+                    histogram=None):
+    if plan is not None:
+        feature_index = plan.feature_index
+        cutoff = plan.cutoff
+        category = plan.category
+    else:
+        if feature_index is None:
+            feature_index = FeatureIndex(features)
+        cutoff = get_cutoff(features, category)
+    if row_sink is not None:
+        sample = getattr(data, "name", str(data))
+    counted_positions = []
+    histogram_reference = None
+    # Per-mutation timing is only done while instrumentation is enabled
+    timed = instrumentation.enabled
+    if timed:
+        file_start = time.time()
+        lookup_seconds = 0.0
+        update_seconds = 0.0
+    mutation_count = 0
+    skipped_count = 0
+    for record in data:
 
         # Common fields
-        mut_type = split_line[0]
+        mut_type = record.type
 
-        ref_seq = split_line[3] # Plasmid sequence name
+        ref_seq = record.seq_id # Plasmid sequence name
 
         # Unique fields
         position = ""
@@ -105,17 +170,22 @@ def parse_file_data(data, mutation_map, features, category):
             #code to handle missing coverage to appear in later versions
             pass
 
-        position = int(split_line[4])
+        position = record.position
         # Ignore mutations after the cutoff
         if cutoff and (position > cutoff):
+            skipped_count += 1
             continue
         # Update count based on feature
         containing_feature_type = None
         containing_feature_label = None
-        containing_feature = filter(lambda feat: position in feat.location, features)
+        if timed:
+            lookup_start = time.time()
+        containing_feature = feature_index.find(position)
+        if timed:
+            lookup_seconds += time.time() - lookup_start
         if (containing_feature):
-            containing_feature_type = containing_feature[0].type
-            containing_feature_label = containing_feature[0].qualifiers['label'][0]
+            containing_feature_type = containing_feature.type
+            containing_feature_label = containing_feature.qualifiers['label'][0]
             if 'BBa_K608002' in containing_feature_label:
                 print "found problem in", data, "at nt pos", str(position)
         else: # not within an annotation; we are currently counting these
@@ -126,20 +196,627 @@ def parse_file_data(data, mutation_map, features, category):
             print "IN:", str(data)
             print "TYPE:", mut_type
             print "AT:", str(position)
-        mutation_map.update_feature_map(containing_feature_label)
-        """Add a mapping of this label to its type for output."""
-        mutation_map.update_label_type_map(containing_feature_label, containing_feature_type)
+        # Update the type x feature count, the label -> type mapping used for output and the total count
+        if timed:
+            update_start = time.time()
+        mutation_map.add_mutation(mut_type, containing_feature_label, containing_feature_type)
+        if timed:
+            update_seconds += time.time() - update_start
+        if row_sink is not None:
+            row_sink.write(sample, ref_seq, mut_type, position, containing_feature_label, containing_feature_type,
+                           category)
+        if histogram is not None:
+            if histogram_reference is None:
+                histogram_reference = ref_seq.lower()
+            counted_positions.append(position)
+        mutation_count += 1
+
+    if counted_positions:
+        histogram.add(histogram_reference, counted_positions, feature_index)
+
+    if timed:
+        instrumentation.add("parse_file_data", time.time() - file_start)
+        instrumentation.add("feature_lookup", lookup_seconds, mutation_count)
+        instrumentation.add("map_update", update_seconds, mutation_count)
+        instrumentation.record_file(getattr(data, "name", str(data)), mutation_count, skipped_count)
+    return mutation_map
+
+"""parse_file_data_vectorized(): batch version of parse_file_data using NumPy.
+
+The positions and types of all records in the file are collected into arrays first. The cutoff is applied as a mask,
+features are assigned with a single searchsorted against the FeatureIndex segments, and the (feature, type) pairs are
+counted with bincount, so the map is updated once per distinct cell instead of once per mutation. Labels are entered
+into label_type_map in order of their first mutation, which keeps the result identical to parse_file_data.
+Unannotated mutations are reported as one summary line rather than one message each.
+
+Falls back to parse_file_data when NumPy is not installed."""
+
+
+def parse_file_data_vectorized(data, mutation_map, features, category, feature_index=None, plan=None, row_sink=None,
+                               histogram=None):
+    try:
+        import numpy as np
+    except ImportError:
+        return parse_file_data(data, mutation_map, features, category, feature_index, plan, row_sink, histogram)
+    if plan is not None:
+        feature_index = plan.feature_index
+        cutoff = plan.cutoff
+        category = plan.category
+    else:
+        if feature_index is None:
+            feature_index = FeatureIndex(features)
+        cutoff = get_cutoff(features, category)
+    timed = instrumentation.enabled
+    if timed:
+        file_start = time.time()
+
+    # Collect positions and interned type codes
+    types = []
+    type_codes = dict()
+    codes = []
+    positions = []
+    # Reference of each record, only needed for the row sink and the histogram
+    keep_seq_ids = row_sink is not None or histogram is not None
+    seq_ids = []
+    for record in data:
+        code = type_codes.get(record.type)
+        if code is None:
+            code = type_codes[record.type] = len(types)
+            types.append(record.type)
+        codes.append(code)
+        positions.append(record.position)
+        if keep_seq_ids:
+            seq_ids.append(record.seq_id)
+    if not positions:
+        return mutation_map
+    codes = np.array(codes, dtype=np.int64)
+    positions = np.array(positions, dtype=np.int64)
+    read_count = len(positions)
+    rows = xrange(read_count)
+
+    # Ignore mutations after the cutoff
+    if cutoff:
+        keep = positions <= cutoff
+        rows = np.flatnonzero(keep)
+        codes = codes[keep]
+        positions = positions[keep]
+        if not len(positions):
+            if timed:
+                instrumentation.add("parse_file_data", time.time() - file_start)
+                instrumentation.record_file(getattr(data, "name", str(data)), 0, read_count)
+            return mutation_map
+
+    if timed:
+        lookup_start = time.time()
+    # Segment lookup; owner is the feature number within features, or -1 outside all annotations
+    starts, owners = feature_index.get_arrays()
+    segments = np.searchsorted(starts, positions, side='right') - 1
+    owner = np.full(len(positions), -1, dtype=np.int64)
+    inside = segments >= 0
+    owner[inside] = owners[segments[inside]]
+    if timed:
+        instrumentation.add("feature_lookup", time.time() - lookup_start, len(positions))
+        update_start = time.time()
+
+    # Count (feature, type) cells; feature slot 0 is "None"
+    n_types = len(types)
+    cells = (owner + 1) * n_types + codes
+    cell_counts = np.bincount(cells)
+    unique_cells, first_seen = np.unique(cells, return_index=True)
+    for cell in unique_cells[np.argsort(first_seen)]:
+        feat_num = cell // n_types - 1
+        if feat_num < 0:
+            containing_feature_type = "None"
+            containing_feature_label = "None"
+        else:
+            containing_feature = feature_index.features[feat_num]
+            containing_feature_type = containing_feature.type
+            containing_feature_label = containing_feature.qualifiers['label'][0]
+        mutation_map.add_mutations(types[cell % n_types], containing_feature_label, containing_feature_type,
+                                   int(cell_counts[cell]))
+    if timed:
+        instrumentation.add("map_update", time.time() - update_start, len(positions))
+
+    if histogram is not None:
+        histogram.add(seq_ids[rows[0]].lower(), positions, feature_index)
+
+    if row_sink is not None:
+        sample = getattr(data, "name", str(data))
+        for row_num in xrange(len(positions)):
+            feat_num = owner[row_num]
+            if feat_num < 0:
+                containing_feature_type = "None"
+                containing_feature_label = "None"
+            else:
+                containing_feature = feature_index.features[feat_num]
+                containing_feature_type = containing_feature.type
+                containing_feature_label = containing_feature.qualifiers['label'][0]
+            row_sink.write(sample, seq_ids[rows[row_num]], types[codes[row_num]], int(positions[row_num]),
+                           containing_feature_label, containing_feature_type, category)
+
+    unannotated = int(np.count_nonzero(owner < 0))
+    if unannotated:
+        print "Found", unannotated, "mutations outside of annotations in", str(data)
+    if timed:
+        instrumentation.add("parse_file_data", time.time() - file_start)
+        instrumentation.record_file(getattr(data, "name", str(data)), len(positions), read_count - len(positions))
+    return mutation_map
+
+"""parse_file_data_multi(): count the records of one file into several maps with one feature lookup per record.
+
+targets is a list of (mutation_map, cutoff) pairs. Each record is counted into every map whose cutoff it does not
+exceed; a cutoff of None keeps every record. For instrumentation, a record counts as skipped when no map took it."""
+def parse_file_data_multi(data, targets, feature_index):
+    timed = instrumentation.enabled
+    if timed:
+        file_start = time.time()
+        lookup_seconds = 0.0
+        update_seconds = 0.0
+    mutation_count = 0
+    skipped_count = 0
+    # A record is skipped when it is past every cutoff, i.e. past the largest one, unless some map keeps everything
+    cutoffs = [cutoff for mutation_map, cutoff in targets]
+    skip_after = max(cutoffs) if all(cutoffs) else None
+    for record in data:
+        position = record.position
+        if skip_after is not None and position > skip_after:
+            skipped_count += 1
+            continue
+        if timed:
+            lookup_start = time.time()
+        containing_feature = feature_index.find(position)
+        if timed:
+            lookup_seconds += time.time() - lookup_start
+        if (containing_feature):
+            containing_feature_type = containing_feature.type
+            containing_feature_label = containing_feature.qualifiers['label'][0]
+            if 'BBa_K608002' in containing_feature_label:
+                print "found problem in", data, "at nt pos", str(position)
+        else: # not within an annotation; we are currently counting these
+            containing_feature_type = "None"
+            containing_feature_label = "None"
+            print "Found mutation outside of annotations."
+            print "IN:", str(data)
+            print "TYPE:", record.type
+            print "AT:", str(position)
+        if timed:
+            update_start = time.time()
+        for mutation_map, cutoff in targets:
+            # Ignore mutations after the cutoff
+            if cutoff and (position > cutoff):
+                continue
+            mutation_map.add_mutation(record.type, containing_feature_label, containing_feature_type)
+        if timed:
+            update_seconds += time.time() - update_start
+        mutation_count += 1
+
+    if timed:
+        instrumentation.add("parse_file_data", time.time() - file_start)
+        instrumentation.add("feature_lookup", lookup_seconds, mutation_count)
+        instrumentation.add("map_update", update_seconds, mutation_count)
+        instrumentation.record_file(getattr(data, "name", str(data)), mutation_count, skipped_count)
+    return targets
+
+
+"""parse_gd_records_cds(): parse the records of one .gd file into the map in cat_map selected by get_category().
+
+records is a GenomeDiffReader positioned at the first record. Returns the name of the reference the file was mapped
+against, or None if the file has no records."""
+def parse_gd_records_cds(records, cat_map, categorization_number, reference_cache, vectorized=False,
+                         category_config=None, row_sink=None, histogram=None):
+
+    # Define string constants
+    err_no_plasmid = "Error: no plasmid file found: "
+    err_no_category = "Error: sample category not defined."
 
-        # Update other counts based on detailed mappings
-        mutation_map.update_type_feat_map(mut_type, containing_feature_label)
-        mutation_map.update_feat_type_map(containing_feature_label, mut_type)
+    first_record = records.peek()
+    if not(first_record): # no mutations
+        return
+    ref_seq_name = first_record.seq_id.lower()
+    reference = reference_cache.get(ref_seq_name)
+    if not(reference):
+        print err_no_plasmid + ref_seq_name + "\n"
+        return ref_seq_name
+    top_strand_features = reference.top_strand_features
+    # Determine category key in category map
+    plan = get_analysis_plan(reference, categorization_number, category_config)
+    category = plan.category
+    if not cat_map.get(category):
+        print err_no_category
+        return ref_seq_name
+    parse_data = parse_file_data_vectorized if vectorized else parse_file_data
+    temp_map = parse_data(records, cat_map[category], top_strand_features, category, plan=plan, row_sink=row_sink,
+                          histogram=histogram)
+
+    if (temp_map):
+        cat_map[category] = temp_map
+    return ref_seq_name
+
+
+"""parse_gd_records_labels(): parse the records of one .gd file into cat_map['all']."""
+def parse_gd_records_labels(records, cat_map, reference_cache, vectorized=False, row_sink=None, histogram=None):
+    print os.path.basename(records.name), "...\r"
+    first_record = records.peek()
+    if not(first_record): # no mutations
+        return
+    ref_seq_name = first_record.seq_id.lower()
+    reference = reference_cache.get(ref_seq_name)
+    if not(reference):
+        print "nope: " + ref_seq_name + "\n"
+        return ref_seq_name
+    plan = get_analysis_plan(reference, 3)
+    parse_data = parse_file_data_vectorized if vectorized else parse_file_data
+    temp_map = parse_data(records, cat_map['all'], reference.top_strand_features, 'CDS', plan=plan, row_sink=row_sink,
+                          histogram=histogram)
+    if temp_map:
+        cat_map['all'] = temp_map
+    return ref_seq_name
+
+
+"""parse_gd_records_all(): count the records of one .gd file into the maps of several categorizations at once.
+
+cat_maps maps categorization numbers (1 = CDS type, 2 = specific CDS, 3 = label) to their cat_map. The reference, its
+plans and each mutation's feature lookup are shared by all of them. Plans with the same cutoff count the same records
+(categorizations 1 and 2 always do), so the file is counted once per distinct cutoff and that count is merged into
+each of their maps."""
+def parse_gd_records_all(records, cat_maps, reference_cache, category_config=None):
+    err_no_plasmid = "Error: no plasmid file found: "
+    err_no_category = "Error: sample category not defined."
 
-        # Update count based on mutation type
-        mutation_map.update_type_map(mut_type)
-        # Update total count
-        mutation_map.update_count()
+    print os.path.basename(records.name), "...\r"
+    first_record = records.peek()
+    if not(first_record): # no mutations
+        return
+    ref_seq_name = first_record.seq_id.lower()
+    reference = reference_cache.get(ref_seq_name)
+    if not(reference):
+        print err_no_plasmid + ref_seq_name + "\n"
+        return ref_seq_name
+    # cutoff -> the maps counted with it, in categorization order
+    maps_by_cutoff = dict()
+    cutoffs = []
+    for categorization_number in sorted(cat_maps):
+        plan = get_analysis_plan(reference, categorization_number, category_config)
+        mutation_map = cat_maps[categorization_number].get(plan.category)
+        if not mutation_map:
+            print err_no_category
+            continue
+        if plan.cutoff not in maps_by_cutoff:
+            maps_by_cutoff[plan.cutoff] = []
+            cutoffs.append(plan.cutoff)
+        maps_by_cutoff[plan.cutoff].append(mutation_map)
+    if not cutoffs:
+        return ref_seq_name
+    # A map of its own cutoff is counted into directly; shared cutoffs are counted once into a fresh map
+    targets = []
+    for cutoff in cutoffs:
+        mutation_maps = maps_by_cutoff[cutoff]
+        targets.append((mutation_maps[0] if len(mutation_maps) == 1 else GenomeDiffSequenceMap(), cutoff))
+    parse_file_data_multi(records, targets, reference.feature_index)
+    for counted_map, cutoff in targets:
+        mutation_maps = maps_by_cutoff[cutoff]
+        if len(mutation_maps) > 1:
+            for mutation_map in mutation_maps:
+                mutation_map.merge(counted_map)
+    return ref_seq_name
+
+
+"""parse_gd_records(): dispatch to the records parser for categorization_number (3 = by label)."""
+def parse_gd_records(records, cat_map, categorization_number, reference_cache, vectorized=False,
+                     category_config=None, row_sink=None, histogram=None):
+    if categorization_number < 3:
+        return parse_gd_records_cds(records, cat_map, categorization_number, reference_cache, vectorized,
+                                    category_config, row_sink, histogram)
+    return parse_gd_records_labels(records, cat_map, reference_cache, vectorized, row_sink, histogram)
+
+
+"""parse_gd_file_cds(): parse one .gd file into the map in cat_map selected by get_category().
+
+Shared by the serial loop in parse_files_cds and by the process pool workers. With mapped set, the file is scanned
+through mmap by MappedGenomeDiffReader; the counts are the same either way. With skip_evidence set, evidence lines are
+not counted (see open_genomediff)."""
+def parse_gd_file_cds(gd_path, cat_map, categorization_number, reference_cache, vectorized=False, mapped=False,
+                      category_config=None, row_sink=None, histogram=None, skip_evidence=False):
+    with open_genomediff(gd_path, mapped, skip_evidence) as records:
+        return parse_gd_records_cds(records, cat_map, categorization_number, reference_cache, vectorized,
+                                    category_config, row_sink, histogram)
+
+
+"""parse_gd_file_labels(): parse one .gd file into cat_map['all']."""
+def parse_gd_file_labels(gd_path, cat_map, reference_cache, vectorized=False, mapped=False, row_sink=None,
+                         histogram=None, skip_evidence=False):
+    with open_genomediff(gd_path, mapped, skip_evidence) as records:
+        return parse_gd_records_labels(records, cat_map, reference_cache, vectorized, row_sink, histogram)
+
+
+"""parse_gd_file_all(): parse one .gd file into the maps of every categorization in cat_maps."""
+def parse_gd_file_all(gd_path, cat_maps, reference_cache, mapped=False, category_config=None, skip_evidence=False):
+    with open_genomediff(gd_path, mapped, skip_evidence) as records:
+        return parse_gd_records_all(records, cat_maps, reference_cache, category_config)
+
+
+"""parse_gd_file(): parse one .gd file with the parser for categorization_number (3 = by label).
+
+Returns the name of the reference the file was mapped against, or None if the file has no records."""
+def parse_gd_file(gd_path, cat_map, categorization_number, reference_cache, vectorized=False, mapped=False,
+                  category_config=None, row_sink=None, histogram=None, skip_evidence=False):
+    with open_genomediff(gd_path, mapped, skip_evidence) as records:
+        return parse_gd_records(records, cat_map, categorization_number, reference_cache, vectorized, category_config,
+                                row_sink, histogram)
+
+
+"""Pipelined prefetch.
+
+Reader threads load whole .gd files into memory, parse their headers and resolve (load and cache) their references
+while the main thread is still counting earlier files. A reader must take a slot from a semaphore of queue_depth slots
+before it claims the next file, and the counting stage gives the slot back once that file has been counted. At most
+queue_depth files are therefore in flight, and because files are claimed in order, the file the counting stage is
+waiting for always holds a slot. Files are counted strictly in input order, so the result is identical to a serial
+run.
+
+gd_paths may be a lazy iterator (see FileDiscovery); readers take paths from it as they claim files, so discovery
+overlaps with reading and counting. With mapped set, readers map the files (MappedGenomeDiffReader) instead of reading
+them into memory; with skip_evidence set, the readers drop evidence lines.
+
+When a file fails, the counting stage sets stop and releases a slot per reader, so readers waiting for a slot wake up
+and exit; it then joins them and closes every file they had already loaded."""
+def _prefetch_reader(path_iterator, next_file, claim_lock, slots, ready, reference_cache, mapped=False, stop=None,
+                     skip_evidence=False):
+    while True:
+        slots.acquire()
+        if stop is not None and stop.is_set():
+            return
+        with claim_lock:
+            file_num = next_file[0]
+            next_file[0] += 1
+            try:
+                gd_path = next(path_iterator, None)
+            except Exception:
+                gd_path = None
+                ready.put((file_num, None, sys.exc_info()))
+        if gd_path is None:
+            # (file_num, None, None) tells the counting stage there are no more files
+            ready.put((file_num, None, None))
+            slots.release()
+            return
+        try:
+            if mapped:
+                records = MappedGenomeDiffReader(gd_path, skip_evidence)
+            else:
+                with open(gd_path, "r") as handle:
+                    content = handle.read()
+                records = GenomeDiffReader(StringIO(content), gd_path, skip_evidence)
+            first_record = records.peek()
+            if first_record:
+                reference_cache.get(first_record.seq_id.lower())
+            ready.put((file_num, records, None))
+        except Exception:
+            ready.put((file_num, None, sys.exc_info()))
+
+
+def parse_files_pipelined(cat_map, categorization_number, gd_paths, reference_cache, readers, queue_depth=16,
+                          vectorized=False, mapped=False, category_config=None, row_sink=None, histogram=None,
+                          skip_evidence=False):
+    path_iterator = iter(gd_paths)
+    next_file = [0]
+    claim_lock = threading.Lock()
+    slots = threading.Semaphore(max(queue_depth, 1))
+    ready = Queue.Queue()
+    stop = threading.Event()
+    threads = []
+    for i in range(readers):
+        thread = threading.Thread(target=_prefetch_reader, args=(path_iterator, next_file, claim_lock, slots, ready,
+                                                                 reference_cache, mapped, stop, skip_evidence))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    pending = dict()
+    records = None
+    file_num = 0
+    try:
+        while True:
+            while file_num not in pending:
+                ready_num, loaded, error = ready.get()
+                # A failed claim and the end marker may share a number; the failure wins
+                if ready_num not in pending or error:
+                    pending[ready_num] = (loaded, error)
+            records, error = pending.pop(file_num)
+            file_num += 1
+            if error:
+                raise error[0], error[1], error[2]
+            if records is None:
+                break
+            parse_gd_records(records, cat_map, categorization_number, reference_cache, vectorized, category_config,
+                             row_sink, histogram)
+            records.close()
+            records = None
+            slots.release()
+    finally:
+        # After a failure readers may be waiting for slots that will never be given back
+        stop.set()
+        for thread in threads:
+            slots.release()
+        for thread in threads:
+            thread.join()
+        if records is not None:
+            records.close()
+        while not ready.empty():
+            ready_num, loaded, error = ready.get()
+            pending[ready_num] = (loaded, error)
+        for loaded, error in pending.values():
+            if loaded is not None:
+                loaded.close()
+    print reference_cache.summary()
+    return cat_map
+
+
+"""Process pool workers.
+
+Each worker process keeps its own ReferenceCache for the whole run and parses a contiguous chunk of files into fresh
+partial maps, one per category, and a partial PositionHistogram when the run keeps one. The parent merges the partials
+back in chunk order, so the result is identical to a serial run."""
+_worker_reference_cache = None
+
+
+def _init_worker(plasmid_dir, reference_source, instrumented):
+    global _worker_reference_cache
+    _worker_reference_cache = ReferenceCache(plasmid_dir, loader=REFERENCE_LOADERS[reference_source])
+    if instrumented:
+        instrumentation.enable()
+    return
+
+
+def _parse_chunk(args):
+    gd_paths, categories, categorization_number, vectorized, mapped, category_config, bin_width, skip_evidence = args
+    partial_map = dict()
+    for category in categories:
+        partial_map[category] = GenomeDiffSequenceMap()
+    partial_histogram = None
+    if bin_width is not None:
+        from PositionHistogram import PositionHistogram
+        partial_histogram = PositionHistogram(bin_width)
+    instrumentation.reset()
+    for gd_path in gd_paths:
+        parse_gd_file(gd_path, partial_map, categorization_number, _worker_reference_cache, vectorized, mapped,
+                      category_config, histogram=partial_histogram, skip_evidence=skip_evidence)
+    # The worker's timings travel back with its partial maps
+    report = instrumentation.report() if instrumentation.enabled else None
+    return partial_map, report, partial_histogram
+
+
+def _iter_chunks(gd_paths, chunk_size):
+    chunk = []
+    for gd_path in gd_paths:
+        chunk.append(gd_path)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+"""parse_files_parallel(): spread gd_paths over a pool of worker processes and merge the partials into cat_map.
+
+gd_paths may be a lazy iterator; the pool then hands out chunks of STREAM_CHUNK_SIZE files while discovery goes on."""
+STREAM_CHUNK_SIZE = 32
+
+
+def parse_files_parallel(cat_map, categorization_number, gd_paths, plasmid_dir, workers, vectorized=False,
+                         reference_source="compiled", mapped=False, category_config=None, histogram=None,
+                         skip_evidence=False):
+    if hasattr(gd_paths, "__len__"):
+        # Several chunks per worker keeps the pool busy when file sizes vary.
+        chunk_size = max(1, len(gd_paths) // (workers * 4))
+    else:
+        chunk_size = STREAM_CHUNK_SIZE
+    categories = cat_map.keys()
+    bin_width = histogram.bin_width if histogram is not None else None
+    chunks = ((chunk, categories, categorization_number, vectorized, mapped, category_config, bin_width, skip_evidence)
+              for chunk in _iter_chunks(gd_paths, chunk_size))
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, _init_worker, (plasmid_dir, reference_source, instrumentation.enabled))
+    try:
+        for partial_map, report, partial_histogram in pool.imap(_parse_chunk, chunks):
+            for category in partial_map:
+                cat_map[category].merge(partial_map[category])
+            if partial_histogram is not None:
+                histogram.merge(partial_histogram)
+            if report:
+                instrumentation.merge(report)
+    finally:
+        pool.close()
+        pool.join()
+    return cat_map
+
+
+"""parse_files_incremental(): parse gd_paths into cat_map, reusing the per-file results stored in a ResultManifest.
+
+A file is reused when its size and mtime (or, after a touch, its content hash) are unchanged and the reference it was
+mapped against still has the same content hash, and the run uses the same CDS lists and skip_evidence setting as the
+run that stored it (the reader mode does not change the counts, so mapped and line-read runs share results).
+Everything else is parsed into a fresh partial map per category and stored. Partials are merged in file order, so the
+result is identical to a full serial run.
+Stored files that were not seen are removed from the manifest; with scope set (see FileDiscovery.in_scope), only those
+the run would have scanned, so runs over other directories, patterns or shards can share the manifest."""
+def parse_files_incremental(cat_map, categorization_number, gd_paths, reference_cache, manifest_path,
+                            vectorized=False, mapped=False, category_config=None, skip_evidence=False, scope=None):
+    from ResultManifest import ResultManifest
+    manifest = ResultManifest(manifest_path)
+    reference_hashes = dict()
+    # A file's counts depend on the CDS lists and on whether evidence lines are counted as well as on its reference;
+    # any other option that can change them belongs in this key too
+    config_key = (category_config or default_category_config).key + (":skip_evidence" if skip_evidence else "")
+
+    def reference_hash(name):
+        if name not in reference_hashes:
+            gb_path = reference_cache.plasmid_dir + name + ".gb"
+            gb_hash = hexlify(file_hash(gb_path)) if os.path.exists(gb_path) else ""
+            reference_hashes[name] = gb_hash + ":" + config_key
+        return reference_hashes[name]
+
+    reused_count = 0
+    parsed_count = 0
+    seen_paths = []
+    try:
+        for gd_path in gd_paths:
+            seen_paths.append(gd_path)
+            stat = os.stat(gd_path)
+            content_hash = None
+            entry = manifest.lookup(gd_path, categorization_number)
+            if entry and entry.size == stat.st_size:
+                unchanged = entry.mtime == stat.st_mtime
+                if not unchanged:
+                    content_hash = hexlify(file_hash(gd_path))
+                    unchanged = entry.content_hash == content_hash
+                if unchanged and (entry.reference is None or entry.reference_hash == reference_hash(entry.reference)):
+                    if entry.mtime != stat.st_mtime:
+                        manifest.touch(gd_path, categorization_number, stat.st_mtime)
+                    partial_map = entry.get_partial_map()
+                    for category in partial_map:
+                        cat_map[category].merge(partial_map[category])
+                    reused_count += 1
+                    continue
+
+            partial_map = dict()
+            for category in cat_map:
+                partial_map[category] = GenomeDiffSequenceMap()
+            ref_seq_name = parse_gd_file(gd_path, partial_map, categorization_number, reference_cache, vectorized,
+                                         mapped, category_config, skip_evidence=skip_evidence)
+            # Only the categories this file contributed to are stored
+            for category in partial_map.keys():
+                if partial_map[category].get_count() == 0:
+                    del partial_map[category]
+                else:
+                    cat_map[category].merge(partial_map[category])
+            if content_hash is None:
+                content_hash = hexlify(file_hash(gd_path))
+            ref_hash = reference_hash(ref_seq_name) if ref_seq_name is not None else ""
+            manifest.store(gd_path, categorization_number, stat.st_size, stat.st_mtime, content_hash, ref_seq_name,
+                           ref_hash, partial_map)
+            parsed_count += 1
+        pruned_count = manifest.prune(categorization_number, seen_paths, scope)
+    finally:
+        manifest.close()
+    print "Incremental run:", reused_count, "files reused,", parsed_count, "parsed,", pruned_count, "removed."
+    return cat_map
+
+
+"""discover_gd_files(): return a lazy stream of the files under input_dir matching pattern, with a running count.
+
+shard is an optional (index, count) pair; only the files of that shard (see FileDiscovery.select_shard) are kept."""
+def discover_gd_files(input_dir, pattern=DEFAULT_PATTERN, shard=None):
+    print "Scanning input directory and processing files:"
+    gd_paths = iter_gd_files(input_dir, pattern)
+    if shard is not None:
+        gd_paths = select_shard(gd_paths, input_dir, shard[0], shard[1])
+    return report_progress(gd_paths)
+
+
+"""list_gd_files(): return the paths of all files under input_dir matching pattern (see FileDiscovery.iter_gd_files)."""
+def list_gd_files(input_dir, pattern=DEFAULT_PATTERN):
+    return list(iter_gd_files(input_dir, pattern))
 
-    return mutation_map
 
 """Parse genomediff files for statistical information about sample mutations.
 
@@ -149,82 +826,122 @@ count-based data on mutations.
 Precondition: Correctly formatted Genomediff files with tab-separated fields."""
 
 
-def parse_files_cds(cat_map, categorization_number, input_dir, output_dir, plasmid_dir):
-    """Parse information from .gd files into a map organized by CDS."""
+"""check_row_sink(): refuse the modes a row sink or histogram cannot follow.
+
+Worker processes cannot write to the parent's sink, and an incremental run reuses the counts of unchanged files without
+reading them, so their rows and positions would be missing."""
+def check_row_sink(row_sink, workers, manifest_path, histogram=None):
+    if row_sink is not None and workers > 1:
+        raise ValueError("a row sink can only be used with workers=1")
+    if manifest_path and (row_sink is not None or histogram is not None):
+        raise ValueError("a row sink or histogram cannot be used with an incremental (manifest_path) run")
+
+
+def parse_files_cds(cat_map, categorization_number, input_dir, output_dir, plasmid_dir, reference_cache=None,
+                    workers=1, vectorized=False, reference_source="compiled", manifest_path=None, prefetch_readers=0,
+                    queue_depth=16, mapped=False, category_config=None, pattern=DEFAULT_PATTERN,
+                    shard=None, row_sink=None, histogram=None, skip_evidence=False):
+    """Parse information from .gd files into a map organized by CDS.
+
+    The files under input_dir (recursively) whose names match pattern are discovered lazily and fed to the parser as
+    they are found. With shard set to (index, count), only that shard of the files is parsed.
+
+    References are loaded through reference_cache; if none is given, a fresh ReferenceCache for plasmid_dir is created
+    that loads references with REFERENCE_LOADERS[reference_source] ("compiled", "genbank" or "scan").
+    With workers > 1 the files are parsed in a process pool; each worker process keeps its own reference cache.
+    With vectorized set, each file is counted in one batch by parse_file_data_vectorized (requires NumPy).
+    With manifest_path set, the run is incremental (see parse_files_incremental) and always serial.
+    With prefetch_readers > 0, that many reader threads prefetch up to queue_depth files and their references ahead of
+    the counting stage (see parse_files_pipelined).
+    With mapped set, files are scanned through mmap (MappedGenomeDiffReader); the counts are the same either way.
+    With skip_evidence set, evidence lines (RA, MC, JC, UN) are dropped by the reader and not counted. This is off by
+    default because it changes the counts; on files that are mostly evidence it is much faster, in particular with
+    mapped set.
+    category_config (a CategoryConfig) gives the CDS lists used to categorize files; the defaults are the iGEM lists.
+    row_sink (a MutationTableWriter) receives one row per counted mutation in the serial and prefetch modes.
+    histogram (a PositionHistogram) receives the positions of the counted mutations in every mode but the incremental
+    one."""
+
+    if reference_cache is None:
+        reference_cache = ReferenceCache(plasmid_dir, loader=REFERENCE_LOADERS[reference_source])
+
+    check_row_sink(row_sink, workers, manifest_path, histogram)
+    gd_paths = discover_gd_files(input_dir, pattern, shard)
+    if manifest_path:
+        scope = lambda gd_path: in_scope(gd_path, input_dir, pattern, shard)
+        return parse_files_incremental(cat_map, categorization_number, gd_paths, reference_cache, manifest_path,
+                                       vectorized, mapped, category_config, skip_evidence, scope)
+    if workers > 1:
+        return parse_files_parallel(cat_map, categorization_number, gd_paths, plasmid_dir, workers, vectorized,
+                                    reference_source, mapped, category_config, histogram, skip_evidence)
+    if prefetch_readers > 0:
+        return parse_files_pipelined(cat_map, categorization_number, gd_paths, reference_cache, prefetch_readers,
+                                     queue_depth, vectorized, mapped, category_config, row_sink, histogram,
+                                     skip_evidence)
+    for gd_path in gd_paths:
+        parse_gd_file_cds(gd_path, cat_map, categorization_number, reference_cache, vectorized, mapped, category_config,
+                          row_sink, histogram, skip_evidence)
+
+    print reference_cache.summary()
+    return cat_map
 
-    # Define string constants
-    err_no_plasmid = "Error: no plasmid file found: "
-    err_no_category = "Error: sample category not defined."
 
-    print "Scanning input directory..."
-    file_count = 0
-    for dirName, subdirList, fileList in os.walk(input_dir):
-        for f in fileList:
-            file_count +=1
-    print "Found", file_count, "files."
-    print "Processing files:"
-    for dirName, subdirList, fileList in os.walk(input_dir):
-        for gdFile in fileList:
-            with open(input_dir+gdFile, "r") as data:
-                # Obtain a SeqRecord containing all info from Genbank file
-                first_line = data.readline()
-                second_line = data.readline()
-                if not(second_line): # no mutations
-                    continue
-                data.seek(18) # return to beginning of second line
-                ref_seq_name = (re.split("\t", second_line)[3]).lower()
-                current_record = SeqIO.read(plasmid_dir+ref_seq_name+".gb", "genbank")
-                if not(current_record):
-                    print err_no_plasmid + ref_seq_name + "\n"
-                    continue
-                # Filter by strand (no duplicate features)
-                top_strand_features = filter(lambda item: item.strand == 1, current_record.features)
-                # Determine category key in category map
-                category = get_category(data, current_record, top_strand_features, categorization_number)
-                if not cat_map[category]:
-                    print err_no_category
-                    continue
-                temp_map = parse_file_data(data, cat_map[category], top_strand_features, category)
-                
-                if (temp_map):
-                    cat_map[category] = temp_map
+def parse_file_labels(cat_map, input_dir, output_dir, plasmid_dir, reference_cache=None, workers=1,
+                      vectorized=False, reference_source="compiled", manifest_path=None, prefetch_readers=0,
+                      queue_depth=16, mapped=False, pattern=DEFAULT_PATTERN, shard=None, row_sink=None,
+                      histogram=None, skip_evidence=False):
+    """Parse samples based on labels.
+
+    The options are those of parse_files_cds."""
+    if reference_cache is None:
+        reference_cache = ReferenceCache(plasmid_dir, loader=REFERENCE_LOADERS[reference_source])
+    check_row_sink(row_sink, workers, manifest_path, histogram)
+    gd_paths = discover_gd_files(input_dir, pattern, shard)
+    if manifest_path:
+        scope = lambda gd_path: in_scope(gd_path, input_dir, pattern, shard)
+        return parse_files_incremental(cat_map, 3, gd_paths, reference_cache, manifest_path, vectorized, mapped,
+                                       skip_evidence=skip_evidence, scope=scope)
+    if workers > 1:
+        return parse_files_parallel(cat_map, 3, gd_paths, plasmid_dir, workers, vectorized, reference_source, mapped,
+                                    histogram=histogram, skip_evidence=skip_evidence)
+    if prefetch_readers > 0:
+        return parse_files_pipelined(cat_map, 3, gd_paths, reference_cache, prefetch_readers, queue_depth, vectorized,
+                                     mapped, row_sink=row_sink, histogram=histogram, skip_evidence=skip_evidence)
+    for gd_path in gd_paths:
+        parse_gd_file_labels(gd_path, cat_map, reference_cache, vectorized, mapped, row_sink, histogram, skip_evidence)
+
+    print reference_cache.summary()
+    return cat_map
 
 
+def parse_files_all(cat_maps, input_dir, output_dir, plasmid_dir, reference_cache=None, reference_source="compiled",
+                    mapped=False, category_config=None, pattern=DEFAULT_PATTERN, shard=None, skip_evidence=False):
+    """Parse .gd files into the maps of several categorizations in a single pass.
 
+    cat_maps maps categorization numbers (1 = CDS type, 2 = specific CDS, 3 = label) to cat_maps as built by
+    new_category_map. Each file is read once and each mutation is looked up once for all of them. mapped and
+    skip_evidence are as in parse_files_cds."""
+    if reference_cache is None:
+        reference_cache = ReferenceCache(plasmid_dir, loader=REFERENCE_LOADERS[reference_source])
+    gd_paths = discover_gd_files(input_dir, pattern, shard)
+    for gd_path in gd_paths:
+        parse_gd_file_all(gd_path, cat_maps, reference_cache, mapped, category_config, skip_evidence)
 
-    return cat_map
+    print reference_cache.summary()
+    return cat_maps
 
 
-def parse_file_labels(cat_map, input_dir, output_dir, plasmid_dir):
-    """Parse samples based on labels."""
-    print "Scanning input directory..."
-    file_count = 0
-    for dirName, subdirList, fileList in os.walk(input_dir):
-        for f in fileList:
-            file_count +=1
-    print "Found", file_count, "files."
-    print "Processing files:"
-    for dirName, subdirList, fileList in os.walk(input_dir):
-        for gdFile in fileList:
-            with open(input_dir+gdFile, "r") as data:
-                print gdFile, "...\r"
-                # Obtain a SeqRecord containing all info from Genbank file
-                first_line = data.readline()
-                second_line = data.readline()
-                if not(second_line): # no mutations
-                    continue
-                data.seek(18) # return to beginning of second line
-                ref_seq_name = (re.split("\t", second_line)[3]).lower()
-                current_record = SeqIO.read(plasmid_dir+ref_seq_name+".gb", "genbank")
-                if not(current_record):
-                    print "nope: " + ref_seq_name + "\n"
-                    continue
-                # Filter by strand (no duplicate features)
-                top_strand_features = filter(lambda item: item.strand == 1, current_record.features)
-                temp_map = parse_file_data(data, cat_map['all'], top_strand_features, 'CDS')
-                if temp_map:
-                    cat_map['all'] = temp_map
-
+"""new_category_map(): return an empty cat_map for categorization_number (1 = CDS type, 2 = specific CDS, 3 = label)."""
+def new_category_map(categorization_number, category_config=None):
+    if category_config is None:
+        category_config = default_category_config
+    cat_map = dict()
+    if categorization_number in (1, 2):
+        # Both are keyed by CDS id: get_category returns the specific CDS for categorization 1 as well
+        for cds in category_config.cds_labels:
+            cat_map[cds] = GenomeDiffSequenceMap()
+    elif categorization_number == 3:
+        cat_map['all'] = GenomeDiffSequenceMap()
     return cat_map
 """Map individual reference sequences onto their respective category.
 
@@ -234,6 +951,7 @@ def parse_file_labels(cat_map, input_dir, output_dir, plasmid_dir):
 
 
 def get_genbank_info(handle):
+    from Bio import SeqIO
 
     # Map reference sequences onto CDS categories
     genbank_record = SeqIO.read(handle, "genbank")
@@ -260,14 +978,7 @@ def main():
     # This dictionary maps categories to their GenomeDiffSequenceMap objects.
     cat_map = dict()
 
-    # Category defaults (add more in later version)
-    cds_categories = ("YFP", "BFP", "CFP")
-
-    # Enumerated lists
-    cfp_genes = ("bba_e0020",)
-    yfp_genes = ("bba_e0030", "bba_k592101", "bba_k864100")
-    bfp_genes = ("bba_k592100",)
-    cds_tuple = tuple(tuple(cfp_genes) + tuple(yfp_genes) + tuple(bfp_genes))
+    err_category_config = "Error: could not read the CDS category file: "
 
     # Defaults for user input
     INPUT_DIR_DEFAULT = "genomediff/"
@@ -283,15 +994,33 @@ def main():
         cat_num = input(("1. By coding sequence type (uses iGEM Spring 2015 CDS list)\n" +
                          "2. By specific CDS (iGEM Spring 2015 CDS list)\n" +
                          "3. By label\n" +
-                         "4. By RBS strength\n"))
-        if (cat_num < 1 or cat_num > 4):
+                         "4. By RBS strength\n" +
+                         "5. By CDS type, specific CDS and label (one pass)\n"))
+        if (cat_num < 1 or cat_num > 5):
             print err_bad_category
             continue
-        elif(cat_num in range(1, 5)):
+        elif(cat_num in range(1, 6)):
             done = True
         else:
             print err_bad_category
 
+    done = False
+    category_config = default_category_config
+    while not(done):
+        user_input = raw_input("Please specify the CDS category lists.\n1. Default (iGEM Spring 2015 CDS list)\n2. " +
+                               "Custom (JSON file)\n")
+        if (user_input == "1"):
+            done = True
+            continue
+        if (user_input == "2"):
+            config_path = raw_input("Path to the category file: ")
+            try:
+                category_config = load_category_config(config_path)
+            except (IOError, ValueError) as e:
+                print err_category_config + str(e)
+                continue
+            done = True
+
     done = False
     user_plasmid_dir = ""
     while not(done):
@@ -358,29 +1087,25 @@ def main():
 
     # Create the maps organized by category.
     categorization_number = 0
-    # Categorize by CDS
-    if (cat_num == 1):
-        # Initialize each dictionary containing
-        for category in cds_tuple:
-            cat_map[category] = GenomeDiffSequenceMap()
-        categorization_number = 1
-
-    # Categorize by specific CDS
-    if (cat_num == 2):
-        for cds in cds_tuple:
-            cat_map[cds] = GenomeDiffSequenceMap()
-        categorization_number = 2
-
-    # Categorize by label
-    if (cat_num == 3):
-        cat_map['all'] = GenomeDiffSequenceMap()
-        categorization_number = 3
+    # Categorize by CDS, by specific CDS or by label
+    if (cat_num in (1, 2, 3)):
+        cat_map = new_category_map(cat_num, category_config)
+        categorization_number = cat_num
 
     new_map = None
     print "Parsing genomediff files.\n"
-    if categorization_number < 3:
+    if (cat_num == 5):
+        # All three categorizations in one pass; each gets its own set of output files
+        cat_maps = dict()
+        for categorization_number in (1, 2, 3):
+            cat_maps[categorization_number] = new_category_map(categorization_number, category_config)
+        parse_files_all(cat_maps, user_input_dir, user_output_dir, user_plasmid_dir, category_config=category_config)
+        for categorization_number, prefix in ALL_CATEGORIZATION_PREFIXES:
+            write_reports(cat_maps[categorization_number], prefix)
+        return
+    if 0 < categorization_number < 3:
         new_map = parse_files_cds(cat_map, categorization_number, user_input_dir, user_output_dir,
-                                  user_plasmid_dir)
+                                  user_plasmid_dir, category_config=category_config)
     elif categorization_number == 3:
         new_map = parse_file_labels(cat_map, user_input_dir, user_output_dir, user_plasmid_dir)
 
@@ -390,7 +1115,7 @@ def main():
         user_input = raw_input("Choose output type.\n1. CSV: Organize by mutation type\n2. " +
                                "CSV: Organize by label\n")
         if (user_input == "1"):
-            output_muttype_csv()
+            output_muttype_csv(new_map)
             done = True
             continue
         if (user_input == "2"):
@@ -399,80 +1124,23 @@ def main():
             continue
 
 
-def output_label_csv(new_map):
-
-    master_feat_type_map = dict()
-    master_counter = Counter(master_feat_type_map)
-    x = 1
-    for k in new_map.keys():
-        with open("output"+str(x)+".csv", "a") as of:
-            header= ",MOB,INS,DEL,SNP,TOTAL\n"
-            of.write(header)
-            for feat in new_map[k].feat_type_map.keys():
-                curr_mob_count = 0
-                curr_ins_count = 0
-                curr_del_count = 0
-                curr_snp_count = 0
-                curr_feat = new_map[k].feat_type_map[feat]
-                if 'MOB' in curr_feat:
-                    curr_mob_count = curr_feat['MOB']
-                if 'INS' in curr_feat:
-                    curr_ins_count = curr_feat['INS']
-                if 'DEL' in curr_feat:
-                    curr_del_count = curr_feat['DEL']
-                if 'SNP' in curr_feat:
-                    curr_snp_count = curr_feat['SNP']
-                data_write = (str(feat) + "," + str(curr_mob_count) + "," + str(curr_ins_count) + "," +
-                              str(curr_del_count) + "," + str(curr_snp_count) + "\n")
-                of.write(data_write)
-        x += 1
-    return
-
-def output_muttype_csv(new_map):
-
-    total_count = 0
-    snp_total = 0
-    mob_total = 0
-    ins_total = 0
-    deletions_total = 0
-    with open("output.csv", "a") as of:
-        header= ",MOB,INS,DEL,SNP,TOTAL\n"
-        of.write(header)
-        for k in new_map.keys():
-            data_lst = new_map[k].output_type_csv()
-            print new_map[k].feat_type_map
-            # Update totals
-            mob_total += data_lst[0]
-            ins_total += data_lst[1]
-            deletions_total += data_lst[2]
-            snp_total += data_lst[3]
-            curr_total = data_lst[0] + data_lst[1] + data_lst[2] + data_lst[3]
-            total_count += curr_total
-            data_write = (str(k) + "," + str(data_lst[0]) + "," + str(data_lst[1]) + "," + str(data_lst[2]) +
-            "," + str(data_lst[3]) + "," + str(curr_total) + "\n")
-            of.write(data_write)
-        totals_row = ("TOTALS," + str(mob_total) + "," + str(ins_total) + "," + str(deletions_total) + "," +
-        str(snp_total) + "," + str(total_count) + "\n")
-        
-        of.write(totals_row)
-   # Output mutations organized by feature
-   
-
-    return
-
-if __name__ == "__main__":
-    main()
-
-
-
-
-
-
-
-
-
-
+"""output_label_csv(): write output<N>.csv, the label counts of the N-th category of new_map (see ReportWriter)."""
+def output_label_csv(new_map, prefix=""):
+    return write_reports(new_map, prefix, muttype=False)
 
 
+"""output_muttype_csv(): write output.csv, the mutation type counts of every category of new_map (see ReportWriter)."""
+def output_muttype_csv(new_map, prefix=""):
+    return write_reports(new_map, prefix, label=False)
 
 
+if __name__ == "__main__":
+    import argparse
+    from Instrumentation import add_arguments, enable_from_arguments, finish_from_arguments
+    parser = argparse.ArgumentParser(description="Interactive GenomeDiff mutation counter.")
+    arguments = add_arguments(parser).parse_args()
+    enable_from_arguments(arguments)
+    try:
+        main()
+    finally:
+        finish_from_arguments(arguments)
@@ -0,0 +1,152 @@
+"""gd_shard: split a cohort across machines and merge the results.
+
+map parses one shard of the input files and writes its maps to a partial file (see PartialMap); reduce merges any
+number of partial files, one map at a time, and writes the same reports as gd_sequence_mapper (see ReportWriter).
+
+Usage:
+    python gd_shard.py map INPUT_DIR PLASMID_DIR PARTIAL --categorization {1,2,3} [--shard I/N] [--pattern GLOB]
+                           [--reference-source SOURCE] [--category-config FILE] [--workers N] [--vectorized] [--mapped]
+                           [--skip-evidence] [--rows FILE] [--instrument FILE] [--profile FILE]
+    python gd_shard.py reduce OUTPUT_DIR PARTIAL [PARTIAL ...] [--npz]
+
+Files are assigned to shards by a hash of their path relative to INPUT_DIR, so each machine can run map with its own
+--shard and no shared file list. With --rows, map also writes every counted mutation of its shard to FILE (see
+MutationTable); it cannot be combined with --workers. --skip-evidence leaves evidence lines (RA, MC, JC, UN) out of the
+counts; every shard of a cohort has to use the same setting.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import argparse
+import os
+import sys
+
+import gd_sequence_mapper
+from CategoryConfig import load_category_config
+from FileDiscovery import DEFAULT_PATTERN
+from GenomeDiffSequenceMap import GenomeDiffSequenceMap
+import Instrumentation
+from MutationTable import MutationTableWriter
+from PartialMap import iter_partial, read_partial_header, write_partial, PartialFormatError
+from ReferenceCache import REFERENCE_LOADERS
+from ReportWriter import write_reports
+
+
+"""parse_shard(): turn "I/N" into (I, N), with 0 <= I < N."""
+def parse_shard(text):
+    index, sep, count = text.partition("/")
+    index = int(index)
+    count = int(count)
+    if not sep or count < 1 or not (0 <= index < count):
+        raise ValueError("shard must be I/N with 0 <= I < N: " + repr(text))
+    return index, count
+
+
+def run_map(args):
+    category_config = load_category_config(args.category_config) if args.category_config else None
+    cat_map = gd_sequence_mapper.new_category_map(args.categorization, category_config)
+    input_dir = os.path.join(args.input_dir, "")
+    plasmid_dir = os.path.join(args.plasmid_dir, "")
+    options = dict(workers=args.workers, vectorized=args.vectorized, reference_source=args.reference_source,
+                   mapped=args.mapped, skip_evidence=args.skip_evidence, pattern=args.pattern,
+                   shard=parse_shard(args.shard))
+    row_sink = MutationTableWriter(args.rows) if args.rows else None
+    Instrumentation.enable_from_arguments(args)
+    try:
+        if args.categorization < 3:
+            gd_sequence_mapper.parse_files_cds(cat_map, args.categorization, input_dir, None, plasmid_dir,
+                                               category_config=category_config, row_sink=row_sink, **options)
+        else:
+            gd_sequence_mapper.parse_file_labels(cat_map, input_dir, None, plasmid_dir, row_sink=row_sink, **options)
+    finally:
+        if row_sink is not None:
+            row_sink.close()
+        Instrumentation.finish_from_arguments(args)
+    write_partial(args.partial, cat_map, args.categorization)
+    print "Wrote", args.partial
+    if row_sink is not None:
+        print "Wrote", row_sink.row_count, "rows to", args.rows
+    return 0
+
+
+"""reduce_partials(): merge the partial files in partial_paths, in order, into one cat_map.
+
+Only one partial map is read at a time. Returns (categorization number, cat_map); all partials must share the
+categorization number."""
+def reduce_partials(partial_paths):
+    categorization_number = None
+    cat_map = dict()
+    for partial_path in partial_paths:
+        with open(partial_path, "rb") as handle:
+            partial_categorization, map_count = read_partial_header(handle)
+        if categorization_number is None:
+            categorization_number = partial_categorization
+        elif partial_categorization != categorization_number:
+            raise PartialFormatError(partial_path + ": categorization " + str(partial_categorization) +
+                                     " does not match " + str(categorization_number))
+        for category, partial_map in iter_partial(partial_path):
+            if category in cat_map:
+                cat_map[category].merge(partial_map)
+            else:
+                cat_map[category] = GenomeDiffSequenceMap().merge(partial_map)
+    return categorization_number, cat_map
+
+
+def run_reduce(args):
+    categorization_number, cat_map = reduce_partials(args.partials)
+    output_dir = os.path.join(args.output_dir, "")
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    write_reports(cat_map, output_dir, npz=args.npz)
+    mutation_count = sum([cat_map[category].get_count() for category in cat_map])
+    print "Merged", len(args.partials), "partials,", mutation_count, "mutations."
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse a cohort in shards and merge the partial results.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    map_parser = subparsers.add_parser("map", help="parse one shard of the input files into a partial file")
+    map_parser.add_argument("input_dir", help="directory of .gd files")
+    map_parser.add_argument("plasmid_dir", help="directory of .gb references")
+    map_parser.add_argument("partial", help="partial file to write")
+    map_parser.add_argument("--categorization", type=int, choices=(1, 2, 3), required=True,
+                            help="1 = CDS type, 2 = specific CDS, 3 = label")
+    map_parser.add_argument("--shard", default="0/1", help="this machine's shard, I/N (default: all files)")
+    map_parser.add_argument("--pattern", default=DEFAULT_PATTERN, help="glob the .gd file names must match")
+    map_parser.add_argument("--reference-source", default="compiled", choices=sorted(REFERENCE_LOADERS))
+    map_parser.add_argument("--category-config", default=None, help="CategoryConfig JSON file")
+    map_parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    map_parser.add_argument("--vectorized", action="store_true", help="count each file with NumPy")
+    map_parser.add_argument("--mapped", action="store_true", help="scan .gd files through mmap")
+    map_parser.add_argument("--skip-evidence", action="store_true",
+                            help="do not count evidence lines (RA, MC, JC, UN); changes the counts")
+    map_parser.add_argument("--rows", default=None, help="also write one row per mutation to this .tsv/.csv(.gz) file")
+    Instrumentation.add_arguments(map_parser)
+
+    reduce_parser = subparsers.add_parser("reduce", help="merge partial files and write the CSV reports")
+    reduce_parser.add_argument("output_dir", help="directory the CSV reports are written to")
+    reduce_parser.add_argument("partials", nargs="+", help="partial files written by map")
+    reduce_parser.add_argument("--npz", action="store_true", help="also write the merged counts as output.npz")
+
+    args = parser.parse_args()
+    if args.command == "map":
+        return run_map(args)
+    return run_reduce(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""gd_watch: a long-running service that keeps the category maps of an input directory up to date.
+
+Instead of re-running gd_sequence_mapper over the whole cohort for every new batch, gd_watch parses the input
+directory once, then watches it (see DirectoryWatcher) and parses only the .gd files that arrive or change. References
+stay loaded in one ReferenceCache for the life of the service. The current maps are served over HTTP, on a TCP port or
+a Unix socket:
+    GET /status             files, mutations, time and duration of the last update, reference cache summary
+    GET /counts             per category: total, type counts, feature x type counts and the label -> type mapping
+    GET /csv/output.csv     the mutation type report (see ReportWriter)
+    GET /csv/outputN.csv    the label reports, one per category
+    GET /top                the labels with the most mutations; query parameters k (default 10), category and type
+    GET /fractions          the fraction of mutations of each type, for the whole cohort and per category
+
+Usage:
+    python gd_watch.py INPUT_DIR PLASMID_DIR --categorization {1,2,3} [--pattern GLOB] [--category-config FILE]
+                       [--reference-source SOURCE] [--cache-size N] [--vectorized] [--mapped] [--skip-evidence]
+                       [--poll-interval SECONDS] [--no-inotify] [--host HOST] [--port PORT | --socket PATH]
+                       [--instrument FILE] [--profile FILE]
+
+The contribution of every file is kept, so a changed or deleted file can be taken out again: new files are merged into
+the live maps directly, and a change or deletion rebuilds the maps of the categories it touched from the kept
+contributions. Files are merged in the order they were first seen, so the counts always equal those of a fresh run;
+only the first-seen type of a label can differ when files arrive out of directory order. References are not watched;
+restart the service after changing one.
+With --skip-evidence, evidence lines (RA, MC, JC, UN) are not counted.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import argparse
+import BaseHTTPServer
+from collections import OrderedDict
+import json
+import os
+import shutil
+import SocketServer
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urlparse
+
+import gd_sequence_mapper
+from CategoryConfig import load_category_config
+from CohortQuery import CohortQuery
+from DirectoryWatcher import open_watcher
+from FileDiscovery import DEFAULT_PATTERN, iter_gd_files
+from GenomeDiffSequenceMap import GenomeDiffSequenceMap
+import Instrumentation
+from ReferenceCache import ReferenceCache, REFERENCE_LOADERS
+from ReportWriter import write_reports
+
+
+class WatchService(object):
+
+    """__init__: keep the maps of categorization_number for the .gd files under input_dir matching pattern."""
+    def __init__(self, input_dir, categorization_number, reference_cache, pattern=DEFAULT_PATTERN, vectorized=False,
+                 mapped=False, category_config=None, skip_evidence=False):
+        self.input_dir = input_dir
+        self.categorization_number = categorization_number
+        self.reference_cache = reference_cache
+        self.pattern = pattern
+        self.vectorized = vectorized
+        self.mapped = mapped
+        self.skip_evidence = skip_evidence
+        self.category_config = category_config
+        # Path -> ((size, mtime), partial cat_map), in the order the files were first seen
+        self.files = OrderedDict()
+        self.cat_map = gd_sequence_mapper.new_category_map(categorization_number, category_config)
+        self.query = CohortQuery(self.cat_map)
+        # Guards cat_map, the query cache and the snapshot; updates only hold it while publishing
+        self.lock = threading.Lock()
+        self.version = 0
+        self.updated = None
+        self.update_seconds = 0.0
+        self.snapshot_version = -1
+        self.snapshot = dict()
+        return
+
+    def parse_file(self, gd_path):
+        """Return the contribution of one file: its non-empty maps, by category."""
+        partial_map = gd_sequence_mapper.new_category_map(self.categorization_number, self.category_config)
+        gd_sequence_mapper.parse_gd_file(gd_path, partial_map, self.categorization_number, self.reference_cache,
+                                         self.vectorized, self.mapped, self.category_config,
+                                         skip_evidence=self.skip_evidence)
+        for category in partial_map.keys():
+            if partial_map[category].get_count() == 0:
+                del partial_map[category]
+        return partial_map
+
+    def update(self, paths=None):
+        """Bring the maps up to date with the files in paths, or with the whole input tree when paths is None.
+
+        Returns the number of files parsed or removed."""
+        start = time.time()
+        if paths is None:
+            candidates = list(iter_gd_files(self.input_dir, self.pattern))
+            found = set(candidates)
+            candidates.extend([gd_path for gd_path in self.files if gd_path not in found])
+        else:
+            candidates = sorted(paths)
+
+        added = []
+        # Categories a changed or deleted file contributed to, before or after the change
+        rebuild = set()
+        changed_count = 0
+        for gd_path in candidates:
+            known = self.files.get(gd_path)
+            try:
+                stat = os.stat(gd_path)
+            except OSError:
+                if known is not None:
+                    del self.files[gd_path]
+                    rebuild.update(known[1])
+                    changed_count += 1
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            if known is not None and known[0] == signature:
+                continue
+            try:
+                partial_map = self.parse_file(gd_path)
+            except Exception:
+                # Most likely a file still being written; it is parsed again when it changes
+                print "Could not parse", gd_path
+                traceback.print_exc()
+                continue
+            self.files[gd_path] = (signature, partial_map)
+            changed_count += 1
+            if known is None:
+                added.append(partial_map)
+            else:
+                rebuild.update(known[1])
+                rebuild.update(partial_map)
+
+        if not rebuild and not added:
+            return 0
+        # Only the maps of the affected categories are rebuilt, and they are replaced rather than changed, so the
+        # query cache keeps its answers about every other category
+        rebuilt = dict([(category, GenomeDiffSequenceMap()) for category in rebuild])
+        if rebuilt:
+            for signature, partial_map in self.files.itervalues():
+                for category in partial_map:
+                    if category in rebuilt:
+                        rebuilt[category].merge(partial_map[category])
+        with self.lock:
+            self.cat_map.update(rebuilt)
+            for partial_map in added:
+                for category in partial_map:
+                    if category not in rebuilt:
+                        self.cat_map[category].merge(partial_map[category])
+        with self.lock:
+            self.version += 1
+            self.updated = time.time()
+            self.update_seconds = self.updated - start
+        return changed_count
+
+    def get_status(self):
+        with self.lock:
+            return {"files": len(self.files), "mutations": sum([m.get_count() for m in self.cat_map.values()]),
+                    "version": self.version, "updated": self.updated, "update_seconds": self.update_seconds,
+                    "references": self.reference_cache.summary()}
+
+    def get_counts(self):
+        with self.lock:
+            counts = dict()
+            for category in self.cat_map:
+                mutation_map = self.cat_map[category]
+                counts[category] = {"total": mutation_map.get_count(), "types": mutation_map.type_map,
+                                    "features": mutation_map.feat_type_map, "labels": mutation_map.label_type_map}
+            return counts
+
+    def get_top(self, k=10, category=None, _type=None):
+        """Return the k labels with the most mutations as (label, count) pairs; KeyError for an unknown category."""
+        with self.lock:
+            return self.query.top_labels(k, category, _type)
+
+    def get_fractions(self):
+        with self.lock:
+            return {"cohort": self.query.type_fractions(), "categories": self.query.type_fractions_by_category()}
+
+    def get_snapshot(self):
+        """Return the CSV reports of the current maps, file name -> contents; built once per version."""
+        with self.lock:
+            if self.snapshot_version != self.version:
+                # The report writer writes files, so it writes into a scratch directory
+                snapshot_dir = tempfile.mkdtemp(prefix="gd_watch")
+                try:
+                    write_reports(self.cat_map, snapshot_dir + os.sep)
+                    snapshot = dict()
+                    for name in os.listdir(snapshot_dir):
+                        with open(os.path.join(snapshot_dir, name), "rb") as handle:
+                            snapshot[name] = handle.read()
+                finally:
+                    shutil.rmtree(snapshot_dir, ignore_errors=True)
+                self.snapshot = snapshot
+                self.snapshot_version = self.version
+            return self.snapshot
+
+
+class WatchRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        service = self.server.service
+        path, _, query = self.path.partition("?")
+        params = dict([(name, values[-1]) for name, values in urlparse.parse_qs(query).items()])
+        content_type = "application/json"
+        if path == "/status":
+            body = json.dumps(service.get_status(), indent=2, sort_keys=True)
+        elif path == "/counts":
+            body = json.dumps(service.get_counts(), indent=2, sort_keys=True)
+        elif path == "/top":
+            try:
+                top = service.get_top(int(params.get("k", 10)), params.get("category"), params.get("type"))
+            except (KeyError, ValueError):
+                self.send_error(400, "Bad query: " + query)
+                return
+            body = json.dumps(top, indent=2)
+        elif path == "/fractions":
+            body = json.dumps(service.get_fractions(), indent=2, sort_keys=True)
+        elif path.startswith("/csv/") and path[len("/csv/"):] in service.get_snapshot():
+            body = service.get_snapshot()[path[len("/csv/"):]]
+            content_type = "text/csv"
+        else:
+            self.send_error(404, "Unknown resource: " + path)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, format, *args):
+        # Unix socket clients have no (host, port) address
+        client = self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+        sys.stderr.write("%s - - [%s] %s\n" % (client, self.log_date_time_string(), format % args))
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+"""start_server(): serve service over HTTP on socket_path if given, otherwise on host:port, from a background thread."""
+def start_server(service, host="127.0.0.1", port=8765, socket_path=None):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, WatchRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), WatchRequestHandler)
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch an input directory and serve up-to-date mutation counts.")
+    parser.add_argument("input_dir", help="directory of .gd files to watch")
+    parser.add_argument("plasmid_dir", help="directory of .gb references")
+    parser.add_argument("--categorization", type=int, choices=(1, 2, 3), required=True,
+                        help="1 = CDS type, 2 = specific CDS, 3 = label")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help="glob the .gd file names must match")
+    parser.add_argument("--category-config", default=None, help="CategoryConfig JSON file")
+    parser.add_argument("--reference-source", default="compiled", choices=sorted(REFERENCE_LOADERS))
+    parser.add_argument("--cache-size", type=int, default=ReferenceCache.DEFAULT_MAX_SIZE,
+                        help="references kept in memory")
+    parser.add_argument("--vectorized", action="store_true", help="count each file with NumPy")
+    parser.add_argument("--mapped", action="store_true", help="scan .gd files through mmap")
+    parser.add_argument("--skip-evidence", action="store_true",
+                        help="do not count evidence lines (RA, MC, JC, UN); changes the counts")
+    parser.add_argument("--poll-interval", type=float, default=5.0,
+                        help="seconds between scans when inotify is not used")
+    parser.add_argument("--no-inotify", action="store_true", help="always poll the input directory")
+    parser.add_argument("--host", default="127.0.0.1", help="address to serve on")
+    parser.add_argument("--port", type=int, default=8765, help="port to serve on")
+    parser.add_argument("--socket", default=None, help="serve on this Unix socket instead of a TCP port")
+    Instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+
+    category_config = load_category_config(args.category_config) if args.category_config else None
+    input_dir = os.path.join(args.input_dir, "")
+    plasmid_dir = os.path.join(args.plasmid_dir, "")
+    reference_cache = ReferenceCache(plasmid_dir, args.cache_size, REFERENCE_LOADERS[args.reference_source])
+    service = WatchService(input_dir, args.categorization, reference_cache, args.pattern, args.vectorized,
+                           args.mapped, category_config, args.skip_evidence)
+    # Timings cover every update until the service stops; they are printed and written then
+    Instrumentation.enable_from_arguments(args)
+    watcher = open_watcher(input_dir, args.pattern, args.poll_interval, not args.no_inotify)
+    server = start_server(service, args.host, args.port, args.socket)
+    print "Watching", input_dir, "with", watcher.name + "; serving on", args.socket or args.host + ":" + str(args.port)
+    try:
+        while True:
+            paths = watcher.poll(1.0)
+            if paths is None or paths:
+                if service.update(paths):
+                    status = service.get_status()
+                    print "Updated:", status["files"], "files,", status["mutations"], "mutations in", \
+                        "%.2f" % status["update_seconds"], "s"
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        server.shutdown()
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        Instrumentation.finish_from_arguments(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
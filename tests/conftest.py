@@ -0,0 +1,46 @@
+"""Shared fixtures: a small synthetic cohort (see gd_benchmark) and a comparable form of cat_maps.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gd_benchmark
+
+# Evidence lines (RA, MC) are counted like mutations, so every reader and mode has to keep them
+COHORT_MIX = "MOB=1,INS=1,DEL=1,SNP=2,RA=1,MC=1"
+
+
+@pytest.fixture(scope="session")
+def cohort(tmpdir_factory):
+    """Return (plasmid_dir, input_dir) of a synthetic cohort of 12 files over 5 plasmids."""
+    root = str(tmpdir_factory.mktemp("cohort"))
+    return gd_benchmark.generate_cohort(os.path.join(root, "data"), 12, 40, 5, 20,
+                                        gd_benchmark.parse_mix(COHORT_MIX), 7)
+
+
+"""canonical(): everything a cat_map reports, as plain dicts that compare equal when the results are the same."""
+def canonical(cat_map):
+    result = dict()
+    for category in cat_map:
+        mutation_map = cat_map[category]
+        result[category] = {"total": mutation_map.get_count(), "cells": sorted(mutation_map.iter_counts()),
+                            "labels": dict(mutation_map.label_type_map)}
+    return result
@@ -0,0 +1,92 @@
+"""Tests for CohortQuery invalidation as files of a watched cohort change.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+import shutil
+
+import gd_sequence_mapper
+from CohortQuery import CohortQuery
+from gd_watch import WatchService
+from ReferenceCache import ReferenceCache
+
+
+def ask(query):
+    """Ask every question the test follows, per category and for the whole cohort; return the answers by key."""
+    answers = dict()
+    for category in sorted(query.cat_map) + [None]:
+        answers[("type", category)] = query.grouped_counts("type", category)
+        answers[("feature_type", category)] = query.grouped_counts("feature_type", category)
+        answers[("fractions", category)] = query.type_fractions(category)
+    return answers
+
+
+def recomputed(query, before):
+    """Return the categories (None for the whole cohort) whose cached answers were replaced since before."""
+    return set([key[-1] for key, entry in query.answers.items() if before.get(key) is not entry])
+
+
+def check_fresh(query, input_dir, plasmid_dir, tmpdir):
+    cat_map = gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir, str(tmpdir),
+                                                 plasmid_dir)
+    assert ask(query) == ask(CohortQuery(cat_map))
+
+
+def test_only_changed_categories_are_recomputed(cohort, tmpdir):
+    plasmid_dir, cohort_dir = cohort
+    input_dir = str(tmpdir.join("input")) + os.sep
+    shutil.copytree(cohort_dir, input_dir)
+    service = WatchService(input_dir, 2, ReferenceCache(plasmid_dir))
+    service.update()
+    query = service.query
+    ask(query)
+
+    # One file per category, so each change touches exactly one category
+    by_category = dict()
+    for gd_path, (signature, partial_map) in service.files.items():
+        assert len(partial_map) == 1
+        by_category.setdefault(partial_map.keys()[0], []).append(gd_path)
+    modified_category, added_category, removed_category = sorted(by_category)[:3]
+
+    def modify():
+        gd_path = by_category[modified_category][0]
+        with open(gd_path, "r") as handle:
+            lines = handle.readlines()
+        with open(gd_path, "w") as handle:
+            handle.writelines(lines[:-5])
+        return gd_path
+
+    def add():
+        gd_path = input_dir + "sample_added.gd"
+        shutil.copy(by_category[added_category][0], gd_path)
+        return gd_path
+
+    def remove():
+        gd_path = by_category[removed_category][-1]
+        os.remove(gd_path)
+        return gd_path
+
+    for change, category in ((modify, modified_category), (add, added_category), (remove, removed_category)):
+        before = dict(query.answers)
+        indexes = dict(query.indexes)
+        assert service.update([change()]) == 1
+        assert service.query is query
+        ask(query)
+        assert recomputed(query, before) == set([category, None])
+        for other in service.cat_map:
+            if other != category:
+                assert query.indexes[other] is indexes[other]
+        check_fresh(query, input_dir, plasmid_dir, tmpdir)
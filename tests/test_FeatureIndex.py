@@ -0,0 +1,87 @@
+"""Tests for FeatureIndex: every lookup must agree with the linear first-match scan it replaced.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os
+import random
+
+import numpy
+import pytest
+from Bio.SeqFeature import CompoundLocation, FeatureLocation, SeqFeature
+
+from FeatureIndex import FeatureIndex
+from ReferenceCache import REFERENCE_LOADERS
+
+
+"""linear_find(): the original lookup of parse_file_data, the first feature whose location contains position."""
+def linear_find(features, position):
+    containing_feature = filter(lambda feat: position in feat.location, features)
+    return containing_feature[0] if containing_feature else None
+
+
+def check_against_linear_scan(features, positions):
+    feature_index = FeatureIndex(features)
+    starts, owners = feature_index.get_arrays()
+    mismatches = []
+    for position in positions:
+        expected = linear_find(features, position)
+        if feature_index.find(position) is not expected:
+            mismatches.append(position)
+        # The arrays used by the vectorized counting give the same owner
+        seg_num = numpy.searchsorted(starts, position, side='right') - 1
+        owner = owners[seg_num] if seg_num >= 0 else -1
+        if (features[owner] if owner >= 0 else None) is not expected:
+            mismatches.append(position)
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("source", sorted(REFERENCE_LOADERS))
+def test_cohort_references(cohort, source):
+    plasmid_dir, input_dir = cohort
+    names = sorted([name[:-3] for name in os.listdir(plasmid_dir) if name.endswith(".gb")])
+    assert names
+    for name in names:
+        reference = REFERENCE_LOADERS[source](plasmid_dir, name)
+        features = reference.top_strand_features
+        end = max([int(feat.location.end) for feat in features])
+        # Every position of the reference, plus some before and past its annotations
+        check_against_linear_scan(features, range(-10, end + 100))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_overlapping_features(seed):
+    generator = random.Random(seed)
+    features = []
+    for feat_num in range(60):
+        parts = []
+        for part_num in range(generator.choice([1, 1, 1, 2, 3])):
+            start = generator.randrange(0, 2000)
+            parts.append(FeatureLocation(start, start + generator.randrange(0, 300), strand=1))
+        location = parts[0] if len(parts) == 1 else CompoundLocation(parts)
+        features.append(SeqFeature(location, type="misc_feature", qualifiers={"label": ["f" + str(feat_num)]}))
+    check_against_linear_scan(features, range(-5, 2400))
+
+
+def test_empty_and_nested_features():
+    assert FeatureIndex([]).find(0) is None
+    outer = SeqFeature(FeatureLocation(0, 100, strand=1), type="CDS")
+    inner = SeqFeature(FeatureLocation(20, 30, strand=1), type="RBS")
+    # The first feature wins, whichever is shorter
+    check_against_linear_scan([outer, inner], range(-1, 102))
+    check_against_linear_scan([inner, outer], range(-1, 102))
+    assert FeatureIndex([inner, outer]).find(25) is inner
+    assert FeatureIndex([outer, inner]).find(25) is outer
@@ -0,0 +1,56 @@
+"""Tests for FeatureTable.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+import shutil
+
+import pytest
+
+import FeatureTable
+
+NAME = "psyn1"
+
+
+def feature_fields(features):
+    return [(feat.type, feat.qualifiers.get("label"), feat.strand, feat.location.spans()) for feat in features]
+
+
+@pytest.fixture
+def plasmid_dir(cohort, tmpdir):
+    shutil.copy(os.path.join(cohort[0], NAME + ".gb"), str(tmpdir))
+    return str(tmpdir) + os.sep
+
+
+def corrupt_table(path, damage):
+    with open(path, "rb") as handle:
+        raw = handle.read()
+    with open(path, "wb") as handle:
+        handle.write(damage(raw))
+
+
+@pytest.mark.parametrize("damage", [lambda raw: raw[:-5], lambda raw: raw[:FeatureTable._header.size + 3],
+                                    lambda raw: raw + "\0" * 8],
+                         ids=["truncated_spans", "truncated_strings", "trailing_bytes"])
+def test_corrupt_table_is_rebuilt(plasmid_dir, damage):
+    expected = feature_fields(FeatureTable.load_features(plasmid_dir, NAME))
+    table_path = plasmid_dir + NAME + FeatureTable.TABLE_EXTENSION
+    corrupt_table(table_path, damage)
+    with pytest.raises(FeatureTable.TableFormatError):
+        FeatureTable.read_table(table_path)
+    assert feature_fields(FeatureTable.load_features(plasmid_dir, NAME)) == expected
+    # The rebuilt table is valid again
+    assert feature_fields(FeatureTable.read_table(table_path)) == expected
@@ -0,0 +1,101 @@
+"""Tests for FileDiscovery: finding the .gd files of a nested input tree and splitting them into shards.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os
+import random
+
+import pytest
+
+import FileDiscovery
+from FileDiscovery import iter_gd_files, report_progress, select_shard
+
+GD_FILES = ["a.gd", "b.gd", "one/c.gd", "one/two/d.gd", "one/two/three/e.gd", "other/f.gd", "other/g.gd"]
+OTHER_FILES = ["notes.txt", "a.gd.bak", "one/c.gb", "other/f.GD.txt"]
+
+
+@pytest.fixture
+def tree(tmpdir):
+    for relative_path in GD_FILES + OTHER_FILES:
+        tmpdir.join(*relative_path.split("/")).ensure()
+    tmpdir.join("empty").ensure(dir=True)
+    # A directory whose name matches the pattern is not a file
+    tmpdir.join("dir.gd").ensure(dir=True)
+    return str(tmpdir)
+
+
+def relative(paths, input_dir):
+    return [os.path.relpath(path, input_dir).replace(os.sep, "/") for path in paths]
+
+
+@pytest.mark.parametrize("listdir", [False, True])
+def test_finds_nested_files(monkeypatch, tree, listdir):
+    if listdir:
+        monkeypatch.setattr(FileDiscovery, "scandir", None)
+    found = relative(iter_gd_files(tree), tree)
+    assert sorted(found) == sorted(GD_FILES)
+    # Top-down: the files of a directory come before those of its subdirectories
+    for path in found:
+        for other in found:
+            if other.startswith(os.path.dirname(path) + "/") and other.count("/") < path.count("/"):
+                assert found.index(other) < found.index(path)
+    assert sorted(relative(iter_gd_files(tree, recursive=False), tree)) == ["a.gd", "b.gd"]
+
+
+def test_pattern_filter(tree):
+    assert sorted(relative(iter_gd_files(tree, "*.gb"), tree)) == ["one/c.gb"]
+    assert sorted(relative(iter_gd_files(tree, "[a-c].gd"), tree)) == ["a.gd", "b.gd", "one/c.gd"]
+    # None matches every file, at any depth
+    assert sorted(relative(iter_gd_files(tree, None), tree)) == sorted(GD_FILES + OTHER_FILES)
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symbolic links")
+def test_directory_links_are_not_followed(tree):
+    os.symlink(os.path.join(tree, "one"), os.path.join(tree, "link"))
+    assert sorted(relative(iter_gd_files(tree), tree)) == sorted(GD_FILES)
+
+
+@pytest.mark.parametrize("shard_count", [1, 2, 3, 5])
+def test_shards_are_disjoint_and_cover_every_file(tree, shard_count):
+    everything = list(iter_gd_files(tree))
+    shards = [list(select_shard(iter_gd_files(tree), tree, shard_index, shard_count))
+              for shard_index in range(shard_count)]
+    assert sorted(sum(shards, [])) == sorted(everything)
+    assert len(set(sum(shards, []))) == len(everything)
+    # The split does not depend on the listing order or on a trailing separator on input_dir
+    shuffled = list(everything)
+    random.Random(1).shuffle(shuffled)
+    for shard_index in range(shard_count):
+        assert sorted(select_shard(shuffled, os.path.join(tree, ""), shard_index, shard_count)) == \
+            sorted(shards[shard_index])
+
+
+def test_shards_follow_the_relative_path(tmpdir_factory, tree):
+    # Another machine with the same tree under a different root gets the same split
+    copy = tmpdir_factory.mktemp("copy")
+    for relative_path in GD_FILES:
+        copy.join(*relative_path.split("/")).ensure()
+    for shard_index in range(3):
+        here = relative(select_shard(iter_gd_files(tree), tree, shard_index, 3), tree)
+        there = relative(select_shard(iter_gd_files(str(copy)), str(copy), shard_index, 3), str(copy))
+        assert sorted(here) == sorted(there)
+
+
+def test_report_progress_passes_paths_through(capsys):
+    paths = ["f" + str(number) + ".gd" for number in range(5)]
+    assert list(report_progress(iter(paths), interval=2)) == paths
+    assert capsys.readouterr()[0].count("Found") >= 2
@@ -0,0 +1,95 @@
+"""Tests for GenomeDiffReader and MappedGenomeDiffReader.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import pytest
+
+import gd_sequence_mapper
+from conftest import canonical
+from GenomeDiffReader import EVIDENCE_TYPES, GenomeDiffReader, MappedGenomeDiffReader, open_genomediff
+from ReferenceCache import ReferenceCache
+
+GD_TEXT = ("#=GENOME_DIFF\t1.0\n"
+           "#=REFSEQ\tpsyn0.gb\n"
+           "SNP\t1\t3\tpsyn0\t120\tA\n"
+           "# a comment\n"
+           "\n"
+           "RA\t2\t.\tpsyn0\t120\t0\tG\tA\tfrequency=1\n"
+           "MC\t3\t.\tpsyn0\t400\t460\t0\t0\n"
+           "DEL\t4\t.\tpsyn0\t900\t12\n")
+
+
+def write_gd(tmpdir):
+    path = tmpdir.join("sample.gd")
+    path.write(GD_TEXT)
+    return str(path)
+
+
+def summarize(records):
+    return [(record.type, record.id, record.parent_ids, record.seq_id, record.position, record.rest)
+            for record in records]
+
+
+def test_mapped_reader_matches_line_reader(tmpdir):
+    gd_path = write_gd(tmpdir)
+    with GenomeDiffReader(open(gd_path, "r")) as records:
+        expected = summarize(records)
+        header = records.header
+    with MappedGenomeDiffReader(gd_path) as records:
+        assert summarize(records) == expected
+        assert records.header == header
+        assert records.version == "1.0"
+    assert [_type for _type, _id, parents, seq_id, position, rest in expected] == ["SNP", "RA", "MC", "DEL"]
+
+
+@pytest.mark.parametrize("mapped", [False, True])
+def test_skip_evidence_is_opt_in(tmpdir, mapped):
+    gd_path = write_gd(tmpdir)
+    with open_genomediff(gd_path, mapped) as records:
+        assert [record.type for record in records] == ["SNP", "RA", "MC", "DEL"]
+    with open_genomediff(gd_path, mapped, skip_evidence=True) as records:
+        assert records.peek().type == "SNP"
+        types = [record.type for record in records]
+    assert types == ["SNP", "DEL"]
+    assert not set(types) & set(EVIDENCE_TYPES)
+
+
+def test_skip_evidence_drops_evidence_counts(cohort, tmpdir):
+    plasmid_dir, input_dir = cohort
+    expected = canonical(gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir,
+                                                            str(tmpdir), plasmid_dir))
+    for options in ({}, {"mapped": True}, {"prefetch_readers": 2}, {"workers": 2, "mapped": True}):
+        result = canonical(gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir,
+                                                              str(tmpdir), plasmid_dir, skip_evidence=True, **options))
+        for category in expected:
+            cells = [cell for cell in expected[category]["cells"] if cell[0] not in EVIDENCE_TYPES]
+            assert result[category]["cells"] == cells
+            assert result[category]["total"] == sum([count for _type, feat, count in cells])
+
+
+def test_mapped_counts_match_unmapped_with_evidence(cohort):
+    plasmid_dir, input_dir = cohort
+    results = []
+    for mapped in (False, True):
+        cat_map = gd_sequence_mapper.new_category_map(2)
+        reference_cache = ReferenceCache(plasmid_dir)
+        for gd_path in gd_sequence_mapper.list_gd_files(input_dir):
+            gd_sequence_mapper.parse_gd_file(gd_path, cat_map, 2, reference_cache, mapped=mapped)
+        results.append(canonical(cat_map))
+    assert results[0] == results[1]
+    evidence_cells = [cell for category in results[0] for cell in results[0][category]["cells"]
+                      if cell[0] in EVIDENCE_TYPES]
+    assert evidence_cells
@@ -0,0 +1,86 @@
+"""Tests for GenomeDiffSequenceMap.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import cPickle
+import os
+
+from GenomeDiffSequenceMap import GenomeDiffSequenceMap
+from PartialMap import iter_partial, write_partial
+from ReportWriter import write_reports
+
+MUTATIONS = [("SNP", "BBa_K1", "CDS"), ("MOB", "BBa_K1", "CDS"), ("SNP", "BBa_K2", "CDS"), ("SNP", "BBa_K1", "CDS"),
+             ("DEL", "ori", "rep_origin")]
+
+
+def views(mutation_map):
+    return (mutation_map.get_count(), mutation_map.type_map, mutation_map.feat_map, mutation_map.type_feat_map,
+            mutation_map.feat_type_map, mutation_map.label_type_map)
+
+
+def test_update_methods_match_add_mutation():
+    expected = GenomeDiffSequenceMap()
+    legacy = GenomeDiffSequenceMap()
+    for mut_type, label, feat_type in MUTATIONS:
+        expected.add_mutation(mut_type, label, feat_type)
+        # The calls the original gd_sequence_mapper made for each mutation, in its order
+        legacy.update_feature_map(label)
+        legacy.update_label_type_map(label, feat_type)
+        legacy.update_type_feat_map(mut_type, label)
+        legacy.update_feat_type_map(label, mut_type)
+        legacy.update_type_map(mut_type)
+        legacy.update_count()
+    assert views(legacy) == views(expected)
+    assert sorted(legacy.iter_counts()) == sorted(expected.iter_counts())
+
+
+def test_update_type_feat_map_owns_the_cell(tmpdir):
+    mutation_map = GenomeDiffSequenceMap()
+    mutation_map.update_type_map("INS")
+    mutation_map.update_feature_map("BBa_K2")
+    mutation_map.update_feat_type_map("BBa_K2", "INS")
+    assert views(mutation_map)[:5] == (0, {}, {}, {}, {})
+    mutation_map.update_type_feat_map("SNP", "BBa_K1")
+    mutation_map.update_count()
+    assert mutation_map.type_map == {"SNP": 1}
+    assert mutation_map.output_type_csv() == [0, 0, 0, 1]
+    # The reports and a partial file see the same counts as the accessors
+    prefix = str(tmpdir) + os.sep
+    write_reports({"all": mutation_map}, prefix, label=False)
+    assert open(prefix + "output.csv").read().splitlines()[1] == "all,0,0,0,1,1"
+    write_partial(prefix + "partial.gdpm", {"all": mutation_map}, 3)
+    restored = dict(iter_partial(prefix + "partial.gdpm"))["all"]
+    assert views(restored) == views(mutation_map)
+
+
+def test_views_are_cached_until_the_counts_change():
+    mutation_map = GenomeDiffSequenceMap()
+    mutation_map.add_mutation("SNP", "BBa_K1", "CDS")
+    type_map = mutation_map.type_map
+    assert mutation_map.type_map is type_map
+    mutation_map.add_mutation("SNP", "BBa_K1", "CDS")
+    assert mutation_map.type_map == {"SNP": 2}
+    assert type_map == {"SNP": 1}
+
+
+def test_pickle_leaves_out_the_cached_views():
+    mutation_map = GenomeDiffSequenceMap()
+    for mut_type, label, feat_type in MUTATIONS:
+        mutation_map.add_mutation(mut_type, label, feat_type)
+    expected = views(mutation_map)
+    restored = cPickle.loads(cPickle.dumps(mutation_map, cPickle.HIGHEST_PROTOCOL))
+    assert restored._views is None
+    assert views(restored) == expected
@@ -0,0 +1,103 @@
+"""Tests for Instrumentation and its command-line options.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import argparse
+import json
+import os
+import threading
+
+import pytest
+
+import gd_sequence_mapper
+import Instrumentation
+from Instrumentation import instrumentation
+
+
+@pytest.fixture
+def clean_instrumentation():
+    instrumentation.reset()
+    yield instrumentation
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_options_enable_and_write_the_report(cohort, tmpdir, clean_instrumentation):
+    plasmid_dir, input_dir = cohort
+    report_path = str(tmpdir.join("timings.json"))
+    profile_path = str(tmpdir.join("run.pstats"))
+    parser = Instrumentation.add_arguments(argparse.ArgumentParser())
+    args = parser.parse_args(["--instrument", report_path, "--profile", profile_path])
+    assert Instrumentation.enable_from_arguments(args)
+    gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir, str(tmpdir), plasmid_dir)
+    Instrumentation.finish_from_arguments(args)
+    assert not instrumentation.enabled
+    with open(report_path) as handle:
+        report = json.load(handle)
+    assert len(report["files"]) == 12
+    assert "feature_lookup" in report["stages"]
+    assert os.path.getsize(profile_path)
+
+
+def test_options_are_off_by_default(clean_instrumentation):
+    args = Instrumentation.add_arguments(argparse.ArgumentParser()).parse_args([])
+    assert not Instrumentation.enable_from_arguments(args)
+
+
+def test_single_pass_records_files(cohort, tmpdir, clean_instrumentation):
+    plasmid_dir, input_dir = cohort
+    instrumentation.enable()
+    cat_maps = dict([(number, gd_sequence_mapper.new_category_map(number)) for number in (1, 2, 3)])
+    gd_sequence_mapper.parse_files_all(cat_maps, input_dir, str(tmpdir), plasmid_dir)
+    instrumentation.disable()
+    report = instrumentation.report()
+    assert len(report["files"]) == 12
+    assert report["mutations"] + report["skipped"] == 12 * 40
+    # The label map has no cutoff on these plasmids, so it takes every record the other maps take
+    assert report["mutations"] == cat_maps[3]["all"].get_count()
+    assert report["stages"]["feature_lookup"]["calls"] == report["mutations"]
+
+
+def test_concurrent_adds_are_all_counted(clean_instrumentation):
+    instrumentation.enable()
+
+    def add_many():
+        for call_num in range(2000):
+            instrumentation.add("reference_load", 0.5)
+            instrumentation.record_file("f.gd", 1, 0)
+
+    threads = [threading.Thread(target=add_many) for thread_num in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = instrumentation.report()
+    assert report["stages"]["reference_load"] == {"seconds": 8000.0, "calls": 16000}
+    assert len(report["files"]) == report["mutations"] == 16000
+
+
+def test_prefetch_run_records_the_documented_stages(cohort, tmpdir, clean_instrumentation):
+    plasmid_dir, input_dir = cohort
+    instrumentation.enable()
+    gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir, str(tmpdir), plasmid_dir,
+                                       prefetch_readers=3)
+    stages = instrumentation.report()["stages"]
+    assert sorted(stages) == ["analysis_plan", "discover", "feature_lookup", "map_update", "parse_file_data",
+                              "reference_load"]
+    # One plan per reference; readers racing for the same reference may each load it
+    assert stages["analysis_plan"]["calls"] == 5
+    assert stages["reference_load"]["calls"] >= 5
+    assert stages["parse_file_data"]["calls"] == 12
@@ -0,0 +1,86 @@
+"""Tests for MutationTableWriter: the rows it writes read back as the counts kept in the category maps.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import csv
+import gzip
+import os
+
+import pytest
+
+import gd_sequence_mapper
+from MutationTable import MUTATION_COLUMNS, MutationTableWriter
+
+
+def read_rows(path):
+    handle = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+    with handle:
+        delimiter = "," if path.replace(".gz", "").endswith(".csv") else "\t"
+        rows = list(csv.reader(handle, delimiter=delimiter))
+    return rows[0], rows[1:]
+
+
+def test_writer_round_trip(tmpdir):
+    written = [("a.gd", "psyn0", "SNP", 12, "gene, with comma", "CDS", "bba_e0020"),
+               ("b.gd", "psyn1", "DEL", 40, "None", "None", "bba_e0030")] * 5
+    for name in ("rows.tsv", "rows.csv", "rows.csv.gz", "rows.tsv.gz"):
+        path = str(tmpdir.join(name))
+        with MutationTableWriter(path, chunk_rows=3) as writer:
+            for row in written:
+                writer.write(*row)
+        assert writer.row_count == len(written)
+        header, rows = read_rows(path)
+        assert tuple(header) == MUTATION_COLUMNS
+        assert rows == [[str(value) for value in row] for row in written]
+
+
+@pytest.mark.parametrize("categorization_number", [1, 2, 3])
+@pytest.mark.parametrize("options", [{}, {"prefetch_readers": 2}, {"vectorized": True}])
+def test_rows_match_the_counts(cohort, tmpdir, categorization_number, options):
+    plasmid_dir, input_dir = cohort
+    path = str(tmpdir.join("rows.tsv"))
+    cat_map = gd_sequence_mapper.new_category_map(categorization_number)
+    with MutationTableWriter(path, chunk_rows=16) as writer:
+        if categorization_number < 3:
+            gd_sequence_mapper.parse_files_cds(cat_map, categorization_number, input_dir, str(tmpdir), plasmid_dir,
+                                               row_sink=writer, **options)
+        else:
+            gd_sequence_mapper.parse_file_labels(cat_map, input_dir, str(tmpdir), plasmid_dir, row_sink=writer,
+                                                 **options)
+    header, rows = read_rows(path)
+    assert writer.row_count == len(rows) == sum([mutation_map.get_count() for mutation_map in cat_map.values()])
+
+    row_counts = dict()
+    for sample, reference, _type, position, feature_label, feature_type, category in rows:
+        assert os.path.exists(sample) and sample.endswith(".gd")
+        assert int(position) >= 0
+        key = (category, _type, feature_label)
+        row_counts[key] = row_counts.get(key, 0) + 1
+    map_counts = dict()
+    for category, mutation_map in cat_map.items():
+        for _type, feat, count in mutation_map.iter_counts():
+            map_counts[(str(category), _type, str(feat))] = count
+    assert row_counts == map_counts
+
+
+def test_rows_need_a_serial_run(cohort, tmpdir):
+    plasmid_dir, input_dir = cohort
+    with MutationTableWriter(str(tmpdir.join("rows.tsv"))) as writer:
+        for options in ({"workers": 2}, {"manifest_path": str(tmpdir.join("manifest.db"))}):
+            with pytest.raises(ValueError):
+                gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir,
+                                                   str(tmpdir), plasmid_dir, row_sink=writer, **options)
@@ -0,0 +1,59 @@
+"""Tests for PartialMap.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import pytest
+
+import gd_sequence_mapper
+from conftest import canonical
+from PartialMap import iter_partial, read_partial_header, write_partial, PartialFormatError
+
+
+@pytest.fixture(scope="module")
+def cat_map(cohort, tmpdir_factory):
+    plasmid_dir, input_dir = cohort
+    return gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir,
+                                              str(tmpdir_factory.mktemp("out")), plasmid_dir)
+
+
+def test_round_trip_keeps_counts_and_labels(cat_map, tmpdir):
+    path = str(tmpdir.join("partial.gdpm"))
+    write_partial(path, cat_map, 2)
+    with open(path, "rb") as handle:
+        assert read_partial_header(handle) == (2, len(cat_map))
+    restored = dict(iter_partial(path))
+    assert sorted(restored) == sorted(cat_map)
+    assert canonical(restored) == canonical(cat_map)
+    for category in cat_map:
+        # Keys are interned in the stored order, so the rebuilt maps iterate like the originals
+        assert restored[category].feats == cat_map[category].feats
+        assert restored[category].types == cat_map[category].types
+    assert sum([mutation_map.get_count() for mutation_map in restored.values()])
+
+
+def test_truncated_file_is_rejected(cat_map, tmpdir):
+    path = tmpdir.join("partial.gdpm")
+    write_partial(str(path), cat_map, 2)
+    path.write(path.read("rb")[:-3], "wb")
+    with pytest.raises(PartialFormatError):
+        list(iter_partial(str(path)))
+
+
+def test_other_files_are_rejected(tmpdir):
+    path = tmpdir.join("output.csv")
+    path.write(",MOB,INS,DEL,SNP,TOTAL\n")
+    with pytest.raises(PartialFormatError):
+        list(iter_partial(str(path)))
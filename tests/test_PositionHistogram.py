@@ -0,0 +1,108 @@
+"""Tests for PositionHistogram and the histogram kept by the parse functions.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+
+import pytest
+
+import gd_sequence_mapper
+from FeatureIndex import FeatureIndex
+from FeatureTable import TableFeature, TableLocation
+from PositionHistogram import PositionHistogram
+
+
+def feature_index():
+    features = [TableFeature("CDS", "gene", 1, TableLocation([(10, 30)], 1)),
+                TableFeature("promoter", "split", 1, TableLocation([(0, 5), (40, 45)], 1))]
+    return FeatureIndex(features)
+
+
+def test_add_counts_bins_and_features():
+    histogram = PositionHistogram(10)
+    histogram.add("ref", [3, 12, 29, 30, 44, 44], feature_index())
+    # Sized from the end of the last feature
+    assert list(histogram.bins["ref"]) == [1, 1, 1, 1, 2]
+    assert list(histogram.feature_counts["ref"]) == [2, 3]
+    assert histogram.get_count() == 6
+    # Positions beyond the array grow it; the features are only taken the first time
+    histogram.add("ref", [95])
+    assert len(histogram.bins["ref"]) >= 10
+    assert histogram.bins["ref"][9] == 1
+    assert sum(histogram.bins["ref"]) == 7
+    assert histogram.add("ref", []) is histogram
+    assert histogram.get_count() == 7
+    densities = dict([(label, density) for reference, label, _type, length, count, density in histogram.get_density()])
+    assert densities == {"gene": 2 / 20.0, "split": 3 / 10.0}
+
+
+def test_merge_adds_up_to_one_histogram():
+    positions = [3, 12, 29, 30, 44, 44, 95, 250]
+    whole = PositionHistogram(10).add("ref", positions, feature_index()).add("other", [7, 7])
+    first = PositionHistogram(10).add("ref", positions[:3], feature_index())
+    second = PositionHistogram(10).add("ref", positions[3:], feature_index()).add("other", [7, 7])
+    merged = first.merge(second)
+    assert merged.get_count() == whole.get_count()
+    for reference in whole.bins:
+        assert list(merged.bins[reference]) == list(whole.bins[reference])
+    assert list(merged.feature_counts["ref"]) == list(whole.feature_counts["ref"])
+    with pytest.raises(ValueError):
+        merged.merge(PositionHistogram(20))
+
+
+def test_hotspots():
+    histogram = PositionHistogram(10)
+    histogram.add("b", [5, 15, 15, 15, 25, 25, 55])
+    histogram.add("a", [85, 85, 85])
+    # Ties go to the reference that sorts first
+    assert histogram.get_hotspots(3) == [("a", 80, 90, 3), ("b", 10, 20, 3), ("b", 20, 30, 2)]
+    # Windows of one reference do not overlap and stay inside the binned range
+    assert histogram.get_hotspots(2, window_bins=2) == [("b", 10, 30, 5), ("a", 70, 90, 3)]
+    # A window longer than the reference covers all of it
+    assert histogram.get_hotspots(1, window_bins=100)[0][3] == 7
+
+
+@pytest.mark.parametrize("window_bins", [0, -1])
+def test_window_bins_is_checked(tmpdir, window_bins):
+    histogram = PositionHistogram(10).add("ref", [5])
+    with pytest.raises(ValueError):
+        histogram.get_hotspots(window_bins=window_bins)
+    path = str(tmpdir.join("hotspots.csv"))
+    with pytest.raises(ValueError):
+        histogram.write_hotspots_csv(path, window_bins=window_bins)
+    assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize("options", [{"vectorized": True}, {"workers": 2}, {"prefetch_readers": 2}])
+def test_parse_modes_fill_the_same_histogram(cohort, tmpdir, options):
+    plasmid_dir, input_dir = cohort
+    histograms = []
+    totals = []
+    for mode_options in ({}, options):
+        histogram = PositionHistogram(50)
+        cat_map = gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir,
+                                                     str(tmpdir), plasmid_dir, histogram=histogram, **mode_options)
+        histograms.append(histogram)
+        totals.append(sum([mutation_map.get_count() for mutation_map in cat_map.values()]))
+    serial, other = histograms
+    # Every counted mutation lands in the histogram
+    assert serial.get_count() == totals[0] == totals[1] == other.get_count()
+    assert sorted(serial.bins) == sorted(other.bins)
+    for reference in serial.bins:
+        length = max(len(serial.bins[reference]), len(other.bins[reference]))
+        assert list(serial.get_bins(reference, length)) == list(other.get_bins(reference, length))
+    assert serial.get_density() == other.get_density()
+    assert serial.get_hotspots(5, 2) == other.get_hotspots(5, 2)
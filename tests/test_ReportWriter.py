@@ -0,0 +1,124 @@
+"""Tests for ReportWriter.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+
+import numpy
+import pytest
+
+import gd_sequence_mapper
+import ReportWriter
+from ReportWriter import write_reports
+
+
+@pytest.fixture(scope="module")
+def cat_map(cohort, tmpdir_factory):
+    plasmid_dir, input_dir = cohort
+    return gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir,
+                                              str(tmpdir_factory.mktemp("out")), plasmid_dir)
+
+
+"""legacy_muttype_csv(): output.csv as the original output_muttype_csv wrote it, from output_type_csv()."""
+def legacy_muttype_csv(cat_map):
+    lines = [",MOB,INS,DEL,SNP,TOTAL\n"]
+    totals = [0] * 4
+    for category in cat_map.keys():
+        data_lst = cat_map[category].output_type_csv()
+        totals = [total + count for total, count in zip(totals, data_lst)]
+        lines.append(",".join([str(category)] + [str(count) for count in data_lst + [sum(data_lst)]]) + "\n")
+    lines.append(",".join(["TOTALS"] + [str(count) for count in totals + [sum(totals)]]) + "\n")
+    return "".join(lines)
+
+
+"""legacy_label_csv(): the rows of each output<N>.csv as the original output_label_csv wrote them, from feat_type_map.
+
+The original wrote the rows in dict order, so they are returned sorted."""
+def legacy_label_csv(cat_map):
+    files = []
+    for category in cat_map.keys():
+        rows = []
+        feat_type_map = cat_map[category].feat_type_map
+        for feat in feat_type_map:
+            counts = [feat_type_map[feat].get(_type, 0) for _type in ("MOB", "INS", "DEL", "SNP")]
+            rows.append(",".join([str(feat)] + [str(count) for count in counts]) + "\n")
+        files.append([",MOB,INS,DEL,SNP,TOTAL\n"] + sorted(rows))
+    return files
+
+
+def test_csv_matches_the_legacy_output(cat_map, tmpdir):
+    prefix = str(tmpdir) + os.sep
+    written = write_reports(cat_map, prefix)
+    label_paths = [prefix + "output" + str(num + 1) + ".csv" for num in xrange(len(cat_map))]
+    assert written == [prefix + "output.csv"] + label_paths
+    assert open(prefix + "output.csv", "rb").read() == legacy_muttype_csv(cat_map)
+    for num, expected in enumerate(legacy_label_csv(cat_map)):
+        lines = open(prefix + "output" + str(num + 1) + ".csv", "rb").readlines()
+        assert [lines[0]] + sorted(lines[1:]) == expected
+    assert any([len(lines) > 1 for lines in legacy_label_csv(cat_map)])
+
+
+class FailingWriter(object):
+
+    def __init__(self, handle, **options):
+        self.handle = handle
+
+    def writerow(self, row):
+        self.handle.write("partial row\n")
+        raise IOError("disk full")
+
+    writerows = writerow
+
+
+def test_failed_write_keeps_the_previous_file(cat_map, tmpdir, monkeypatch):
+    prefix = str(tmpdir) + os.sep
+    write_reports(cat_map, prefix, label=False)
+    previous = open(prefix + "output.csv", "rb").read()
+    monkeypatch.setattr(ReportWriter.csv, "writer", FailingWriter)
+    with pytest.raises(IOError):
+        write_reports(cat_map, prefix, label=False)
+    assert open(prefix + "output.csv", "rb").read() == previous
+    # The temporary file is removed
+    assert os.listdir(prefix) == ["output.csv"]
+
+
+def test_npz_matches_the_counts(cat_map, tmpdir):
+    prefix = str(tmpdir) + os.sep
+    assert write_reports(cat_map, prefix, muttype=False, label=False, npz=True) == [prefix + "output.npz"]
+    arrays = numpy.load(prefix + "output.npz")
+    categories = list(arrays["categories"])
+    labels = list(arrays["labels"])
+    types = list(arrays["types"])
+    feature_types = list(arrays["feature_types"])
+    assert categories == [str(category) for category in cat_map.keys()]
+
+    cells = set()
+    for category_num, label_num, type_num, count in zip(arrays["cell_category"], arrays["cell_label"],
+                                                        arrays["cell_type"], arrays["cell_count"]):
+        cells.add((categories[category_num], types[type_num], labels[label_num], int(count)))
+    expected = set()
+    for category in cat_map:
+        for _type, feat, count in cat_map[category].iter_counts():
+            expected.add((category, _type, feat, count))
+    assert cells == expected
+    assert list(arrays["category_total"]) == [cat_map[category].get_count() for category in cat_map.keys()]
+
+    label_types = dict()
+    for category in cat_map:
+        for label, feature_type in cat_map[category].label_type_map.items():
+            label_types.setdefault(label, feature_type)
+    for label, feature_type_num in zip(labels, arrays["label_feature_type"]):
+        assert feature_types[feature_type_num] == label_types[label]
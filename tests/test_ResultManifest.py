@@ -0,0 +1,107 @@
+"""Tests for incremental runs backed by ResultManifest.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+import re
+import shutil
+
+import gd_sequence_mapper
+from conftest import canonical
+from FileDiscovery import iter_gd_files, select_shard
+
+
+def run(cohort, tmpdir, **options):
+    plasmid_dir, input_dir = cohort
+    return canonical(gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, input_dir,
+                                                        str(tmpdir), plasmid_dir, **options))
+
+
+def run_counts(capsys):
+    """Return (reused, parsed, removed) from the summary line of the last incremental run."""
+    found = re.search(r"Incremental run: (\d+) files reused, (\d+) parsed, (\d+) removed", capsys.readouterr()[0])
+    return tuple(int(count) for count in found.groups())
+
+
+def reused_count(capsys):
+    return run_counts(capsys)[0]
+
+
+def test_incremental_matches_serial(cohort, tmpdir, capsys):
+    manifest_path = str(tmpdir.join("manifest.db"))
+    expected = run(cohort, tmpdir)
+    assert run(cohort, tmpdir, manifest_path=manifest_path) == expected
+    assert reused_count(capsys) == 0
+    assert run(cohort, tmpdir, manifest_path=manifest_path) == expected
+    assert reused_count(capsys) == 12
+
+
+def test_evidence_setting_is_part_of_the_key(cohort, tmpdir, capsys):
+    manifest_path = str(tmpdir.join("manifest.db"))
+    expected = run(cohort, tmpdir)
+    assert run(cohort, tmpdir, manifest_path=manifest_path) == expected
+    assert reused_count(capsys) == 0
+    # The reader mode does not change the counts, so it shares the stored results
+    assert run(cohort, tmpdir, manifest_path=manifest_path, mapped=True) == expected
+    assert reused_count(capsys) == 12
+    without_evidence = run(cohort, tmpdir, skip_evidence=True)
+    assert without_evidence != expected
+    for skip_evidence, reused in ((True, 0), (True, 12), (False, 0)):
+        result = run(cohort, tmpdir, manifest_path=manifest_path, skip_evidence=skip_evidence)
+        assert result == (without_evidence if skip_evidence else expected)
+        assert reused_count(capsys) == reused
+
+
+def test_runs_over_other_shards_keep_their_rows(cohort, tmpdir, capsys):
+    plasmid_dir, input_dir = cohort
+    manifest_path = str(tmpdir.join("manifest.db"))
+    shard_sizes = [len(list(select_shard(iter_gd_files(input_dir), input_dir, index, 2))) for index in range(2)]
+    assert all(shard_sizes)
+    for index in (0, 1):
+        run(cohort, tmpdir, manifest_path=manifest_path, shard=(index, 2))
+        assert run_counts(capsys) == (0, shard_sizes[index], 0)
+    # Each shard still finds all of its stored results
+    for index in (0, 1):
+        run(cohort, tmpdir, manifest_path=manifest_path, shard=(index, 2))
+        assert run_counts(capsys) == (shard_sizes[index], 0, 0)
+
+
+def test_prune_is_limited_to_the_scanned_scope(cohort, tmpdir, capsys):
+    plasmid_dir, input_dir = cohort
+    copy_dir = os.path.join(str(tmpdir.join("input")), "")
+    shutil.copytree(input_dir, copy_dir)
+    gd_names = sorted(os.listdir(copy_dir))
+    # Give one file a different extension, so a narrower pattern leaves it out
+    os.rename(copy_dir + gd_names[0], copy_dir + gd_names[0] + ".txt")
+    manifest_path = str(tmpdir.join("manifest.db"))
+    copy = (plasmid_dir, copy_dir)
+    run(copy, tmpdir, manifest_path=manifest_path, pattern="*")
+    assert run_counts(capsys) == (0, 12, 0)
+    # The .txt file was not scanned, so it is not removed
+    run(copy, tmpdir, manifest_path=manifest_path)
+    assert run_counts(capsys) == (11, 0, 0)
+    # Neither are the rows of another input directory sharing the manifest
+    run(cohort, tmpdir, manifest_path=manifest_path)
+    assert run_counts(capsys) == (0, 12, 0)
+    run(copy, tmpdir, manifest_path=manifest_path, pattern="*")
+    assert run_counts(capsys) == (12, 0, 0)
+    # A file deleted from the scanned scope is still removed
+    os.remove(copy_dir + gd_names[1])
+    expected = run(copy, tmpdir, pattern="*")
+    assert run(copy, tmpdir, manifest_path=manifest_path, pattern="*") == expected
+    assert run_counts(capsys) == (11, 0, 1)
+    run(cohort, tmpdir, manifest_path=manifest_path)
+    assert run_counts(capsys) == (12, 0, 0)
@@ -0,0 +1,81 @@
+"""Tests for gd_batch.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import csv
+import gzip
+import os
+
+import numpy
+import pytest
+
+import gd_batch
+
+
+def entry(cohort, tmpdir, **fields):
+    plasmid_dir, input_dir = cohort
+    result = {"name": "test", "input_dir": input_dir, "plasmid_dir": plasmid_dir, "output_dir": str(tmpdir.join("out")),
+              "categorization": "all"}
+    result.update(fields)
+    return result
+
+
+@pytest.mark.parametrize("fields", [{"workers": 2}, {"vectorized": "yes"}, {"manifest_path": "manifest.db"},
+                                    {"bin_width": 50}, {"rows": "rows.tsv"}])
+def test_all_rejects_unsupported_options(cohort, tmpdir, fields):
+    with pytest.raises(ValueError) as error:
+        gd_batch.parse_cohort(entry(cohort, tmpdir, **fields), str(tmpdir), "compiled")
+    assert fields.keys()[0] in str(error.value)
+
+
+def test_all_cohort_runs(cohort, tmpdir):
+    parsed = gd_batch.parse_cohort(entry(cohort, tmpdir, workers=1, mapped=True), str(tmpdir), "scan")
+    results = gd_batch.BatchRunner().run([parsed])
+    assert results[0]["status"] == "ok", results[0]["error"]
+    for prefix in ("cds_type_", "cds_", "label_"):
+        assert os.path.exists(os.path.join(parsed["output_dir"], prefix + "output.csv"))
+
+
+def test_skip_evidence_is_passed_through(cohort, tmpdir):
+    cohorts = [gd_batch.parse_cohort(entry(cohort, tmpdir, categorization="label", output_dir=str(tmpdir.join(name)),
+                                           skip_evidence=skip_evidence, npz="yes"), str(tmpdir), "compiled")
+               for name, skip_evidence in (("with", "no"), ("without", "yes"))]
+    assert [parsed["skip_evidence"] for parsed in cohorts] == [False, True]
+    for result in gd_batch.BatchRunner().run(cohorts):
+        assert result["status"] == "ok", result["error"]
+    # The CSV reports only have MOB/INS/DEL/SNP columns; the totals include the evidence lines
+    totals = [numpy.load(os.path.join(parsed["output_dir"], "output.npz"))["category_total"][0] for parsed in cohorts]
+    assert totals[0] > totals[1]
+
+
+@pytest.mark.parametrize("fields", [{"workers": 2}, {"manifest_path": "manifest.db"}])
+def test_rows_need_a_serial_cohort(cohort, tmpdir, fields):
+    with pytest.raises(ValueError) as error:
+        gd_batch.parse_cohort(entry(cohort, tmpdir, categorization="cds", rows="rows.tsv", **fields), str(tmpdir),
+                              "compiled")
+    assert "rows" in str(error.value)
+
+
+def test_rows_are_written(cohort, tmpdir):
+    parsed = gd_batch.parse_cohort(entry(cohort, tmpdir, categorization="cds", rows="rows.csv.gz", npz="yes"),
+                                   str(tmpdir), "compiled")
+    assert parsed["rows"] == str(tmpdir.join("rows.csv.gz"))
+    results = gd_batch.BatchRunner().run([parsed])
+    assert results[0]["status"] == "ok", results[0]["error"]
+    with gzip.open(parsed["rows"], "rb") as handle:
+        rows = list(csv.reader(handle))
+    total = numpy.load(os.path.join(parsed["output_dir"], "output.npz"))["category_total"].sum()
+    assert rows[0][0] == "sample" and len(rows) - 1 == total
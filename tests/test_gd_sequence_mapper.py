@@ -0,0 +1,56 @@
+"""Tests for gd_sequence_mapper.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+import shutil
+import threading
+
+import pytest
+
+import gd_sequence_mapper
+from CategoryConfig import default_category_config
+from conftest import canonical
+
+
+def parse_cds(cohort, tmpdir, categorization_number=2, **options):
+    plasmid_dir, input_dir = cohort
+    cat_map = gd_sequence_mapper.new_category_map(categorization_number)
+    return canonical(gd_sequence_mapper.parse_files_cds(cat_map, categorization_number, input_dir, str(tmpdir),
+                                                        plasmid_dir, **options))
+
+
+def test_cds_type_categorization_is_keyed_by_cds_id(cohort, tmpdir):
+    # As in the original tool, categorization 1 fills one map per CDS id, exactly like categorization 2
+    by_type = parse_cds(cohort, tmpdir, 1)
+    assert sorted(by_type) == sorted(default_category_config.cds_labels)
+    assert by_type == parse_cds(cohort, tmpdir, 2)
+
+
+def test_pipelined_failure_stops_the_readers(cohort, tmpdir):
+    plasmid_dir, input_dir = cohort
+    broken_dir = tmpdir.mkdir("broken")
+    for name in sorted(os.listdir(input_dir)):
+        shutil.copy(os.path.join(input_dir, name), str(broken_dir))
+    # The position is not a number, so the reader fails on the header peek
+    broken_dir.join("sample000001b.gd").write("#=GENOME_DIFF\t1.0\nSNP\t1\t.\tpsyn1\tseventy\tA\n")
+    threads_before = threading.active_count()
+    for mapped in (False, True):
+        with pytest.raises(ValueError):
+            gd_sequence_mapper.parse_files_cds(gd_sequence_mapper.new_category_map(2), 2, str(broken_dir) + os.sep,
+                                               str(tmpdir), plasmid_dir, prefetch_readers=3, queue_depth=2,
+                                               mapped=mapped)
+        assert threading.active_count() == threads_before
@@ -0,0 +1,88 @@
+"""Tests for the map and reduce commands of gd_shard.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+import sys
+
+import pytest
+
+import gd_sequence_mapper
+import gd_shard
+from conftest import canonical
+from PartialMap import PartialFormatError, iter_partial
+
+SHARD_COUNT = 3
+
+
+def run_command(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["gd_shard.py"] + list(argv))
+    assert gd_shard.main() == 0
+
+
+def serial(cohort, tmpdir, categorization_number):
+    plasmid_dir, input_dir = cohort
+    cat_map = gd_sequence_mapper.new_category_map(categorization_number)
+    if categorization_number == 3:
+        return gd_sequence_mapper.parse_file_labels(cat_map, input_dir, str(tmpdir), plasmid_dir)
+    return gd_sequence_mapper.parse_files_cds(cat_map, categorization_number, input_dir, str(tmpdir), plasmid_dir)
+
+
+def map_shards(monkeypatch, cohort, tmpdir, categorization_number):
+    plasmid_dir, input_dir = cohort
+    partial_paths = []
+    for index in xrange(SHARD_COUNT):
+        partial_path = str(tmpdir.join("shard" + str(index) + ".gdpm"))
+        run_command(monkeypatch, "map", input_dir, plasmid_dir, partial_path,
+                    "--categorization", str(categorization_number), "--shard", str(index) + "/" + str(SHARD_COUNT))
+        partial_paths.append(partial_path)
+    return partial_paths
+
+
+@pytest.mark.parametrize("categorization_number", [2, 3])
+def test_map_reduce_matches_serial(monkeypatch, cohort, tmpdir, categorization_number):
+    expected = serial(cohort, tmpdir.mkdir("serial"), categorization_number)
+    partial_paths = map_shards(monkeypatch, cohort, tmpdir, categorization_number)
+    # Every shard parsed some of the files, and together they parsed each file once
+    shard_totals = [sum([mutation_map.get_count() for category, mutation_map in iter_partial(path)])
+                    for path in partial_paths]
+    assert all(shard_totals)
+    assert sum(shard_totals) == sum([mutation_map.get_count() for mutation_map in expected.values()])
+
+    reduced_number, reduced = gd_shard.reduce_partials(partial_paths)
+    assert reduced_number == categorization_number
+    # reduce only keeps the categories some shard counted
+    counted = dict([(category, expected[category]) for category in expected if expected[category].get_count()])
+    assert canonical(reduced) == canonical(counted)
+
+    reduced_dir = str(tmpdir.join("reduced"))
+    run_command(monkeypatch, "reduce", reduced_dir, *partial_paths)
+    serial_dir = str(tmpdir.mkdir("serial_reports"))
+    gd_sequence_mapper.write_reports(counted, serial_dir + os.sep)
+    assert report_lines(reduced_dir) == report_lines(serial_dir)
+
+
+"""report_lines(): the lines of every report in directory, ignoring the category order (which numbers the files)."""
+def report_lines(directory):
+    return sorted([sorted(open(os.path.join(directory, name)).read().splitlines())
+                   for name in os.listdir(directory)])
+
+
+def test_reduce_rejects_mixed_categorizations(monkeypatch, cohort, tmpdir):
+    partial_paths = map_shards(monkeypatch, cohort, tmpdir.mkdir("cds"), 2)[:1]
+    partial_paths += map_shards(monkeypatch, cohort, tmpdir.mkdir("labels"), 3)[:1]
+    with pytest.raises(PartialFormatError):
+        gd_shard.reduce_partials(partial_paths)
@@ -0,0 +1,119 @@
+"""Tests for WatchService, driven through update() without a directory watcher.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+import shutil
+
+import pytest
+
+import gd_sequence_mapper
+from gd_watch import WatchService
+from ReferenceCache import ReferenceCache
+
+
+@pytest.fixture
+def watched(cohort, tmpdir):
+    """Return (service, input_dir, plasmid_dir) for a copy of the first half of the cohort, already scanned."""
+    plasmid_dir, cohort_dir = cohort
+    input_dir = str(tmpdir.mkdir("input")) + os.sep
+    for name in sorted(os.listdir(cohort_dir))[:6]:
+        shutil.copy(os.path.join(cohort_dir, name), input_dir)
+    service = WatchService(input_dir, 3, ReferenceCache(plasmid_dir))
+    assert service.update() == 6
+    return service, input_dir, plasmid_dir
+
+
+def fresh_counts(input_dir, plasmid_dir, output_dir):
+    cat_map = gd_sequence_mapper.parse_file_labels(gd_sequence_mapper.new_category_map(3), input_dir, output_dir,
+                                                   plasmid_dir)
+    mutation_map = cat_map["all"]
+    return {"all": {"total": mutation_map.get_count(), "types": mutation_map.type_map,
+                    "features": mutation_map.feat_type_map, "labels": mutation_map.label_type_map}}
+
+
+def check_published(service, input_dir, plasmid_dir, tmpdir, files):
+    assert service.get_counts() == fresh_counts(input_dir, plasmid_dir, str(tmpdir))
+    status = service.get_status()
+    assert status["files"] == files
+    assert status["mutations"] == service.get_counts()["all"]["total"]
+
+
+def test_created_modified_and_removed_files(cohort, watched, tmpdir):
+    service, input_dir, plasmid_dir = watched
+    check_published(service, input_dir, plasmid_dir, tmpdir, 6)
+    version = service.get_status()["version"]
+
+    created = [os.path.join(cohort[1], name) for name in sorted(os.listdir(cohort[1]))[6:9]]
+    for gd_path in created:
+        shutil.copy(gd_path, input_dir)
+    assert service.update([input_dir + os.path.basename(gd_path) for gd_path in created]) == 3
+    check_published(service, input_dir, plasmid_dir, tmpdir, 9)
+
+    modified_path = input_dir + sorted(os.listdir(input_dir))[0]
+    with open(modified_path, "r") as handle:
+        lines = handle.readlines()
+    with open(modified_path, "w") as handle:
+        handle.writelines(lines[:len(lines) // 2])
+    assert service.update([modified_path]) == 1
+    check_published(service, input_dir, plasmid_dir, tmpdir, 9)
+
+    removed_path = input_dir + sorted(os.listdir(input_dir))[-1]
+    os.remove(removed_path)
+    assert service.update([removed_path]) == 1
+    check_published(service, input_dir, plasmid_dir, tmpdir, 8)
+    assert service.get_status()["version"] == version + 3
+
+    # Nothing changed: no update is published
+    assert service.update() == 0
+    assert service.update([removed_path]) == 0
+    assert service.get_status()["version"] == version + 3
+
+
+def test_full_scan_finds_every_change(cohort, watched, tmpdir):
+    service, input_dir, plasmid_dir = watched
+    names = sorted(os.listdir(input_dir))
+    os.remove(input_dir + names[0])
+    with open(input_dir + names[1], "a") as handle:
+        handle.write("SNP\t999\t.\tpsyn0\t17\tA\n")
+    shutil.copy(os.path.join(cohort[1], sorted(os.listdir(cohort[1]))[-1]), input_dir)
+    assert service.update() == 3
+    check_published(service, input_dir, plasmid_dir, tmpdir, 6)
+
+
+def test_unparsable_file_is_retried(watched, tmpdir):
+    service, input_dir, plasmid_dir = watched
+    counts = service.get_counts()
+    broken_path = input_dir + "sample_broken.gd"
+    with open(broken_path, "w") as handle:
+        handle.write("#=GENOME_DIFF\t1.0\nSNP\t1\t.\tpsyn0\tseventeen\tA\n")
+    assert service.update([broken_path]) == 0
+    assert service.get_counts() == counts
+    # Once the file is complete it is counted
+    with open(broken_path, "w") as handle:
+        handle.write("#=GENOME_DIFF\t1.0\nSNP\t1\t.\tpsyn0\t17\tA\n")
+    assert service.update([broken_path]) == 1
+    check_published(service, input_dir, plasmid_dir, tmpdir, 7)
+
+
+def test_snapshot_follows_updates(watched):
+    service, input_dir, plasmid_dir = watched
+    snapshot = service.get_snapshot()
+    assert sorted(snapshot) == ["output.csv", "output1.csv"]
+    assert service.get_snapshot() is snapshot
+    os.remove(input_dir + sorted(os.listdir(input_dir))[0])
+    service.update()
+    assert service.get_snapshot()["output.csv"] != snapshot["output.csv"]
@@ -0,0 +1,117 @@
+"""Parity tests: every reference loader and every parse mode has to produce the results of the serial run.
+
+This file is part of gdparse.
+
+    gdparse is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    gdparse is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gdparse.  If not, see <http://www.gnu.org/licenses/>."""
+
+import os
+
+import pytest
+
+import gd_sequence_mapper
+from conftest import canonical
+from GenomeDiffSequenceMap import GenomeDiffSequenceMap
+from ReferenceCache import REFERENCE_LOADERS
+
+REFERENCE_SOURCES = sorted(REFERENCE_LOADERS)
+
+# Keyword arguments of parse_files_cds/parse_file_labels for each mode; serial is the one the others are checked against
+MODES = [
+    ("serial", {}),
+    ("vectorized", {"vectorized": True}),
+    ("workers", {"workers": 2}),
+    ("workers_vectorized", {"workers": 2, "vectorized": True}),
+    ("prefetch", {"prefetch_readers": 3, "queue_depth": 2}),
+    ("mapped", {"mapped": True}),
+    ("prefetch_mapped", {"prefetch_readers": 3, "queue_depth": 2, "mapped": True}),
+    ("incremental", {"manifest_path": "manifest.db"}),
+]
+
+
+def parse(cohort, tmpdir, categorization_number, **options):
+    plasmid_dir, input_dir = cohort
+    if "manifest_path" in options:
+        options["manifest_path"] = str(tmpdir.join(options["manifest_path"]))
+    cat_map = gd_sequence_mapper.new_category_map(categorization_number)
+    if categorization_number == 3:
+        result = gd_sequence_mapper.parse_file_labels(cat_map, input_dir, str(tmpdir), plasmid_dir, **options)
+    else:
+        result = gd_sequence_mapper.parse_files_cds(cat_map, categorization_number, input_dir, str(tmpdir),
+                                                    plasmid_dir, **options)
+    return canonical(result)
+
+
+"""feature_fields(): what the mapper reads from a reference feature, for Biopython and compiled features alike."""
+def feature_fields(feature):
+    label = feature.qualifiers.get("label")
+    if isinstance(label, list):
+        label = label[0]
+    spans = [(int(part.start), int(part.end)) for part in feature.location.parts]
+    return feature.type, label, feature.strand, spans
+
+
+def reference_names(plasmid_dir):
+    return sorted(name[:-len(".gb")] for name in os.listdir(plasmid_dir) if name.endswith(".gb"))
+
+
+@pytest.mark.parametrize("source", [source for source in REFERENCE_SOURCES if source != "genbank"])
+def test_loaders_return_the_genbank_features(cohort, source):
+    plasmid_dir = cohort[0]
+    for name in reference_names(plasmid_dir):
+        expected = REFERENCE_LOADERS["genbank"](plasmid_dir, name)
+        reference = REFERENCE_LOADERS[source](plasmid_dir, name)
+        assert map(feature_fields, reference.top_strand_features) == map(feature_fields, expected.top_strand_features)
+
+
+@pytest.mark.parametrize("source", REFERENCE_SOURCES)
+@pytest.mark.parametrize("categorization_number", [2, 3])
+def test_loaders_give_the_same_counts(cohort, tmpdir, categorization_number, source):
+    expected = parse(cohort, tmpdir.mkdir("expected"), categorization_number, reference_source="genbank")
+    assert parse(cohort, tmpdir, categorization_number, reference_source=source) == expected
+
+
+@pytest.mark.parametrize("mode, options", MODES, ids=[mode for mode, options in MODES])
+@pytest.mark.parametrize("categorization_number", [1, 2, 3])
+def test_modes_give_the_serial_counts(cohort, tmpdir, categorization_number, mode, options):
+    expected = parse(cohort, tmpdir.mkdir("expected"), categorization_number)
+    assert sum(counts["total"] for counts in expected.values())
+    assert parse(cohort, tmpdir, categorization_number, **options) == expected
+
+
+@pytest.mark.parametrize("mapped", [False, True])
+def test_single_pass_gives_the_serial_counts(cohort, tmpdir, mapped):
+    plasmid_dir, input_dir = cohort
+    cat_maps = dict([(number, gd_sequence_mapper.new_category_map(number)) for number in (1, 2, 3)])
+    gd_sequence_mapper.parse_files_all(cat_maps, input_dir, str(tmpdir), plasmid_dir, mapped=mapped)
+    for number in (1, 2, 3):
+        assert canonical(cat_maps[number]) == parse(cohort, tmpdir.mkdir("serial" + str(number)), number)
+
+
+def test_single_pass_counts_shared_plans_once(monkeypatch, cohort, tmpdir):
+    plasmid_dir, input_dir = cohort
+    calls = []
+    add_mutation = GenomeDiffSequenceMap.add_mutation
+
+    def counting_add_mutation(self, *args):
+        calls.append(args)
+        return add_mutation(self, *args)
+
+    monkeypatch.setattr(GenomeDiffSequenceMap, "add_mutation", counting_add_mutation)
+    cat_maps = dict([(number, gd_sequence_mapper.new_category_map(number)) for number in (1, 2, 3)])
+    gd_sequence_mapper.parse_files_all(cat_maps, input_dir, str(tmpdir), plasmid_dir)
+    totals = dict([(number, sum([mutation_map.get_count() for mutation_map in cat_maps[number].values()]))
+                   for number in cat_maps])
+    assert totals[1] == totals[2]
+    # Categorizations 1 and 2 share their plan, so each mutation is looked up and counted once for both
+    assert len(calls) == totals[1] + totals[3]